@@ -1,3 +1,102 @@
+import json
+from datetime import date
+from unittest import mock
+
+import httpx
 from django.test import TestCase
 
-# Create your tests here.
+from Meter.models import Meter, Usage
+from . import views
+from .models import ContactEnergyMeter, ContactEnergySession
+
+
+def upstream(handler):
+    """
+    Answer the requests to Contact Energy by handler, without waiting for the rate
+    limit.
+
+    :param handler: Called with each httpx.Request, returns httpx.Response.
+    """
+    return mock.patch.multiple(views, UPSTREAM_TRANSPORT=httpx.MockTransport(handler),
+                               RATE_LIMIT_WAIT_RANGE=(0, 0))
+
+
+class LoginTest(TestCase):
+    def test_login(self):
+        def handler(request):
+            if request.url.path == '/login/v2':
+                self.assertEqual(json.loads(request.content),
+                                 {'username': 'a@example.com', 'password': 'secret'})
+                return httpx.Response(200, json={'token': 'token'})
+            self.assertEqual(request.url.path, '/accounts/v2')
+            self.assertEqual(request.headers['session'], 'token')
+            return httpx.Response(200, json={'xcsrfToken': 'csrf', 'accountsSummary': [
+                {'id': '500', 'contracts': [{'contractId': '900'},
+                                            {'contractId': '901'}]},
+                {'contracts': [{'contractId': '902'}]},
+            ]})
+
+        with upstream(handler):
+            response = self.client.post('/get_data_contact/auth', {
+                'username': 'a@example.com', 'password': 'secret'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(ContactEnergySession.objects.values_list(
+            'meter__account_number', 'meter__contract_id', 'auth', 'csrf_token')), [
+            ('500', '900', 'token', 'csrf'), ('500', '901', 'token', 'csrf')])
+
+    def test_failed(self):
+        with upstream(lambda request: httpx.Response(401)):
+            response = self.client.post('/get_data_contact/auth', {
+                'username': 'a@example.com', 'password': 'wrong'})
+        self.assertContains(response, '[401] Unauthorized')
+        self.assertFalse(ContactEnergySession.objects.exists())
+
+
+class UsageTest(TestCase):
+    """
+    Fetching 1 and 2 February 2025, where the usage of 2 February is empty.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.meter = ContactEnergyMeter.objects.create(account_number="500",
+                                                      contract_id="900")
+        cls.session = ContactEnergySession.objects.create(
+            meter=cls.meter, auth='token', csrf_token='csrf', uuid='uuid')
+        with open('ContactEnergy/usage.json') as f:
+            cls.usage = json.load(f)
+        cls.data = {'account_and_contract': cls.meter.id, 'start_date': '2025-02-01',
+                    'end_date': '2025-02-02'}
+
+    def handler(self, request):
+        self.assertEqual(request.url.path, '/usage/v2/900')
+        self.assertEqual(request.url.params['ba'], '500')
+        self.assertEqual(request.headers['Authorization'], 'token')
+        self.assertEqual(request.headers['X-Csrf-Token'], 'csrf')
+        day = date.fromisoformat(request.url.params['from'][:10])
+        return httpx.Response(200, json=self.usage if day.day == 1 else [])
+
+    def test_usage(self):
+        with upstream(self.handler):
+            response = self.client.post('/get_data_contact/usage', self.data)
+        self.assertContains(response, "The usage on 2025-02-02 00:00:00 is empty.",
+                            status_code=500)
+        session = ContactEnergySession.objects.get(id=self.session.id)
+        self.assertEqual((session.total_dates, session.finished_dates,
+                          session.failed_dates), (2, 1, 1))
+        meter = Meter.objects.get(meter_id=self.meter.id)
+        self.assertEqual(sorted(Usage.objects.filter(meter=meter).values_list(
+            'value', flat=True)), sorted(float(row['value']) for row in self.usage))
+
+        # Only the missing date is fetched again.
+        requested = []
+        with upstream(lambda request: requested.append(request) or self.handler(request)):
+            self.client.post('/get_data_contact/usage', self.data)
+        self.assertEqual([request.url.params['from'] for request in requested],
+                         ['2025-02-02 00:00:00'])
+
+    def test_failed(self):
+        with upstream(lambda request: httpx.Response(503)):
+            response = self.client.post('/get_data_contact/usage', self.data)
+        self.assertContains(response, "Status code: 503. Reason: Service Unavailable",
+                            status_code=500)
+        self.assertFalse(Usage.objects.exists())
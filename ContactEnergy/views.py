@@ -1,3 +1,5 @@
+import asyncio
+import functools
 import json
 import os
 import sqlite3
@@ -6,34 +8,85 @@ import uuid
 from datetime import datetime, timedelta, date
 from random import uniform
 
+import httpx
 import pandas as pd
 import pytz
+from asgiref.sync import sync_to_async
 from django import forms
 from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ValidationError
 from django.core.files.base import ContentFile
 from django.core.files.storage import default_storage
-from django.db import transaction, OperationalError, ProgrammingError
+from django.db import OperationalError, ProgrammingError
 from django.db.models.functions import TruncDate
 from django.http import HttpResponse, JsonResponse
 from django.shortcuts import render
-from django.views.decorators.http import require_POST
-from requests import Session
+from django.views.decorators.http import require_POST, require_http_methods
 
 from Meter.models import Meter, Usage
+from Meter.signals import usage_changed
+from NewZealandElectricity.conditional import (not_modified, page_validators,
+                                               request_data, set_validators)
+from NewZealandElectricity.db import write_transaction
+from NewZealandElectricity.metrics import (DAYS_FAILED, DAYS_FETCHED, RATE_LIMIT_WAIT,
+                                           UPSTREAM_REQUEST_DURATION, USAGE_ROWS_WRITTEN)
+from NewZealandElectricity.profiling import stage
 from NewZealandElectricity.settings import TIME_ZONE
 from .models import *
 
-with open("ContactEnergy/header_login.json") as f:
-    header_login = json.load(f)
-with open("ContactEnergy/header_csrf_token.json") as f:
-    # x-api-key is defined by
-    # https://myaccount.contact.co.nz/main.2049c28d6664d8a2ecc3.esm.js
-    header_csrf_token = json.load(f)
-with open("ContactEnergy/header_usage.json") as f:
-    header_usage = json.load(f)
-sess = Session()
-sess.trust_env = False
+
+@functools.cache
+def _read_header(name):
+    with open(f"ContactEnergy/{name}.json") as f:
+        return json.load(f)
+
+
+def load_header(name) -> dict:
+    """
+    Request headers in ContactEnergy/<name>.json, read on first use rather than when
+    this module is imported. x-api-key of header_csrf_token is defined by
+    https://myaccount.contact.co.nz/main.2049c28d6664d8a2ecc3.esm.js
+
+    :return: A copy, which the caller may change.
+    """
+    return dict(_read_header(name))
+
+
+# Of each request to the Contact Energy API. Unit: second
+UPSTREAM_TIMEOUT = 30
+# Transport of the clients, e.g. httpx.MockTransport in tests. None connects to
+# Contact Energy.
+UPSTREAM_TRANSPORT = None
+# Wait after each request of the usage, a random time in this range. Unit: second
+RATE_LIMIT_WAIT_RANGE = (0.7, 1.3)
+
+
+def upstream_client() -> httpx.AsyncClient:
+    """
+    A client is bound to the event loop it's used in, so each view opens its own.
+    """
+    return httpx.AsyncClient(trust_env=False, timeout=UPSTREAM_TIMEOUT,
+                             transport=UPSTREAM_TRANSPORT)
+
+
+async def upstream(client, endpoint, method, **kwargs):
+    """
+    Send a request to the Contact Energy API, and observe its time in
+    UPSTREAM_REQUEST_DURATION.
+
+    :param client: httpx.AsyncClient from upstream_client.
+    :param endpoint: Label of the API, like "usage".
+    :param kwargs: Passed to AsyncClient.request.
+    """
+    start_time = time.perf_counter()
+    status = 'error'
+    try:
+        response = await client.request(method, **kwargs)
+        status = response.status_code
+        return response
+    finally:
+        UPSTREAM_REQUEST_DURATION.observe(time.perf_counter() - start_time,
+                                          endpoint=endpoint, status=status)
 
 
 class ContactEnergyLogin(forms.Form):
@@ -100,58 +153,63 @@ def contact_energy_login(req, failed_reason=None):
     })
 
 @require_POST
-def contact_energy_auth(req):
+async def contact_energy_auth(req):
+    """
+    Async, so an ASGI server waits for Contact Energy without holding a thread per
+    login. The ORM is used by its async methods, or by sync_to_async for forms.
+    """
     login_form = ContactEnergyLogin(req.POST)
     if not login_form.is_valid():
-        return contact_energy_login(req, failed_reason=login_form.errors.as_text())
+        return await sync_to_async(contact_energy_login)(
+            req, failed_reason=login_form.errors.as_text())
     username = login_form.cleaned_data.get('username')
     password = login_form.cleaned_data.get('password')
-    # Log in, get authentication (session).
-    resp_login = sess.post(
-        url="https://api.contact-digital-prod.net/login/v2",
-        data=json.dumps({"password": password, "username": username}),
-        headers=header_login,
-    )
-    if resp_login.status_code != 200:
-        return contact_energy_login(
-            req, failed_reason=f"[{resp_login.status_code}] {resp_login.reason}")
-    auth = resp_login.json().get('token')
-    if not auth:
-        return contact_energy_login(
-            req, failed_reason=f"[{resp_login.status_code}] {resp_login.reason}")
-
-    # Get CSRF key and contract ID.
-    header_csrf_token["session"] = auth
-    resp_csrf_token = sess.get(
-        url="https://api.contact-digital-prod.net/accounts/v2?ba=",
-        headers=header_csrf_token,
-    )
-    if resp_csrf_token.status_code != 200:
-        return contact_energy_login(
-            req, failed_reason=f"[{resp_csrf_token.status_code}] Fail to get CSRF key, "
-                               f"account number, and contract number. "
-                               f"{resp_csrf_token.reason}"
+    async with upstream_client() as client:
+        # Log in, get authentication (session).
+        resp_login = await upstream(
+            client, 'login', 'POST', url="https://api.contact-digital-prod.net/login/v2",
+            content=json.dumps({"password": password, "username": username}),
+            headers=load_header('header_login'),
         )
+        if resp_login.status_code != 200:
+            return await sync_to_async(contact_energy_login)(
+                req,
+                failed_reason=f"[{resp_login.status_code}] {resp_login.reason_phrase}")
+        auth = resp_login.json().get('token')
+        if not auth:
+            return await sync_to_async(contact_energy_login)(
+                req,
+                failed_reason=f"[{resp_login.status_code}] {resp_login.reason_phrase}")
+
+        # Get CSRF key and contract ID.
+        header_csrf_token = load_header('header_csrf_token')
+        header_csrf_token["session"] = auth
+        resp_csrf_token = await upstream(
+            client, 'accounts', 'GET',
+            url="https://api.contact-digital-prod.net/accounts/v2?ba=",
+            headers=header_csrf_token,
+        )
+    failed_reason = (f"[{resp_csrf_token.status_code}] Fail to get CSRF key, account "
+                     f"number, and contract number. {resp_csrf_token.reason_phrase}")
+    if resp_csrf_token.status_code != 200:
+        return await sync_to_async(contact_energy_login)(req, failed_reason=failed_reason)
     resp_csrf_token = resp_csrf_token.json()
     csrf_token = resp_csrf_token.get('xcsrfToken')
     if not csrf_token:
-        return contact_energy_login(
-            req, failed_reason=f"[{resp_csrf_token.status_code}] Fail to get CSRF key, "
-                               f"account number, and contract number. "
-                               f"{resp_csrf_token.reason}"
-        )
+        return await sync_to_async(contact_energy_login)(req, failed_reason=failed_reason)
     uuid_ = str(uuid.uuid4())
     for account in resp_csrf_token.get('accountsSummary', []):
         # item exists only when 'id' in keys
         if not account.get('id'):
             continue
         for contract in account.get('contracts', []):
-            meter, created = ContactEnergyMeter.objects.get_or_create(
+            meter, created = await ContactEnergyMeter.objects.aget_or_create(
                 account_number=account['id'], contract_id=contract['contractId'])
             sess_dbo = ContactEnergySession(
                 meter=meter, auth=auth, csrf_token=csrf_token, uuid=uuid_)
-            sess_dbo.save()
-    return contact_energy_account(req)
+            await sess_dbo.asave()
+    # The account form lists the meters.
+    return await sync_to_async(contact_energy_account)(req)
 
 
 def contact_energy_account(req, failed_reason=None):
@@ -162,9 +220,15 @@ def contact_energy_account(req, failed_reason=None):
 
 
 @require_POST
-def contact_energy_usage(req):
-    account_form = ContactEnergyAccount(req.POST)
-    if not account_form.is_valid():
+async def contact_energy_usage(req):
+    """
+    Async, so an ASGI server serves the progress of this fetch, and other fetches,
+    while it waits for Contact Energy and the rate limit. The usage is saved by
+    sync_to_async, since write_transaction is sync.
+    """
+    # The initial and the choices of the meter are queried.
+    account_form = await sync_to_async(ContactEnergyAccount)(req.POST)
+    if not await sync_to_async(account_form.is_valid)():
         return HttpResponse(account_form.errors.as_text(), status=500)
     account_and_contract = account_form.cleaned_data.get('account_and_contract')
     start_date = account_form.cleaned_data.get('start_date')
@@ -172,79 +236,111 @@ def contact_energy_usage(req):
     overwrite = account_form.cleaned_data.get('overwrite')
     if start_date > end_date:
         start_date, end_date = end_date, start_date
-    meter, created = Meter.objects.get_or_create(
-        provider=ContentType.objects.get_for_model(ContactEnergyMeter),
+    meter, created = await Meter.objects.aget_or_create(
+        provider=await sync_to_async(ContentType.objects.get_for_model)(
+            ContactEnergyMeter),
         meter_id=account_and_contract.id,
     )
-    if overwrite:
-        missing_dates = pd.date_range(start=start_date, end=end_date, freq='1d')
-    else:
-        missing_dates = get_missing_dates_in_usage(start_date, end_date, meter)
+    with stage('missing_dates') as missing_dates_stage:
+        if overwrite:
+            missing_dates = pd.date_range(start=start_date, end=end_date, freq='1d')
+        else:
+            missing_dates = await sync_to_async(get_missing_dates_in_usage)(
+                start_date, end_date, meter)
+        missing_dates_stage.count(len(missing_dates))
     expiry_time = datetime.now(tz=pytz.timezone(TIME_ZONE)) - timedelta(days=1)
-    ContactEnergySession.objects.filter(created_time__lte=expiry_time).delete()
-    sess_dbos = (ContactEnergySession.objects.filter(meter=account_and_contract)
-                 .order_by('-created_time'))
-    if not sess_dbos.exists():
+    await ContactEnergySession.objects.filter(created_time__lte=expiry_time).adelete()
+    sess_dbo = await (ContactEnergySession.objects.filter(meter=account_and_contract)
+                      .order_by('-created_time').afirst())
+    if sess_dbo is None:
         return HttpResponse(
             f"Please log in the Contact Energy account that has access to this "
             f"meter: {account_and_contract}. Current logged-in status expires or the "
             f"account doesn't match the meter.",
             status=500)
-    sess_dbo = sess_dbos[0]
     sess_dbo.total_dates = len(missing_dates)
     sess_dbo.finished_dates = 0
     sess_dbo.failed_dates = 0
-    sess_dbo.save()
+    await sess_dbo.asave()
     contract_id = account_and_contract.contract_id
     account_number = account_and_contract.account_number
     warnings = []
-    for date_ in missing_dates:
-        url_usage = (f"https://api.contact-digital-prod.net/usage/v2/{contract_id}?"
-                     f"ba={account_number}&interval=hourly&from={date_}&to={date_}")
-        header_usage_ins = header_usage.copy()
-        header_usage_ins['Authorization'] = sess_dbo.auth
-        header_usage_ins['X-Correlation-Id'] = sess_dbo.uuid
-        header_usage_ins['X-Csrf-Token'] = sess_dbo.csrf_token
-        response = sess.post(url=url_usage, headers=header_usage_ins)
-        time.sleep(round(uniform(0.7, 1.3), 2))
-        if response.status_code != 200:
-            return HttpResponse(f"Fail to get usage. Status code: {response.status_code}. "
-                                f"Reason: {response.reason}", status=500)
-        usage = response.json()
-        if len(usage) == 0:
-            warnings.append(f"The usage on {date_} is empty.")
-            sess_dbo.failed_dates = sess_dbo.failed_dates + 1
-            sess_dbo.save()
-            continue
-        try:
-            with transaction.atomic():
-                existed_usages = Usage.objects.filter(
-                    meter=meter, time_slot__day=date_.day,
-                    time_slot__month=date_.month, time_slot__year=date_.year,
-                )
-                existed_usages.delete()
-                for row in usage:
-                    date_time_ = pd.to_datetime(row['date'])
-                    try:
-                        amount = float(row['value'])
-                    except ValueError:
-                        warnings.append(f"Amount is not a number on {date_time_}.")
-                        amount = None
-                    new_usage = Usage(meter=meter, time_slot=date_time_, value=amount)
-                    new_usage.save()
+    async with upstream_client() as client:
+        for date_ in missing_dates:
+            url_usage = (f"https://api.contact-digital-prod.net/usage/v2/{contract_id}?"
+                         f"ba={account_number}&interval=hourly&from={date_}&to={date_}")
+            header_usage_ins = load_header('header_usage')
+            header_usage_ins['Authorization'] = sess_dbo.auth
+            header_usage_ins['X-Correlation-Id'] = sess_dbo.uuid
+            header_usage_ins['X-Csrf-Token'] = sess_dbo.csrf_token
+            with stage('upstream'):
+                response = await upstream(client, 'usage', 'POST', url=url_usage,
+                                          headers=header_usage_ins)
+            with stage('rate_limit'), RATE_LIMIT_WAIT.time():
+                await asyncio.sleep(round(uniform(*RATE_LIMIT_WAIT_RANGE), 2))
+            if response.status_code != 200:
+                DAYS_FAILED.inc(reason='status')
+                return HttpResponse(f"Fail to get usage. Status code: "
+                                    f"{response.status_code}. "
+                                    f"Reason: {response.reason_phrase}", status=500)
+            usage = response.json()
+            if len(usage) == 0:
+                warnings.append(f"The usage on {date_} is empty.")
+                DAYS_FAILED.inc(reason='empty')
+                sess_dbo.failed_dates = sess_dbo.failed_dates + 1
+                await sess_dbo.asave()
+                continue
+            try:
+                with stage('save') as save_stage:
+                    warnings += await sync_to_async(save_usage)(meter, date_, usage)
+                    save_stage.count(len(usage))
                 sess_dbo.finished_dates = sess_dbo.finished_dates + 1
-                sess_dbo.save()
-        except json.decoder.JSONDecodeError:
-            warnings.append(f"Fail to parse usage on {date_} from Contact Energy.")
-            sess_dbo.failed_dates = sess_dbo.failed_dates + 1
-            sess_dbo.save()
-            continue
+                await sess_dbo.asave()
+                DAYS_FETCHED.inc()
+            except json.decoder.JSONDecodeError:
+                warnings.append(f"Fail to parse usage on {date_} from Contact Energy.")
+                DAYS_FAILED.inc(reason='unparsable')
+                sess_dbo.failed_dates = sess_dbo.failed_dates + 1
+                await sess_dbo.asave()
+                continue
     if warnings:
         return HttpResponse(' '.join(warnings), status=500)
     else:
         return HttpResponse()
 
 
+def save_usage(meter, date_, usage) -> list:
+    """
+    Overwrite the usage of a meter on a local date with the usage from Contact Energy.
+
+    :param date_: pandas.Timestamp of the date.
+    :param usage: Rows of the usage API, each has 'date' and 'value'.
+    :return: Warnings of the values which are not numbers.
+    """
+    warnings = []
+    new_usages = []
+    for row in usage:
+        date_time_ = pd.to_datetime(row['date'])
+        try:
+            amount = float(row['value'])
+        except ValueError:
+            warnings.append(f"Amount is not a number on {date_time_}.")
+            amount = None
+        new_usages.append(Usage(meter=meter, time_slot=date_time_, value=amount))
+    # Parse before locking, so the write lock is held only for the statements.
+    with write_transaction(Usage):
+        existed_usages = Usage.objects.filter(
+            meter=meter, time_slot__day=date_.day,
+            time_slot__month=date_.month, time_slot__year=date_.year,
+        )
+        existed_usages.delete()
+        Usage.objects.bulk_create(new_usages)
+        USAGE_ROWS_WRITTEN.inc(len(new_usages))
+        usage_changed.send(sender=Usage, meter=meter, start_date=date_.date(),
+                           end_date=date_.date())
+    return warnings
+
+
 def get_missing_dates_in_usage(start_date, end_date, meter):
     start_date_midnight = (pd.to_datetime(start_date)
                            .tz_localize(tz=TIME_ZONE, ambiguous=False))
@@ -261,22 +357,30 @@ def get_missing_dates_in_usage(start_date, end_date, meter):
     return missing_dates
 
 
-@require_POST
-def contact_energy_progress(req):
-    account_form = ContactEnergyAccount(req.POST)
-    if not account_form.is_valid():
+@require_http_methods(['GET', 'POST'])
+async def contact_energy_progress(req):
+    """
+    Async, since it's polled every second during each fetch.
+    """
+    account_form = await sync_to_async(ContactEnergyAccount)(request_data(req))
+    if not await sync_to_async(account_form.is_valid)():
         raise Exception(account_form.errors.as_text())  # trigger 500 error
     account_and_contract = account_form.cleaned_data.get('account_and_contract')
-    sess_dbos = (ContactEnergySession.objects.filter(meter=account_and_contract)
-                 .order_by('-created_time'))
-    if not sess_dbos.exists():
+    sess_dbo = await (ContactEnergySession.objects.filter(meter=account_and_contract)
+                      .order_by('-created_time').afirst())
+    if sess_dbo is None:
         raise Exception("Session with Contact Energy is not created.")
-    sess_dbo = sess_dbos[0]
+    # Polled every second, while the counters change every day fetched.
+    validators = page_validators(req, [sess_dbo.id, sess_dbo.finished_dates,
+                                       sess_dbo.failed_dates, sess_dbo.total_dates])
+    if response := not_modified(req, validators):
+        return response
     if sess_dbo.total_dates == 0:
-        return JsonResponse({"success": 100, "failed": 0, "unhandled": 0})
+        response = JsonResponse({"success": 100, "failed": 0, "unhandled": 0})
     else:
         progress_success = round(sess_dbo.finished_dates / sess_dbo.total_dates * 100)
         progress_failed = round(sess_dbo.failed_dates / sess_dbo.total_dates * 100)
         progress_unhandled = 100 - progress_success - progress_failed
-        return JsonResponse({"success": progress_success, "failed": progress_failed,
-                             "unhandled": progress_unhandled})
+        response = JsonResponse({"success": progress_success, "failed": progress_failed,
+                                 "unhandled": progress_unhandled})
+    return set_validators(response, validators)
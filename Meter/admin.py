@@ -1,14 +1,21 @@
+from functools import reduce
+from operator import or_
+
 from django.contrib import admin
 from django.db.models import Q
 
 from .models import *
 
+# (app label, model) of the providers' meter models.
+METER_TYPES = [
+    ('ContactEnergy', 'contactenergymeter'),
+    # ('app2', 'model3'),
+]
+
 
 def get_meter_types():
-    return ContentType.objects.filter(
-        Q(app_label='ContactEnergy', model__in=['contactenergymeter'])
-        # | Q(app_label='app2', model__in=['model3', 'model4'])
-    )
+    return ContentType.objects.filter(reduce(or_, [
+        Q(app_label=app_label, model=model) for app_label, model in METER_TYPES]))
 
 
 # Register your models here.
@@ -20,12 +27,10 @@ class MeterAdmin(admin.ModelAdmin):
         return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
     list_display = ('provider', 'meter_id', 'get_content_object_name')
+    list_select_related = ['provider']
 
     def get_content_object_name(self, obj):
-        if obj.content_object:
-            return f"{obj.provider.app_label}, {obj.content_object}"
-        else:
-            return ''
+        return str(obj)
 
     get_content_object_name.short_description = "Object"
 
@@ -40,3 +45,31 @@ class UsageAdmin(admin.ModelAdmin):
     list_display = ['meter', 'time_slot', 'value']
     list_filter = ['meter', 'time_slot']
     search_fields = ['time_slot']
+
+    @staticmethod
+    def usage_changed(meter_ids):
+        from .signals import usage_changed  # It imports this module.
+        for meter in Meter.objects.filter(id__in=meter_ids):
+            usage_changed.send(sender=Usage, meter=meter)
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        meter_ids = {obj.meter_id}
+        if change and 'meter' in form.changed_data:
+            meter_ids.add(form.initial['meter'])
+        self.usage_changed(meter_ids)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        self.usage_changed([obj.meter_id])
+
+    def delete_queryset(self, request, queryset):
+        meter_ids = set(queryset.values_list('meter_id', flat=True))
+        super().delete_queryset(request, queryset)
+        self.usage_changed(meter_ids)
+
+
+@admin.register(MeterGroup)
+class MeterGroupAdmin(admin.ModelAdmin):
+    filter_horizontal = ['meters']
+    search_fields = ['name']
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class MeterConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Meter'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,153 @@
+"""
+Export the usage of a meter from a start date to an end date (both inclusive) as CSV or
+Parquet. The rows are read through a cursor and converted in chunks, so the memory
+doesn't grow with the range, and the first bytes are sent before the last rows are
+read.
+
+On SQLite, the time slots are read as text, since Django converting each of them to an
+aware datetime is slower than the rest of the export, and each chunk is converted at
+once by numpy. Other databases may not store them as UTC text, so they're read as
+datetimes. The usage of a MeterGroup is summed from chunks of its meters by
+iter_usage.
+"""
+import importlib.util
+import io
+import itertools
+from operator import itemgetter
+
+import numpy as np
+import pandas as pd
+from django.db import connections, router
+from django.db.models import CharField
+from django.db.models.functions import Cast
+
+from NewZealandElectricity.settings import TIME_ZONE
+from .models import MeterGroup, Usage
+from .usage import iter_usage, local_date_range
+
+# Rows in each chunk, which is also a row group of Parquet.
+EXPORT_CHUNK_SIZE = 50000
+CSV_HEADER = "time_slot,value\n"
+
+
+def usage_chunks(meter, start_date, end_date, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    :param meter: Meter or MeterGroup.
+    :return: Generator of (time_slot, value) of at most chunk_size rows of each meter,
+        where time_slot is datetime64[us] in UTC, and value is float64 in kWh, NaN if
+        the usage is empty. The empty usage of a group is left out, like load_usage.
+    """
+    if isinstance(meter, MeterGroup):
+        for time_slot, value in iter_usage(meter, start_date, end_date, chunk_size):
+            if time_slot.shape[0]:
+                yield (time_slot.tz_convert('UTC').tz_localize(None)
+                       .to_numpy('datetime64[us]'), value)
+        return
+    start_date_midnight, end_date_next_midnight = local_date_range(start_date, end_date)
+    as_text = connections[router.db_for_read(Usage)].vendor == 'sqlite'
+    rows = Usage.objects.filter(
+        meter=meter, time_slot__gte=start_date_midnight,
+        time_slot__lt=end_date_next_midnight,
+    ).order_by('time_slot').values_list(
+        Cast('time_slot', CharField()) if as_text else 'time_slot', 'value',
+    ).iterator(chunk_size=chunk_size)
+    while chunk := list(itertools.islice(rows, chunk_size)):
+        # Faster than zip(*chunk), which passes each row as an argument.
+        time_slot = list(map(itemgetter(0), chunk))
+        if as_text:
+            time_slot = np.array(time_slot, dtype='datetime64[us]')
+        else:
+            time_slot = (pd.DatetimeIndex(time_slot).tz_convert('UTC').tz_localize(None)
+                         .to_numpy('datetime64[us]'))
+        yield time_slot, np.array(list(map(itemgetter(1), chunk)), dtype=np.float64)
+
+
+def _offset_text(minutes) -> str:
+    sign = '+' if minutes >= 0 else '-'
+    return f"{sign}{abs(minutes) // 60:02d}:{abs(minutes) % 60:02d}"
+
+
+def csv_chunks(chunks):
+    """
+    :param chunks: From usage_chunks.
+    :return: Generator of bytes of CSV, the header first. The time slots are ISO 8601 in
+        TIME_ZONE with the UTC offset, and the empty usage is an empty field.
+    """
+    yield CSV_HEADER.encode()
+    for time_slot, value in chunks:
+        local = (pd.DatetimeIndex(time_slot).tz_localize('UTC').tz_convert(TIME_ZONE)
+                 .tz_localize(None).to_numpy('datetime64[us]'))
+        offset = (local - time_slot).astype('timedelta64[m]').astype(np.int64)
+        # There are one or two offsets in a chunk, so each is formatted once.
+        offsets, inverse = np.unique(offset, return_inverse=True)
+        suffix = np.array([_offset_text(int(m)) + ',' for m in offsets])[inverse]
+        prefix = np.char.add(np.datetime_as_string(local, unit='s'), suffix).tolist()
+        yield ''.join([f"{p}{'' if v != v else v}\n"
+                       for p, v in zip(prefix, value.tolist())]).encode()
+
+
+def parquet_available() -> bool:
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+class _Sink(io.RawIOBase):
+    """
+    A file for ParquetWriter, whose bytes are taken by drain after each row group.
+    """
+    def __init__(self):
+        super().__init__()
+        self.parts = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.parts.append(bytes(b))
+        self.position += len(b)
+        return len(b)
+
+    def tell(self):
+        return self.position
+
+    def drain(self) -> bytes:
+        data = b''.join(self.parts)
+        self.parts.clear()
+        return data
+
+
+def parquet_chunks(chunks):
+    """
+    Needs pyarrow. See parquet_available.
+
+    :param chunks: From usage_chunks.
+    :return: Generator of bytes of Parquet, with a row group for each chunk. time_slot
+        is a timestamp in TIME_ZONE, and the empty usage is null.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    time_slot_type = pa.timestamp('us', tz=TIME_ZONE)
+    schema = pa.schema([pa.field('time_slot', time_slot_type, nullable=False),
+                        pa.field('value', pa.float64())])
+    sink = _Sink()
+    with pq.ParquetWriter(sink, schema) as writer:
+        for time_slot, value in chunks:
+            writer.write_table(pa.table([
+                pa.array(time_slot.view(np.int64), type=time_slot_type),
+                pa.array(value, from_pandas=True),
+            ], schema=schema))
+            yield sink.drain()
+    yield sink.drain()
+
+
+# Name: (content type, file extension, function converting usage_chunks to bytes)
+FORMATS = {
+    'csv': ('text/csv', 'csv', csv_chunks),
+    'parquet': ('application/vnd.apache.parquet', 'parquet', parquet_chunks),
+}
+
+
+def export_filename(meter, start_date, end_date, file_format) -> str:
+    kind = 'group' if isinstance(meter, MeterGroup) else 'meter'
+    return f"usage_{kind}{meter.id}_{start_date}_{end_date}.{FORMATS[file_format][1]}"
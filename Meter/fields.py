@@ -0,0 +1,52 @@
+from django import forms
+
+from .labels import meter_group_labels, meter_labels
+from .models import Meter, MeterGroup
+
+
+def meter_choices():
+    return [
+        ("Meters", [(f"meter:{meter_id}", label.label)
+                    for meter_id, label in meter_labels().items()]),
+        ("Meter groups", [(f"group:{group_id}", name)
+                          for group_id, name in meter_group_labels().items()]),
+    ]
+
+
+def first_meter_choice() -> str:
+    """
+    :return: The value of the first meter in MeterOrGroupField, or '' if there are no
+        meters.
+    """
+    return next((f"meter:{meter_id}" for meter_id in meter_labels()), '')
+
+
+def meter_choice(meter) -> str:
+    """
+    :param meter: Meter, MeterGroup or None.
+    :return: The value of the meter in MeterOrGroupField.
+    """
+    if meter is None:
+        return ''
+    return f"{'group' if isinstance(meter, MeterGroup) else 'meter'}:{meter.id}"
+
+
+class MeterOrGroupField(forms.ChoiceField):
+    """
+    Choose a Meter or a MeterGroup. The cleaned value is the model instance.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('widget', forms.Select({"class": "form-select"}))
+        super().__init__(choices=meter_choices, **kwargs)
+
+    def clean(self, value):
+        value = super().clean(value)
+        if not value:
+            return None
+        kind, _, pk = value.partition(':')
+        model = MeterGroup if kind == 'group' else Meter
+        try:
+            return model.objects.get(id=int(pk))
+        except (ValueError, model.DoesNotExist):
+            raise forms.ValidationError("Select a valid meter or meter group.")
@@ -0,0 +1,133 @@
+"""
+An index of the labels of the meters and meter groups, and of the meter providers, so
+that a form listing every meter takes a constant number of queries.
+
+Meter.__str__ is "<provider app label>, <provider's meter>", which reads the content
+type and the provider's meter of each meter. The index reads them for all meters at
+once, and is kept in each process until Meter.signals invalidates it because a meter or
+a provider's meter, or a meter group, is saved or deleted. Meters and groups created or
+deleted by another process, e.g. a management command or another worker, are found by
+comparing their counts and largest ids, once in each request.
+"""
+import threading
+from contextvars import ContextVar
+from typing import NamedTuple
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import connections, router
+
+from .admin import get_meter_types
+from .models import Meter, MeterGroup
+
+
+class MeterLabel(NamedTuple):
+    provider_id: int
+    meter_id: int
+    label: str
+
+
+class _Index(NamedTuple):
+    meters: dict  # Meter id: MeterLabel, ordered by Meter id.
+    groups: dict  # MeterGroup id: name.
+    providers: dict  # ContentType id: ContentType, of get_meter_types.
+    signature: tuple  # From _signature, before the index was built.
+
+
+_index = None
+# Incremented by each invalidation, so an index built meanwhile is not kept.
+_generation = 0
+_lock = threading.Lock()
+# Whether the index was compared with the database in the current request.
+_checked = ContextVar('meter_index_checked', default=False)
+
+
+def _signature() -> tuple:
+    """
+    :return: The number and the largest id of the meters and of the meter groups, in
+        one query.
+    """
+    connection = connections[router.db_for_read(Meter)]
+    quote_name = connection.ops.quote_name
+    meter_table = quote_name(Meter._meta.db_table)
+    group_table = quote_name(MeterGroup._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT (SELECT COUNT(*) FROM {meter_table}), "
+                       f"(SELECT MAX(id) FROM {meter_table}), "
+                       f"(SELECT COUNT(*) FROM {group_table}), "
+                       f"(SELECT MAX(id) FROM {group_table})")
+        return tuple(cursor.fetchone())
+
+
+def _build(signature) -> _Index:
+    meters = (Meter.objects.select_related('provider').prefetch_related('content_object')
+              .order_by('id'))
+    return _Index(
+        meters={
+            meter.id: MeterLabel(meter.provider_id, meter.meter_id,
+                                 f"{meter.provider.app_label}, {meter.content_object}")
+            for meter in meters
+        },
+        groups=dict(MeterGroup.objects.values_list('id', 'name')),
+        providers={content_type.id: content_type for content_type in get_meter_types()},
+        signature=signature,
+    )
+
+
+def _get_index() -> _Index:
+    global _index
+    index = _index
+    generation = _generation
+    if index is None or not _checked.get():
+        signature = _signature()
+        _checked.set(True)
+        if index is None or index.signature != signature:
+            index = _build(signature)
+            with _lock:
+                if generation == _generation:
+                    _index = index
+    return index
+
+
+def check_meter_index():
+    """
+    Compare the index with the database when it's used next, e.g. in the next request.
+    """
+    _checked.set(False)
+
+
+def invalidate_meter_index():
+    global _index, _generation
+    with _lock:
+        _generation += 1
+        _index = None
+
+
+def meter_labels() -> dict:
+    """
+    :return: {Meter id: MeterLabel} of every meter, ordered by Meter id. Don't change it.
+    """
+    return _get_index().meters
+
+
+def meter_group_labels() -> dict:
+    """
+    :return: {MeterGroup id: name} of every meter group.
+    """
+    return _get_index().groups
+
+
+def meter_providers() -> dict:
+    """
+    :return: {ContentType id: ContentType} of the providers in get_meter_types.
+    """
+    return _get_index().providers
+
+
+def meter_label(meter) -> str:
+    label = meter_labels().get(meter.id)
+    if (label is None or label.provider_id != meter.provider_id
+            or label.meter_id != meter.meter_id):
+        # Not saved, or changed after the index was built.
+        return (f"{ContentType.objects.get_for_id(meter.provider_id).app_label}, "
+                f"{meter.content_object}")
+    return label.label
@@ -0,0 +1,120 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+SLOTS_PER_DAY = 48
+SQL_CREATE = ("CREATE TABLE usage (meter_id INTEGER, time_slot TEXT, value REAL, "
+              "UNIQUE (meter_id, time_slot))")
+SQL_INSERT = "INSERT INTO usage VALUES (?, ?, ?)"
+# Like the usage charts: daily usage of a meter in a range.
+SQL_READ = ("SELECT substr(time_slot, 1, 10), SUM(value) FROM usage "
+            "WHERE meter_id = ? AND time_slot >= ? AND time_slot < ? GROUP BY 1")
+
+
+def _connect(path, init_command, **kwargs):
+    """
+    Open a connection and run the statements of init_command, like the SQLite backend
+    of Django does with OPTIONS['init_command'].
+    """
+    connection = sqlite3.connect(path, **kwargs)
+    for statement in init_command.split(';'):
+        if statement := statement.strip():
+            connection.execute(statement)
+    return connection
+
+
+def _day_rows(meter_id, day, rng):
+    time_slot = (np.datetime64('2020-01-01T00:00') + np.timedelta64(day, 'D')
+                 + np.arange(SLOTS_PER_DAY) * np.timedelta64(30, 'm'))
+    text = np.datetime_as_string(time_slot, unit='s').tolist()
+    return zip([meter_id] * SLOTS_PER_DAY, text,
+               rng.uniform(0, 1.5, SLOTS_PER_DAY).tolist())
+
+
+class Command(BaseCommand):
+    help = ("Measure the latency of reading usage while usage is written one day per "
+            "transaction, like a Contact Energy backfill, with and without "
+            "SQLITE_INIT_COMMAND. Run on a temporary database, not the configured one.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--history-days', type=int, default=3 * 365,
+                            help="Days of existing usage of the read meter.")
+        parser.add_argument('--ingest-days', type=int, default=1000,
+                            help="Days of usage written during the measurement.")
+        parser.add_argument('--readers', type=int, default=4,
+                            help="Threads reading at the same time.")
+        parser.add_argument('--read-days', type=int, default=90,
+                            help="Days of usage in each read.")
+
+    def run(self, path, init_command, options):
+        rng = np.random.default_rng(0)
+        connection = _connect(path, init_command)
+        connection.execute(SQL_CREATE)
+        for day in range(options['history_days']):
+            connection.executemany(SQL_INSERT, _day_rows(1, day, rng))
+        connection.commit()
+        connection.close()
+
+        done = threading.Event()
+        latencies, errors = [], []
+        lock = threading.Lock()
+
+        def read():
+            reader = _connect(path, init_command, check_same_thread=False)
+            read_rng = np.random.default_rng(threading.get_ident())
+            while not done.is_set():
+                day = int(read_rng.integers(0, options['history_days']))
+                start = np.datetime64('2020-01-01') + np.timedelta64(day, 'D')
+                end = start + np.timedelta64(options['read_days'], 'D')
+                start_time = time.perf_counter()
+                try:
+                    reader.execute(SQL_READ, (1, str(start), str(end))).fetchall()
+                except sqlite3.OperationalError as e:
+                    with lock:
+                        errors.append(str(e))
+                    continue
+                with lock:
+                    latencies.append(time.perf_counter() - start_time)
+            reader.close()
+
+        writer = _connect(path, init_command, isolation_level=None)
+        readers = [threading.Thread(target=read) for _ in range(options['readers'])]
+        for thread in readers:
+            thread.start()
+        start_time = time.perf_counter()
+        for day in range(options['ingest_days']):
+            writer.execute("BEGIN IMMEDIATE")
+            writer.execute("DELETE FROM usage WHERE meter_id = 2 AND time_slot >= ? AND "
+                           "time_slot < ?", (str(np.datetime64('2020-01-01') + day),
+                                             str(np.datetime64('2020-01-02') + day)))
+            writer.executemany(SQL_INSERT, _day_rows(2, day, rng))
+            writer.execute("COMMIT")
+        ingest_time = time.perf_counter() - start_time
+        done.set()
+        for thread in readers:
+            thread.join()
+        writer.close()
+
+        latency = np.array(latencies) * 1000
+        p50, p95, p99 = (np.percentile(latency, [50, 95, 99]) if latency.shape[0]
+                         else [np.nan] * 3)
+        return (f"{options['ingest_days'] / ingest_time:.0f} days written/s, "
+                f"{latency.shape[0]} reads, read latency p50 {p50:.2f} ms, "
+                f"p95 {p95:.2f} ms, p99 {p99:.2f} ms, "
+                f"max {latency.max(initial=0):.2f} ms, {len(errors)} errors")
+
+    def handle(self, *args, **options):
+        configurations = [
+            ("Default", ''),
+            ("SQLITE_INIT_COMMAND", getattr(settings, 'SQLITE_INIT_COMMAND', '')),
+        ]
+        for name, init_command in configurations:
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'benchmark.sqlite3')
+                self.stdout.write(f"{name}: {self.run(path, init_command, options)}")
@@ -0,0 +1,63 @@
+import sys
+import time
+from datetime import date
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from Meter.export import EXPORT_CHUNK_SIZE, FORMATS, parquet_available, usage_chunks
+from Meter.fields import MeterOrGroupField
+
+
+class Command(BaseCommand):
+    help = ("Export the usage of a meter or a meter group as CSV or Parquet, streamed in "
+            "chunks, so the memory doesn't grow with the range.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('meter',
+                            help='"meter:<Meter id>" or "group:<MeterGroup id>".')
+        parser.add_argument('start_date', type=date.fromisoformat)
+        parser.add_argument('end_date', type=date.fromisoformat, help="Inclusive.")
+        parser.add_argument('--format', choices=list(FORMATS),
+                            help="Default: from the extension of --output, or csv.")
+        parser.add_argument('--output', help="Default: the standard output.")
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE,
+                            help="Rows read and converted at once, and in each row "
+                                 "group of Parquet.")
+
+    def handle(self, *args, **options):
+        try:
+            meter = MeterOrGroupField().clean(options['meter'])
+        except ValidationError as e:
+            raise CommandError(' '.join(e.messages))
+        start_date, end_date = options['start_date'], options['end_date']
+        if start_date > end_date:
+            raise CommandError("start_date is later than end_date.")
+        file_format = options['format']
+        if file_format is None:
+            output = options['output'] or ''
+            file_format = 'parquet' if output.endswith('.parquet') else 'csv'
+        if file_format == 'parquet' and not parquet_available():
+            raise CommandError('Parquet needs pyarrow. Install it by "pip install '
+                               'pyarrow".')
+
+        n_rows = 0
+
+        def counted(chunks):
+            nonlocal n_rows
+            for time_slot, value in chunks:
+                n_rows += time_slot.shape[0]
+                yield time_slot, value
+
+        start_time = time.perf_counter()
+        content = FORMATS[file_format][2](counted(usage_chunks(
+            meter, start_date, end_date, options['chunk_size'])))
+        if options['output']:
+            with open(options['output'], 'wb') as f:
+                f.writelines(content)
+        else:
+            sys.stdout.buffer.writelines(content)
+            sys.stdout.buffer.flush()
+        elapsed = time.perf_counter() - start_time
+        self.stderr.write(f"{n_rows} rows exported in {elapsed:.2f} s "
+                          f"({n_rows / elapsed:.0f} rows/s).")
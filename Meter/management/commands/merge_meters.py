@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Meter.merge import (MAX_MERGE_CHUNK_SIZE, MERGE_CHUNK_SIZE, merge_usage,
+                         switch_provider)
+from Meter.models import Meter
+
+
+class Command(BaseCommand):
+    help = ("Merge the usage history of a new meter into a previous meter, e.g. after "
+            "switching provider, like the \"Switch provider and merge history\" page.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('previous', type=int, help="ID of the previous Meter.")
+        parser.add_argument('new', type=int, help="ID of the new Meter.")
+        parser.add_argument('--keep', choices=['prev', 'new'], default='prev',
+                            help="Whose usage to keep where both meters have usage.")
+        parser.add_argument('--chunk-size', type=int, default=MERGE_CHUNK_SIZE,
+                            help="Rows deleted or moved in each transaction, at "
+                                 f"most {MAX_MERGE_CHUNK_SIZE}.")
+
+    def handle(self, *args, **options):
+        if options['previous'] == options['new']:
+            raise CommandError("The previous and new meters are the same.")
+        if not 1 <= options['chunk_size'] <= MAX_MERGE_CHUNK_SIZE:
+            raise CommandError(f"--chunk-size must be from 1 to {MAX_MERGE_CHUNK_SIZE}.")
+        try:
+            prev_meter_g = Meter.objects.get(id=options['previous'])
+            new_meter_g = Meter.objects.get(id=options['new'])
+        except Meter.DoesNotExist as e:
+            raise CommandError(e)
+        new_ct, new_meter_id = new_meter_g.provider_id, new_meter_g.meter_id
+        start_time = time.perf_counter()
+
+        def progress(done, total):
+            elapsed = time.perf_counter() - start_time
+            self.stdout.write(f"{done}/{total} rows, {done / elapsed:.0f} rows/s.")
+
+        done = merge_usage(prev_meter_g, new_meter_g, options['keep'],
+                           options['chunk_size'], progress)
+        switch_provider(prev_meter_g, new_ct, new_meter_id)
+        self.stdout.write(self.style.SUCCESS(
+            f"Merged {done} rows into meter {prev_meter_g.id} in "
+            f"{time.perf_counter() - start_time:.1f}s."))
@@ -0,0 +1,46 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from NewZealandElectricity.db import USAGE_DB, USAGE_MODELS, write_transaction
+
+
+class Command(BaseCommand):
+    help = ("Move the usage, the ledger and the price series from the default database "
+            "to the usage database, after USAGE_DATABASE is set and the usage "
+            "database is migrated. Can be run again if interrupted.")
+
+    def handle(self, *args, **options):
+        if USAGE_DB not in connections.settings:
+            raise CommandError("USAGE_DATABASE is not set.")
+        source = connections[DEFAULT_DB_ALIAS]
+        target = connections[USAGE_DB]
+        if source.vendor != 'sqlite' or target.vendor != 'sqlite':
+            raise CommandError("Both databases must be SQLite.")
+        source_tables = source.introspection.table_names()
+        with target.cursor() as cursor:
+            # Not in a transaction, as SQLite cannot attach in one.
+            cursor.execute("ATTACH DATABASE %s AS source",
+                           [str(source.settings_dict['NAME'])])
+            try:
+                for model in apps.get_models():
+                    if model._meta.label_lower not in USAGE_MODELS:
+                        continue
+                    table = model._meta.db_table
+                    if table not in source_tables:
+                        continue
+                    columns = ', '.join(target.ops.quote_name(f.column)
+                                        for f in model._meta.concrete_fields)
+                    with write_transaction(model):
+                        # Rows already moved by an interrupted run are ignored.
+                        cursor.execute(
+                            f'INSERT OR IGNORE INTO main."{table}" ({columns}) '
+                            f'SELECT {columns} FROM source."{table}"')
+                        n = cursor.rowcount
+                        cursor.execute(f'DELETE FROM source."{table}"')
+                    self.stdout.write(
+                        f"{model._meta.verbose_name_plural}: {n} rows moved.")
+            finally:
+                cursor.execute("DETACH DATABASE source")
+        self.stdout.write(self.style.SUCCESS(
+            "Moved. VACUUM the default database to reclaim the space."))
@@ -0,0 +1,104 @@
+"""
+Merge the usage history of a meter into another, e.g. after switching provider.
+
+Usage is moved and deleted by set-based statements on (meter, time_slot) ranges,
+which are covered by the unique index of Usage. Each chunk is a separate transaction,
+so other writers are not blocked for the whole merge, and an interrupted merge can be
+run again to finish. The chunk is selected by a subquery in the same statement, so its
+primary keys are not read into Python.
+"""
+from django.db.models import Min, Max, Subquery
+
+from NewZealandElectricity.db import write_transaction
+from .labels import meter_providers
+from .models import Usage
+from .signals import usage_changed
+
+MERGE_CHUNK_SIZE = 20000
+# A chunk holds the write lock of the database for its whole transaction.
+MAX_MERGE_CHUNK_SIZE = 200000
+
+
+def _chunked(queryset, chunk_size, action, progress=None, total=0, done=0) -> int:
+    """
+    Apply action ('update' kwargs or 'delete') to queryset in chunks of rows ordered
+    by time slot, until the queryset is empty.
+
+    :return: Number of processed rows, including done.
+    """
+    while True:
+        with write_transaction(Usage):
+            chunk = Usage.objects.filter(pk__in=Subquery(
+                queryset.order_by('time_slot').values('pk')[:chunk_size]))
+            if action == 'delete':
+                n = chunk.delete()[0]
+            else:
+                n = chunk.update(**action)
+        if n == 0:
+            return done
+        done += n
+        if progress:
+            progress(done, total)
+
+
+def merge_usage(prev_meter_g, new_meter_g, keep='prev', chunk_size=MERGE_CHUNK_SIZE,
+                progress=None) -> int:
+    """
+    Move the usage of new_meter_g to prev_meter_g, and delete new_meter_g.
+
+    :param keep: Where the time ranges of both meters overlap, keep the usage of the
+        previous meter ('prev') or the new meter ('new').
+    :param chunk_size: From 1 to MAX_MERGE_CHUNK_SIZE.
+    :param progress: Called with (number of processed rows, number of rows to process)
+        after each chunk.
+    :return: Number of processed rows.
+    """
+    if not 1 <= chunk_size <= MAX_MERGE_CHUNK_SIZE:
+        raise ValueError(f"chunk_size must be from 1 to {MAX_MERGE_CHUNK_SIZE}.")
+    new_usage = Usage.objects.filter(meter=new_meter_g)
+    existed_usage = Usage.objects.filter(meter=prev_meter_g)
+    if keep == 'prev':
+        overlap_range = existed_usage.aggregate(min_time=Min("time_slot"),
+                                                max_time=Max("time_slot"))
+        overlapped = new_usage
+    else:  # keep = new
+        overlap_range = new_usage.aggregate(min_time=Min("time_slot"),
+                                            max_time=Max("time_slot"))
+        overlapped = existed_usage
+    if overlap_range['min_time'] is None:
+        overlapped = overlapped.none()
+    else:
+        overlapped = overlapped.filter(time_slot__gte=overlap_range['min_time'],
+                                       time_slot__lte=overlap_range['max_time'])
+
+    n_overlapped = overlapped.count()
+    # The overlapped rows of the new meter are deleted, not moved.
+    total = (n_overlapped + new_usage.count()
+             - (n_overlapped if keep == 'prev' else 0))
+    # The readers between chunks must not keep the usage from before the merge, and
+    # what they read meanwhile is replaced by the send after the last chunk.
+    usage_changed.send(sender=Usage, meter=prev_meter_g)
+    usage_changed.send(sender=Usage, meter=new_meter_g)
+    done = _chunked(overlapped, chunk_size, 'delete', progress, total)
+    # After the overlap is removed, no moved row conflicts with (meter, time_slot).
+    done = _chunked(new_usage, chunk_size, {'meter': prev_meter_g}, progress, total,
+                    done)
+    new_meter_g.delete()
+    usage_changed.send(sender=Usage, meter=prev_meter_g)
+    return done
+
+
+def switch_provider(prev_meter_g, new_ct: int, new_meter_id: int):
+    """
+    Point the merged meter to the new provider's meter, and delete the previous
+    provider's meter.
+    """
+    prev_ct, prev_meter_id = prev_meter_g.provider_id, prev_meter_g.meter_id
+    prev_meter_g.provider_id = new_ct
+    prev_meter_g.meter_id = new_meter_id
+    prev_meter_g.save()
+    prev_provider = meter_providers().get(prev_ct)
+    if prev_provider is not None:
+        prev_meter = prev_provider.model_class().objects.filter(id=prev_meter_id)
+        if prev_meter.exists():
+            prev_meter.delete()
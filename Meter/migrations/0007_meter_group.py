@@ -0,0 +1,21 @@
+# Generated by Django 5.1.15 on 2026-10-19 15:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Meter', '0006_usage_unique_usage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MeterGroup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, unique=True)),
+                ('meters', models.ManyToManyField(to='Meter.meter')),
+            ],
+        ),
+    ]
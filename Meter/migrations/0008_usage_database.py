@@ -0,0 +1,19 @@
+# Generated by Django 5.1.15 on 2026-10-19 16:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Meter', '0007_meter_group'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='usage',
+            name='meter',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='Meter.meter'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.15 on 2026-10-19 16:21
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Meter', '0008_usage_database'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='meter',
+            name='data_modified',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AddField(
+            model_name='meter',
+            name='data_version',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+    ]
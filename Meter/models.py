@@ -1,13 +1,35 @@
 from django.db import models
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
+from django.utils import timezone
+
+
+class VersionedModel:
+    """
+    A model whose data_version and data_modified are only changed by its signal
+    handlers, with QuerySet.update. Saving an instance got before that doesn't write the
+    old values back.
+    """
+    VERSION_FIELDS = ('data_version', 'data_modified')
+
+    def save(self, *args, **kwargs):
+        if (not self._state.adding and not kwargs.get('force_insert')
+                and kwargs.get('update_fields') is None):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.VERSION_FIELDS]
+        super().save(*args, **kwargs)
 
 
 # Create your models here.
-class Meter(models.Model):
+class Meter(VersionedModel, models.Model):
     provider = models.ForeignKey(ContentType, on_delete=models.CASCADE)
     meter_id = models.PositiveIntegerField()
     content_object = GenericForeignKey('provider', 'meter_id')
+    # Changed with the usage, by Meter.signals. For the ETags of the pages computed
+    # from the usage. See NewZealandElectricity.conditional.
+    data_version = models.PositiveBigIntegerField(default=0, editable=False)
+    data_modified = models.DateTimeField(default=timezone.now, editable=False)
 
     class Meta:
         constraints = [
@@ -15,11 +37,13 @@ class Meter(models.Model):
         ]
 
     def __str__(self):
-        return f"{self.provider.app_label}, {self.content_object}"
+        from .labels import meter_label  # It imports this module.
+        return meter_label(self)
 
 
 class Usage(models.Model):
-    meter = models.ForeignKey(Meter, on_delete=models.CASCADE)
+    # May be in another database than the meters. See NewZealandElectricity.db.
+    meter = models.ForeignKey(Meter, on_delete=models.DO_NOTHING, db_constraint=False)
     time_slot = models.DateTimeField()
     value = models.FloatField(verbose_name="Electricity usage amount (kWh)", null=True)
 
@@ -30,3 +54,15 @@ class Usage(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['meter', 'time_slot'], name='unique_usage'),
         ]
+
+
+class MeterGroup(models.Model):
+    """
+    Meters billed together, e.g. every ICP of a household. The usage of a group is the
+    sum of its meters' usage.
+    """
+    name = models.CharField(max_length=64, unique=True)
+    meters = models.ManyToManyField(Meter)
+
+    def __str__(self):
+        return self.name
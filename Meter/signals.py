@@ -0,0 +1,50 @@
+from django.db import transaction
+from django.db.models import F
+from django.core.signals import request_started
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+
+from .admin import METER_TYPES
+from .labels import check_meter_index, invalidate_meter_index
+from .models import Meter, MeterGroup, Usage
+from .usage_cache import usage_cache
+
+# Sent after the usage of a meter is written, overwritten or moved to another meter.
+# Arguments: meter, start_date, end_date (local dates, both inclusive; None means
+# unbounded).
+usage_changed = Signal()
+
+
+@receiver(usage_changed)
+def usage_version_handler(sender, meter, **kwargs):
+    Meter.objects.filter(id=meter.id).update(data_version=F('data_version') + 1,
+                                             data_modified=timezone.now())
+    # The new version already misses the cache. This frees the memory, and misses for
+    # the Meter objects got before.
+    usage_cache.discard(meter.id)
+    transaction.on_commit(lambda: usage_cache.discard(meter.id),
+                          using=Meter.objects.db)
+
+
+@receiver(post_delete, sender=Meter)
+def meter_deleted_handler(sender, instance, **kwargs):
+    # Not cascaded, as the usage may be in another database.
+    Usage.objects.filter(meter_id=instance.id).delete()
+    usage_cache.discard(instance.id)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def meter_index_handler(sender, using, **kwargs):
+    if (sender in (Meter, MeterGroup)
+            or (sender._meta.app_label, sender._meta.model_name) in METER_TYPES):
+        invalidate_meter_index()
+        # Again when committed, in case the index was read before.
+        transaction.on_commit(invalidate_meter_index, using=using)
+
+
+@receiver(request_started)
+def meter_index_request_handler(**kwargs):
+    # Another process may have changed the meters since the last request.
+    check_meter_index()
@@ -0,0 +1,69 @@
+"""
+Synthetic meters with the usage of a typical household, for benchmarks and for trying
+the pages without a provider account.
+"""
+import numpy as np
+import pandas as pd
+from django.contrib.contenttypes.models import ContentType
+
+from ContactEnergy.models import ContactEnergyMeter
+from NewZealandElectricity.db import write_transaction
+from NewZealandElectricity.settings import TIME_ZONE
+from .models import Meter, Usage
+from .signals import usage_changed
+
+# Account numbers of synthetic Contact Energy meters start with it.
+SYNTHETIC_ACCOUNT_PREFIX = 'SYN'
+
+
+def synthetic_usage(time_slot, interval_minutes, rng, mean_power=0.8) -> np.ndarray:
+    """
+    A base load, a morning and an evening peak which are higher in winter (July in New
+    Zealand), more usage at daytime on weekends, and random noise.
+
+    :param time_slot: DatetimeIndex in TIME_ZONE, the start of each slot.
+    :param mean_power: Roughly the average power of the household. Unit: kW
+    :return: Usage in each slot. Unit: kWh
+    """
+    hour = time_slot.hour.to_numpy() + time_slot.minute.to_numpy() / 60
+    season = 1 + 0.35 * np.cos(2 * np.pi * (time_slot.dayofyear.to_numpy() - 196) / 365.25)
+    weekend = time_slot.dayofweek.to_numpy() >= 5
+    daily = (0.45 + 0.8 * np.exp(-((hour - 7.5) / 1.2) ** 2)
+             + 1.3 * np.exp(-((hour - 18.5) / 1.8) ** 2)
+             + np.where(weekend, 0.4 * np.exp(-((hour - 13) / 3) ** 2), 0))
+    noise = rng.lognormal(-0.045, 0.3, hour.shape[0])
+    return mean_power * daily * season * noise * interval_minutes / 60
+
+
+def create_synthetic_meters(n_meters, start_date, end_date, interval_minutes=30,
+                            seed=None, batch_size=20000) -> list:
+    """
+    Create Contact Energy meters, and their usage from start_date to end_date (both
+    inclusive, local dates).
+
+    :param interval_minutes: Length of a time slot, e.g. 30 for half-hourly usage.
+    :return: The created Meter objects.
+    """
+    rng = np.random.default_rng(seed)
+    time_slot = pd.date_range(start_date, pd.Timestamp(end_date) + pd.Timedelta(days=1),
+                              freq=f'{interval_minutes}min', tz=TIME_ZONE,
+                              inclusive='left')
+    provider = ContentType.objects.get_for_model(ContactEnergyMeter)
+    n_existed = ContactEnergyMeter.objects.filter(
+        account_number__startswith=SYNTHETIC_ACCOUNT_PREFIX).count()
+    meters = []
+    for i in range(n_existed, n_existed + n_meters):
+        provider_meter = ContactEnergyMeter.objects.create(
+            account_number=f"{SYNTHETIC_ACCOUNT_PREFIX}{i:06d}", contract_id=str(i))
+        meter = Meter.objects.create(provider=provider, meter_id=provider_meter.id)
+        value = synthetic_usage(time_slot, interval_minutes, rng,
+                                mean_power=rng.uniform(0.4, 1.6))
+        for j in range(0, time_slot.shape[0], batch_size):
+            with write_transaction(Usage):
+                Usage.objects.bulk_create([
+                    Usage(meter=meter, time_slot=t, value=v) for t, v in zip(
+                        time_slot[j:j + batch_size], value[j:j + batch_size].tolist())
+                ])
+        usage_changed.send(sender=Usage, meter=meter)
+        meters.append(meter)
+    return meters
@@ -1,3 +1,336 @@
+import io
+import os
+import tempfile
+from datetime import date
+from unittest import mock, skipUnless
+
+import numpy as np
+import pandas as pd
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.db import connections, router
 from django.test import TestCase
 
+from ContactEnergy.models import ContactEnergyMeter
+from NewZealandElectricity.settings import TIME_ZONE
+from .export import csv_chunks, parquet_available, usage_chunks
+from .fields import meter_choice, meter_choices
+from .merge import merge_usage
+from .models import Meter, MeterGroup, Usage
+from .synthetic import create_synthetic_meters
+from .usage import iter_usage, load_group_usage, load_usage, merge_sum
+from .usage_cache import UsageCache, usage_cache
+
+
 # Create your tests here.
+class MeterIndexTest(TestCase):
+    """
+    The meter index is invalidated by saving meters, providers' meters and groups.
+    """
+    def test_invalidation(self):
+        provider_meter = ContactEnergyMeter.objects.create(account_number="500",
+                                                           contract_id="900")
+        meter = Meter.objects.create(
+            provider=ContentType.objects.get_for_model(ContactEnergyMeter),
+            meter_id=provider_meter.id)
+        label = "ContactEnergy, Account number: 500, Contract ID: 900"
+        self.assertEqual(str(meter), label)
+        self.assertEqual(meter_choices(), [
+            ("Meters", [(f"meter:{meter.id}", label)]), ("Meter groups", [])])
+
+        provider_meter.contract_id = "901"
+        provider_meter.save()
+        group = MeterGroup.objects.create(name="Home")
+        self.assertEqual(meter_choices(), [
+            ("Meters", [(f"meter:{meter.id}", label[:-1] + "1")]),
+            ("Meter groups", [(f"group:{group.id}", "Home")])])
+        with self.assertNumQueries(0):
+            self.assertEqual(str(meter), label[:-1] + "1")
+
+        meter.delete()
+        self.assertEqual(meter_choices()[0], ("Meters", []))
+
+    def test_other_process(self):
+        # bulk_create sends no post_save, like a meter created by another process.
+        provider_meter = ContactEnergyMeter.objects.create(account_number="501",
+                                                           contract_id="902")
+        meter_choices()
+        meter, = Meter.objects.bulk_create([Meter(
+            provider=ContentType.objects.get_for_model(ContactEnergyMeter),
+            meter_id=provider_meter.id)])
+        group, = MeterGroup.objects.bulk_create([MeterGroup(name="Office")])
+        response = self.client.post('/select_meter', {
+            'meter': f"meter:{meter.id}", 'start_date': date(2024, 6, 24),
+            'end_date': date(2024, 6, 30)})
+        self.assertNotContains(response, "Select a valid choice")
+        self.assertIn((f"group:{group.id}", "Office"), meter_choices()[1][1])
+
+
+class GroupUsageTest(TestCase):
+    """
+    The usage of a group of a half-hourly and an hourly meter, which misses some hours.
+    """
+    databases = '__all__'
+    start_date = date(2024, 6, 24)
+    end_date = date(2024, 6, 30)
+
+    @classmethod
+    def setUpTestData(cls):
+        half_hourly, = create_synthetic_meters(1, cls.start_date, cls.end_date, seed=0)
+        hourly, = create_synthetic_meters(1, cls.start_date, cls.end_date,
+                                          interval_minutes=60, seed=1)
+        Usage.objects.filter(meter=hourly, time_slot__gte=pd.Timestamp(
+            '2024-06-26 09:00', tz=TIME_ZONE), time_slot__lt=pd.Timestamp(
+            '2024-06-26 17:00', tz=TIME_ZONE)).delete()
+        cls.group = MeterGroup.objects.create(name="Home")
+        cls.group.meters.set([half_hourly, hourly])
+        # Each hour of the half-hourly meter, plus the hourly meter where it has usage.
+        half_hourly_usage = pd.Series(
+            *load_usage(half_hourly, cls.start_date, cls.end_date)[::-1])
+        hourly_usage = pd.Series(*load_usage(hourly, cls.start_date, cls.end_date)[::-1])
+        cls.expected = half_hourly_usage.resample('1h').sum().add(hourly_usage,
+                                                                  fill_value=0)
+
+    def test_merge_sum(self):
+        t, value = merge_sum(np.array([0, 2, 4]), np.array([1., 2., 3.]),
+                             np.array([1, 2, 5]), np.array([10., 20., 30.]))
+        self.assertEqual(t.tolist(), [0, 1, 2, 4, 5])
+        self.assertEqual(value.tolist(), [1, 10, 22, 3, 30])
+
+    def test_load_group_usage(self):
+        time_slot, value = load_group_usage(self.group, self.start_date, self.end_date)
+        self.assertEqual(list(time_slot), list(self.expected.index))
+        np.testing.assert_allclose(value, self.expected.to_numpy())
+
+    def test_iter_usage(self):
+        time_slot, value = load_group_usage(self.group, self.start_date, self.end_date)
+        chunks = list(iter_usage(self.group, self.start_date, self.end_date, 50))
+        self.assertGreater(len(chunks), 1)
+        self.assertLessEqual(max(chunk[0].shape[0] for chunk in chunks), 2 * 50)
+        self.assertEqual([t for chunk in chunks for t in chunk[0]], list(time_slot))
+        np.testing.assert_allclose(np.concatenate([chunk[1] for chunk in chunks]),
+                                   value)
+
+
+class UsageCacheTest(TestCase):
+    """
+    The usage of a meter and range is read once, until its usage is written.
+    """
+    databases = '__all__'
+    start_date = date(2024, 6, 24)
+    end_date = date(2024, 6, 30)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.meter = create_synthetic_meters(1, cls.start_date, cls.end_date, seed=0)[0]
+
+    def setUp(self):
+        usage_cache.clear()
+
+    def test_hit(self):
+        meter = Meter.objects.get(id=self.meter.id)
+        time_slot, value = load_usage(meter, self.start_date, self.end_date)
+        with self.assertNumQueries(0):
+            cached = load_usage(meter, self.start_date, self.end_date)
+        self.assertIs(cached[1], value)
+        self.assertFalse(value.flags.writeable)
+        # Another range.
+        with self.assertNumQueries(1):
+            load_usage(meter, self.start_date, self.end_date - pd.Timedelta(days=1))
+
+    def test_write(self):
+        from ContactEnergy.views import save_usage
+        meter = Meter.objects.get(id=self.meter.id)
+        load_usage(meter, self.start_date, self.end_date)
+        save_usage(meter, pd.Timestamp(self.end_date),
+                   [{'date': '2024-06-30T00:00:00+12:00', 'value': '2.5'}])
+        for meter in [meter, Meter.objects.get(id=self.meter.id)]:
+            with self.assertNumQueries(1):
+                time_slot, value = load_usage(meter, self.start_date, self.end_date)
+            self.assertEqual(value[-1], 2.5)
+
+    def test_eviction(self):
+        cache = UsageCache(max_bytes=2 * 16 * 10)
+        time_slot = pd.date_range('2024-06-30', periods=10, freq='30min', tz='UTC')
+        for meter_id in [1, 2]:
+            cache.put((meter_id,), 0, time_slot, np.zeros(10))
+        self.assertIsNotNone(cache.get((1,), 0))
+        cache.put((3,), 0, time_slot, np.zeros(10))
+        # The least recently used.
+        self.assertIsNone(cache.get((2,), 0))
+        self.assertIsNone(cache.get((1,), 1))
+        self.assertIsNotNone(cache.get((3,), 0))
+        self.assertEqual((len(cache), cache.bytes, cache.hits, cache.misses),
+                         (2, 320, 2, 2))
+        # Larger than the cache.
+        cache.put((4,), 0, time_slot.repeat(3), np.zeros(30))
+        self.assertEqual(len(cache), 2)
+
+
+class ExportTest(TestCase):
+    """
+    The usage is exported in chunks, the same as it's read by load_usage.
+    """
+    databases = '__all__'
+    start_date = date(2024, 4, 6)  # Daylight saving time ends on 2024-04-07.
+    end_date = date(2024, 4, 8)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.meters = create_synthetic_meters(2, cls.start_date, cls.end_date, seed=0)
+        Usage.objects.filter(meter=cls.meters[0], time_slot=pd.Timestamp(
+            cls.start_date, tz=TIME_ZONE)).update(value=None)
+        cls.group = MeterGroup.objects.create(name="Home")
+        cls.group.meters.set(cls.meters)
+
+    def read_csv(self, content):
+        usage = pd.read_csv(io.BytesIO(content), float_precision='round_trip')
+        return (pd.DatetimeIndex(pd.to_datetime(usage['time_slot'], utc=True)),
+                usage['value'])
+
+    def assertUsage(self, meter, time_slot, value):
+        expected_time_slot, expected_value = load_usage(meter, self.start_date,
+                                                        self.end_date)
+        self.assertEqual(list(time_slot), list(expected_time_slot))
+        np.testing.assert_array_equal(value, expected_value)
+
+    def test_csv(self):
+        response = self.client.get('/export/usage', {
+            'meter': meter_choice(self.meters[0]), 'start_date': self.start_date,
+            'end_date': self.end_date, 'format': 'csv'})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Disposition'], (
+            f'attachment; filename="usage_meter{self.meters[0].id}_2024-04-06_'
+            f'2024-04-08.csv"'))
+        content = b''.join(response.streaming_content)
+        lines = content.decode().splitlines()
+        # 25 hours on 2024-04-07.
+        self.assertEqual(len(lines), 1 + 48 * 3 + 2)
+        self.assertEqual(lines[:2], ['time_slot,value', '2024-04-06T00:00:00+13:00,'])
+        self.assertIn('2024-04-07T02:30:00+13:00,', content.decode())
+        self.assertIn('2024-04-07T02:30:00+12:00,', content.decode())
+        time_slot, value = self.read_csv(content)
+        self.assertUsage(self.meters[0], time_slot[1:], value[1:])
+
+        # The same in chunks of any size.
+        chunks = usage_chunks(self.meters[0], self.start_date, self.end_date,
+                              chunk_size=7)
+        self.assertEqual(b''.join(csv_chunks(chunks)), content)
+
+    def test_datetime(self):
+        # Other databases than SQLite read the time slots as datetimes.
+        expected = list(usage_chunks(self.meters[0], self.start_date, self.end_date,
+                                     chunk_size=50))
+        with mock.patch.object(connections[router.db_for_read(Usage)], 'vendor',
+                               'postgresql'):
+            chunks = list(usage_chunks(self.meters[0], self.start_date, self.end_date,
+                                       chunk_size=50))
+        self.assertEqual(len(chunks), len(expected))
+        for chunk, expected_chunk in zip(chunks, expected):
+            np.testing.assert_array_equal(chunk[0], expected_chunk[0])
+            np.testing.assert_array_equal(chunk[1], expected_chunk[1])
+
+    def test_group(self):
+        # Streamed from chunks of its meters, not read at once.
+        chunks = list(usage_chunks(self.group, self.start_date, self.end_date,
+                                   chunk_size=50))
+        self.assertGreater(len(chunks), 1)
+        content = b''.join(csv_chunks(chunks))
+        self.assertUsage(self.group, *self.read_csv(content))
+
+    @skipUnless(parquet_available(), "pyarrow is not installed.")
+    def test_parquet(self):
+        import pyarrow.parquet as pq
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'usage.parquet')
+            call_command('export_usage', meter_choice(self.meters[1]),
+                         str(self.start_date), str(self.end_date), output=path,
+                         chunk_size=100, stderr=io.StringIO())
+            parquet_file = pq.ParquetFile(path)
+            self.assertEqual(parquet_file.metadata.num_row_groups, 2)
+            usage = parquet_file.read().to_pandas()
+        self.assertUsage(self.meters[1], pd.DatetimeIndex(usage['time_slot']),
+                         usage['value'])
+
+    async def test_asgi(self):
+        # Not read into memory before it's sent.
+        response = await self.async_client.get('/export/usage', {
+            'meter': meter_choice(self.meters[0]), 'start_date': self.start_date,
+            'end_date': self.end_date, 'format': 'csv'})
+        self.assertTrue(response.is_async)
+        content = b''.join([part async for part in response.streaming_content])
+        self.assertEqual(content.count(b'\n'), 1 + 48 * 3 + 2)
+
+
+class MigrateMetersTest(TestCase):
+    """
+    Merging a meter into another changes the version of its usage, for the ETags and
+    usage_cache.
+    """
+    databases = '__all__'
+    end_date = date(2024, 6, 30)
+
+    def test_version(self):
+        prev_meter, new_meter = create_synthetic_meters(
+            2, date(2024, 6, 28), self.end_date, seed=0)
+        prev_meter.refresh_from_db()
+        response = self.client.post('/migrate_meters/migrate', {
+            'previous_data_source': f"{prev_meter.provider_id};{prev_meter.meter_id}",
+            'new_data_source': f"{new_meter.provider_id};{new_meter.meter_id}",
+            'on_overlapped': 'new'})
+        self.assertEqual(response.status_code, 200)
+        merged_meter = Meter.objects.get(id=prev_meter.id)
+        self.assertEqual(merged_meter.meter_id, new_meter.meter_id)
+        self.assertGreater(merged_meter.data_version, prev_meter.data_version)
+        self.assertGreater(merged_meter.data_modified, prev_meter.data_modified)
+        self.assertFalse(Meter.objects.filter(id=new_meter.id).exists())
+
+
+class MergeUsageTest(TestCase):
+    """
+    merge_usage of overlapping ranges, in chunks smaller than the overlap.
+    """
+    databases = '__all__'
+
+    def setUp(self):
+        self.prev_meter, self.new_meter = create_synthetic_meters(
+            2, date(2024, 6, 24), date(2024, 6, 30), seed=0)
+        # The previous meter has usage until 28 June, and the new one from 27 June.
+        self.new_from = pd.Timestamp('2024-06-27', tz=TIME_ZONE)
+        self.prev_until = pd.Timestamp('2024-06-29', tz=TIME_ZONE)
+        Usage.objects.filter(meter=self.prev_meter,
+                             time_slot__gte=self.prev_until).delete()
+        Usage.objects.filter(meter=self.new_meter, time_slot__lt=self.new_from).delete()
+        self.prev_usage = self.usage(self.prev_meter)
+        self.new_usage = self.usage(self.new_meter)
+
+    @staticmethod
+    def usage(meter) -> dict:
+        return dict(Usage.objects.filter(meter=meter).values_list('time_slot', 'value'))
+
+    def merge(self, keep, n_rows):
+        calls = []
+        done = merge_usage(self.prev_meter, self.new_meter, keep, chunk_size=7,
+                           progress=lambda *args: calls.append(args))
+        self.assertEqual(done, n_rows)
+        self.assertEqual({total for _, total in calls}, {n_rows})
+        done_after = [0] + [done for done, _ in calls]
+        self.assertLessEqual(max(np.diff(done_after)), 7)
+        self.assertFalse(Meter.objects.filter(id=self.new_meter.id).exists())
+        return self.usage(self.prev_meter)
+
+    def test_keep_prev(self):
+        # 2 days of the new meter are deleted, and 2 days are moved.
+        merged = self.merge('prev', 48 * 4)
+        self.assertEqual(merged, {**self.new_usage, **self.prev_usage})
+
+    def test_keep_new(self):
+        # 2 days of the previous meter are deleted, and 4 days are moved.
+        merged = self.merge('new', 48 * 6)
+        self.assertEqual(merged, {**self.prev_usage, **self.new_usage})
+        self.assertEqual(len(merged), 48 * 7)
+
+    def test_chunk_size(self):
+        with self.assertRaises(ValueError):
+            merge_usage(self.prev_meter, self.new_meter, chunk_size=0)
+        self.assertEqual(self.usage(self.new_meter), self.new_usage)
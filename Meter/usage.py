@@ -0,0 +1,208 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from NewZealandElectricity.profiling import stage
+from NewZealandElectricity.settings import TIME_ZONE
+from .models import Usage, MeterGroup
+from .usage_cache import usage_cache
+
+
+def local_date_range(start_date, end_date):
+    """
+    Convert an inclusive range of local dates to the half-open range of aware
+    timestamps [start_date 00:00, end_date + 1 day 00:00) in TIME_ZONE.
+    """
+    start_date_midnight = (pd.to_datetime(start_date)
+                           .tz_localize(tz=TIME_ZONE, ambiguous=False))
+    end_date_next_midnight = (pd.to_datetime(end_date + pd.Timedelta(days=1))
+                              .tz_localize(tz=TIME_ZONE, ambiguous=False))
+    return start_date_midnight, end_date_next_midnight
+
+
+def _usage_rows(meter, start_date, end_date):
+    start_date_midnight, end_date_next_midnight = local_date_range(start_date, end_date)
+    return Usage.objects.filter(
+        meter=meter, time_slot__gte=start_date_midnight,
+        time_slot__lt=end_date_next_midnight, value__isnull=False,
+    ).order_by('time_slot').values_list('time_slot', 'value')
+
+
+def _to_arrays(rows):
+    if not rows:
+        return pd.DatetimeIndex([], tz=TIME_ZONE), np.empty(0)
+    time_slot, value = zip(*rows)
+    time_slot = pd.DatetimeIndex(time_slot).tz_convert(TIME_ZONE)
+    return time_slot, np.asarray(value, dtype=np.float64)
+
+
+def _load_meter_usage(meter, start_date, end_date, usage_stage):
+    """
+    Like load_usage for a Meter, through usage_cache.
+    """
+    if meter.id is None:
+        return _to_arrays(_usage_rows(meter, start_date, end_date))
+    key = (meter.id, *local_date_range(start_date, end_date))
+    version = (meter.data_version, meter.data_modified)
+    cached = usage_cache.get(key, version)
+    usage_stage.cache(hit=cached is not None)
+    if cached is not None:
+        return cached
+    time_slot, value = _to_arrays(_usage_rows(meter, start_date, end_date))
+    usage_cache.put(key, version, time_slot, value)
+    return time_slot, value
+
+
+def sampling_interval(t) -> int:
+    """
+    :param t: Sorted int64 timestamps.
+    :return: The most common difference between consecutive timestamps, 0 if unknown.
+    """
+    if t.shape[0] < 2:
+        return 0
+    difference, count = np.unique(np.diff(t), return_counts=True)
+    return int(difference[np.argmax(count)])
+
+
+def align(t, value, interval: int):
+    """
+    Move each time slot to the start of its interval on a grid from the epoch, and sum
+    the usage of time slots moved to the same interval. Time zones of New Zealand are
+    whole hours from UTC, so the grid is also aligned in local time for intervals that
+    divide an hour.
+
+    :param t: Sorted int64 timestamps.
+    """
+    if interval <= 1 or t.shape[0] == 0:
+        return t, value
+    t = t - t % interval
+    start = np.flatnonzero(np.concatenate([[True], t[1:] != t[:-1]]))
+    return t[start], np.add.reduceat(value, start)
+
+
+def merge_sum(t1, value1, t2, value2):
+    """
+    Sum two usage series by merging their sorted unique time slots in linear time. A
+    time slot missing from one series takes the value of the other.
+    """
+    position = np.searchsorted(t1, t2)
+    found = position < t1.shape[0]
+    found[found] = t1[position[found]] == t2[found]
+    value = value1.copy()
+    value[position[found]] += value2[found]
+    return (np.insert(t1, position[~found], t2[~found]),
+            np.insert(value, position[~found], value2[~found]))
+
+
+def load_group_usage(group, start_date, end_date):
+    """
+    Sum the usage of the meters in a group on the grid of the longest sampling interval
+    among them, e.g. hourly if one meter is read hourly and another half-hourly.
+
+    :return: Like load_usage.
+    """
+    series = []
+    for meter in group.meters.all():
+        time_slot, value = load_usage(meter, start_date, end_date)
+        series.append((time_slot.asi8, value))
+    interval = max((sampling_interval(t) for t, _ in series), default=0)
+    t, value = np.empty(0, dtype=np.int64), np.empty(0)
+    for t_meter, value_meter in series:
+        t, value = merge_sum(t, value, *align(t_meter, value_meter, interval))
+    return pd.DatetimeIndex(t, tz='UTC').tz_convert(TIME_ZONE), value
+
+
+def load_usage(meter, start_date, end_date):
+    """
+    Read the non-empty usage of a meter from start_date to end_date (inclusive).
+
+    :param meter: Meter or MeterGroup.
+    :return: (time_slot, value), where time_slot is a DatetimeIndex in TIME_ZONE sorted
+        ascending, and value is a float64 array in kWh. The arrays of a meter may be
+        shared by usage_cache, so value is read-only.
+    """
+    with stage('usage') as usage_stage:
+        if isinstance(meter, MeterGroup):
+            time_slot, value = load_group_usage(meter, start_date, end_date)
+        else:
+            time_slot, value = _load_meter_usage(meter, start_date, end_date,
+                                                 usage_stage)
+        usage_stage.count(time_slot.shape[0])
+    return time_slot, value
+
+
+def usage_version(meter):
+    """
+    :param meter: Meter or MeterGroup.
+    :return: (version, last_modified), where version changes with the usage and the
+        label of each meter, and the meters of a group. last_modified is the latest
+        Meter.data_modified, or None for a group without meters.
+    """
+    if isinstance(meter, MeterGroup):
+        meters = list(meter.meters.order_by('id'))
+        version = [('group', meter.id, meter.name)]
+    else:
+        meters = [meter]
+        version = []
+    version += [(m.id, m.data_version, str(m)) for m in meters]
+    return version, max((m.data_modified for m in meters), default=None)
+
+
+def _iter_group_usage(group, start_date, end_date, chunk_size: int):
+    """
+    Like load_group_usage, but read each meter in chunks, and yield the sum of the time
+    slots which every meter has read past. The grid is the longest sampling interval
+    in the first chunk of each meter, which is the one of load_group_usage unless a
+    meter's interval changes after its first chunk_size rows.
+    """
+    chunks = [iter_usage(meter, start_date, end_date, chunk_size)
+              for meter in group.meters.all()]
+    # Read and not yielded rows of each meter, as int64 timestamps and values.
+    pending = []
+    for meter_chunks in chunks:
+        time_slot, value = next(meter_chunks, _to_arrays([]))
+        pending.append((time_slot.asi8, value))
+    interval = max((sampling_interval(t) for t, _ in pending), default=0)
+    reading = [t.shape[0] > 0 for t, _ in pending]
+    while True:
+        # The interval of the last row read may continue in the next chunk.
+        last_slot = {i: t[-1] - t[-1] % interval if interval > 1 else t[-1]
+                     for i, (t, _) in enumerate(pending) if reading[i]}
+        bound = min(last_slot.values(), default=None)
+        t, value = np.empty(0, dtype=np.int64), np.empty(0)
+        for i, (t_meter, value_meter) in enumerate(pending):
+            cut = (t_meter.shape[0] if bound is None
+                   else np.searchsorted(t_meter, bound))
+            t, value = merge_sum(t, value, *align(t_meter[:cut], value_meter[:cut],
+                                                  interval))
+            pending[i] = t_meter[cut:], value_meter[cut:]
+        if t.shape[0]:
+            yield pd.DatetimeIndex(t, tz='UTC').tz_convert(TIME_ZONE), value
+        if bound is None:
+            return
+        # Read on the meter that holds the others back.
+        i = min(last_slot, key=last_slot.get)
+        chunk = next(chunks[i], None)
+        if chunk is None:
+            reading[i] = False
+        else:
+            pending[i] = (np.concatenate([pending[i][0], chunk[0].asi8]),
+                          np.concatenate([pending[i][1], chunk[1]]))
+
+
+def iter_usage(meter, start_date, end_date, chunk_size: int):
+    """
+    Like load_usage, but read the rows through a cursor and yield them in chunks of at
+    most chunk_size rows, so the memory doesn't grow with the range. The chunks of a
+    MeterGroup are summed from chunks of its meters, and have at most chunk_size rows
+    of each meter.
+
+    :return: Generator of (time_slot, value).
+    """
+    if isinstance(meter, MeterGroup):
+        yield from _iter_group_usage(meter, start_date, end_date, chunk_size)
+        return
+    rows = _usage_rows(meter, start_date, end_date).iterator(chunk_size=chunk_size)
+    while chunk := list(itertools.islice(rows, chunk_size)):
+        yield _to_arrays(chunk)
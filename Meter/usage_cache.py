@@ -0,0 +1,103 @@
+"""
+A cache of the usage read by load_usage, kept in each process for the pages which
+read the same meter and range again, e.g. /select_meter, /compare and /integrity.
+
+An entry is the arrays of a meter and a range, with the version of the meter's usage
+they were read at, i.e. Meter.data_version and data_modified. Only a Meter of the same
+version hits it. Meter.signals changes the version when the usage is written,
+overwritten or merged, so usage written by another process is read again by the next
+request which gets the meter. The least recently used entries are evicted to keep the
+arrays within settings.USAGE_CACHE_BYTES.
+"""
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
+
+from django.conf import settings
+
+from NewZealandElectricity.metrics import USAGE_CACHE_EVICTIONS, USAGE_CACHE_REQUESTS
+
+
+class _Entry(NamedTuple):
+    version: tuple
+    time_slot: object  # DatetimeIndex
+    value: object  # Read-only float64 array
+    size: int  # Unit: byte
+
+
+class UsageCache:
+    def __init__(self, max_bytes: int):
+        """
+        :param max_bytes: Total size of the arrays kept. 0 keeps nothing.
+        """
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # (Meter id, start, end): _Entry, oldest first.
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def hit_rate(self):
+        """
+        :return: Ratio of the gets which hit, or None before the first get.
+        """
+        total = self.hits + self.misses
+        return self.hits / total if total else None
+
+    def get(self, key, version):
+        """
+        :param key: (Meter id, start, end) of the range.
+        :param version: Version of the meter's usage.
+        :return: (time_slot, value), or None if it's not kept at this version.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            hit = entry is not None and entry.version == version
+            if hit:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        USAGE_CACHE_REQUESTS.inc(result='hit' if hit else 'miss')
+        return (entry.time_slot, entry.value) if hit else None
+
+    def put(self, key, version, time_slot, value):
+        """
+        Keep the arrays, evicting the least recently used. value is made read-only, as
+        the later gets share it.
+        """
+        size = time_slot.nbytes + value.nbytes
+        if size > self.max_bytes:
+            return
+        value.setflags(write=False)
+        evicted = 0
+        with self._lock:
+            if (old := self._entries.pop(key, None)) is not None:
+                self.bytes -= old.size
+            self._entries[key] = _Entry(version, time_slot, value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                self.bytes -= self._entries.popitem(last=False)[1].size
+                evicted += 1
+        if evicted:
+            USAGE_CACHE_EVICTIONS.inc(evicted)
+
+    def discard(self, meter_id):
+        """
+        Drop the entries of a meter, whose usage is changed or deleted.
+        """
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == meter_id]:
+                self.bytes -= self._entries.pop(key).size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+
+usage_cache = UsageCache(settings.USAGE_CACHE_BYTES)
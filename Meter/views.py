@@ -1,20 +1,26 @@
 import numpy as np
 import pandas as pd
 import pyecharts
+from asgiref.sync import sync_to_async
 from bs4 import BeautifulSoup
 from django import forms
-from django.contrib.contenttypes.models import ContentType
-from django.db import transaction, OperationalError, ProgrammingError
-from django.db.models import Q, Min, Max
-from django.http import HttpResponse
-from django.shortcuts import render
-from django.views.decorators.http import require_POST
+from django.core.handlers.asgi import ASGIRequest
+from django.db import OperationalError, ProgrammingError
+from django.http import HttpResponse, StreamingHttpResponse
+from django.shortcuts import render, redirect
+from django.views.decorators.http import require_GET, require_POST, require_http_methods
 from pyecharts.commons.utils import JsCode
-from scipy.stats import mode
 
+from NewZealandElectricity.conditional import (not_modified, page_validators,
+                                               request_data, set_validators)
+from NewZealandElectricity.profiling import stage
 from NewZealandElectricity.settings import TIME_ZONE
-from .admin import get_meter_types
-from .models import Meter, Usage
+from .export import FORMATS, export_filename, parquet_available, usage_chunks
+from .fields import MeterOrGroupField, first_meter_choice
+from .labels import meter_labels, meter_providers
+from .merge import merge_usage, switch_provider
+from .models import Meter, MeterGroup
+from .usage import load_usage, usage_version
 
 
 # Create your views here.
@@ -43,15 +49,10 @@ class MeterForm(forms.Form):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        # Filter ContentType to only include specific models
-        allowed_content_types = ContentType.objects.filter(
-            Q(app_label='ContactEnergy', model__in=['contactenergymeter'])
-        )
-        meters = Meter.objects.filter(provider__in=allowed_content_types)
+        providers = meter_providers()
         choices = [
-            (f"{meter.provider_id};{meter.meter_id}",
-             f"{meter.provider.app_label}, {meter.content_object}")
-            for meter in meters
+            (f"{label.provider_id};{label.meter_id}", label.label)
+            for label in meter_labels().values() if label.provider_id in providers
         ]
         self.fields['previous_data_source'].choices = choices
         self.fields['new_data_source'].choices = choices
@@ -81,10 +82,10 @@ def migrate_meters(req):
         return HttpResponse("Submission's format is invalid.", status=500)
     if prev_ct == new_ct and prev_meter_id == new_meter_id:
         return HttpResponse()
-    new_providers = get_meter_types().filter(id=new_ct)
-    if not new_providers.exists():
+    new_provider = meter_providers().get(new_ct)
+    if new_provider is None:
         return HttpResponse("New electricity provider does not exist.", status=500)
-    new_provider = new_providers[0].model_class()
+    new_provider = new_provider.model_class()
     new_meter = new_provider.objects.filter(id=new_meter_id)
     if not new_meter.exists():
         return HttpResponse("new meter does not exist. Please retrieve data from the new "
@@ -92,51 +93,19 @@ def migrate_meters(req):
     prev_meter_g, created = Meter.objects.get_or_create(
         provider_id=prev_ct, meter_id=prev_meter_id)
     try:
-        with transaction.atomic():
-            new_meter_g = Meter.objects.get(provider_id=new_ct, meter_id=new_meter_id)
-            new_usage = Usage.objects.filter(meter=new_meter_g)
-            new_usage_range = new_usage.aggregate(
-                min_time=Min("time_slot"),
-                max_time=Max("time_slot")
-            )
-            existed_usages = Usage.objects.filter(meter=prev_meter_g)
-            existed_usages_range = existed_usages.aggregate(
-                min_time=Min("time_slot"),
-                max_time=Max("time_slot")
-            )
-            if meter_form.cleaned_data['on_overlapped'] == 'prev':
-                new_usage.filter(
-                    time_slot__gte=existed_usages_range['min_time'],
-                    time_slot__lte=existed_usages_range['max_time'],
-                ).delete()
-            else:  # on_overlapped = new
-                existed_usages.filter(
-                    time_slot__gte=new_usage_range['min_time'],
-                    time_slot__lte=new_usage_range['max_time'],
-                ).delete()
-            for usage in new_usage:
-                usage.meter = prev_meter_g
-                usage.save()
-            new_meter_g.delete()
+        new_meter_g = Meter.objects.get(provider_id=new_ct, meter_id=new_meter_id)
+        merge_usage(prev_meter_g, new_meter_g, meter_form.cleaned_data['on_overlapped'])
     except Meter.DoesNotExist:
         pass
     except OperationalError:
-        HttpResponse("Database busy, please try later.", status=500)
-    prev_meter_g.provider_id = new_ct
-    prev_meter_g.meter_id = new_meter_id
-    prev_meter_g.save()
-    prev_providers = get_meter_types().filter(id=prev_ct)
-    if prev_providers.exists():
-        prev_provider = prev_providers[0].model_class()
-        prev_meter = prev_provider.objects.filter(id=prev_meter_id)
-        if prev_meter.exists():
-            prev_meter.delete()
+        return HttpResponse("Database busy, please try later.", status=500)
+    switch_provider(prev_meter_g, new_ct, new_meter_id)
     return HttpResponse()
 
 
 class CheckIntegrity(forms.Form):
-    meter = forms.ModelChoiceField(
-        required=True, queryset=Meter.objects.all(),
+    meter = MeterOrGroupField(
+        required=True,
         widget=forms.Select({"class": "form-select", "style": "white-space: normal;"})
     )
     start_date = forms.DateField(
@@ -151,7 +120,7 @@ class CheckIntegrity(forms.Form):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         try:
-            self.fields['meter'].initial = Meter.objects.first()
+            self.fields['meter'].initial = first_meter_choice()
         except (OperationalError, ProgrammingError):
             pass
 
@@ -161,9 +130,9 @@ def view_integrity(req, failed_reason=None):
         "failed_reason": failed_reason,
     })
 
-@require_POST
+@require_http_methods(['GET', 'POST'])
 def check_integrity(req):
-    ci = CheckIntegrity(req.POST)
+    ci = CheckIntegrity(request_data(req))
     if not ci.is_valid():
         return view_integrity(req, failed_reason=ci.errors.as_text())
     meter = ci.cleaned_data['meter']
@@ -171,17 +140,13 @@ def check_integrity(req):
     end_date = ci.cleaned_data['end_date']
     if start_date > end_date:
         start_date, end_date = end_date, start_date
-    start_date_midnight = (pd.to_datetime(start_date)
-                           .tz_localize(tz=TIME_ZONE, ambiguous=False))
-    end_date_next_midnight = (pd.to_datetime(end_date + pd.Timedelta(days=1))
-                              .tz_localize(tz=TIME_ZONE, ambiguous=False))
-    usage = Usage.objects.filter(
-        meter=meter, time_slot__gte=start_date_midnight,
-        time_slot__lt=end_date_next_midnight, value__isnull=False,
-    ).order_by('time_slot').values('time_slot')
-    usage = pd.DataFrame.from_records(usage)
+    validators = page_validators(req, *usage_version(meter))
+    if response := not_modified(req, validators):
+        return response
+    time_slot, _ = load_usage(meter, start_date, end_date)
+    usage = pd.DataFrame({'time_slot': time_slot})
     if usage.shape[0] < 2:
-        return render(req, 'integrity_results.html', context={
+        return set_validators(render(req, 'integrity_results.html', context={
             "meter": str(meter),
             "start_date": start_date,
             "end_date": end_date,
@@ -191,31 +156,34 @@ def check_integrity(req):
             "n_total": usage.shape[0],
             "missing_time": [],
             "sampling_frequency": '',
-        })
-    usage['time_slot'] = usage['time_slot'].dt.tz_convert(tz=TIME_ZONE)
-    sampling_frequency = usage['time_slot'].diff() / pd.Timedelta(seconds=1)
-    sampling_frequency_mode = pd.Timedelta(seconds=mode(sampling_frequency).mode)
-    min_time = usage.iloc[0, 0]
-    max_time = usage.iloc[-1, 0]
-    full_index = pd.date_range(min_time, max_time, freq=sampling_frequency_mode)
-    missing_time = full_index.difference(usage['time_slot'])
-
-    if missing_time.shape[0] == 0:
-        missing_time_pairs = pd.DataFrame(columns=['Start time', 'End time'])
-    else:
-        common_mask = missing_time.diff() > sampling_frequency_mode
-        common_idx = np.argwhere(common_mask).flatten()
-        start_idx = [0] + common_idx.tolist()
-        missing_start_time = missing_time[start_idx]
-        end_idx = (common_idx - 1).tolist() + [missing_time.shape[0] - 1]
-        missing_end_time = missing_time[end_idx]
-        missing_time_pairs = pd.DataFrame({
-            "Start time": missing_start_time,
-            "End time": missing_end_time,
-        })
-
-    theoretical_total = round((max_time - min_time) / sampling_frequency_mode) + 1
-    return render(req, 'integrity_results.html', context={
+        }), validators)
+    with stage('gaps') as gaps_stage:
+        usage['time_slot'] = usage['time_slot'].dt.tz_convert(tz=TIME_ZONE)
+        sampling_frequency = usage['time_slot'].diff() / pd.Timedelta(seconds=1)
+        from scipy.stats import mode  # Slow to import, and only used here.
+        sampling_frequency_mode = pd.Timedelta(seconds=mode(sampling_frequency).mode)
+        min_time = usage.iloc[0, 0]
+        max_time = usage.iloc[-1, 0]
+        full_index = pd.date_range(min_time, max_time, freq=sampling_frequency_mode)
+        missing_time = full_index.difference(usage['time_slot'])
+
+        if missing_time.shape[0] == 0:
+            missing_time_pairs = pd.DataFrame(columns=['Start time', 'End time'])
+        else:
+            common_mask = missing_time.diff() > sampling_frequency_mode
+            common_idx = np.argwhere(common_mask).flatten()
+            start_idx = [0] + common_idx.tolist()
+            missing_start_time = missing_time[start_idx]
+            end_idx = (common_idx - 1).tolist() + [missing_time.shape[0] - 1]
+            missing_end_time = missing_time[end_idx]
+            missing_time_pairs = pd.DataFrame({
+                "Start time": missing_start_time,
+                "End time": missing_end_time,
+            })
+
+        theoretical_total = round((max_time - min_time) / sampling_frequency_mode) + 1
+        gaps_stage.count(usage.shape[0])
+    return set_validators(render(req, 'integrity_results.html', context={
         "meter": str(meter),
         "start_date": start_date,
         "end_date": end_date,
@@ -227,14 +195,11 @@ def check_integrity(req):
         "missing_time": missing_time_pairs.to_html(
             classes='table table-striped table-bordered', index=False),
         "sampling_frequency": sampling_frequency_mode,
-    })
+    }), validators)
 
 
 class SelectMeter(forms.Form):
-    meter = forms.ModelChoiceField(
-        queryset=Meter.objects.all(), required=True,
-        widget=forms.Select({"class": "form-select"}),
-    )
+    meter = MeterOrGroupField(required=True)
     start_date = forms.DateField(
         required=True, widget=forms.DateInput({
             "class": "form-control", "type": "date", "min": "1996-01-01"}),
@@ -247,7 +212,7 @@ class SelectMeter(forms.Form):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         try:
-            self.fields['meter'].initial = Meter.objects.first()
+            self.fields['meter'].initial = first_meter_choice()
         except (OperationalError, ProgrammingError):
             pass
 
@@ -279,9 +244,9 @@ def count_weeks(start_date, end_date) -> int:
     return total_weeks
 
 
-@require_POST
+@require_http_methods(['GET', 'POST'])
 def select_meter(req):
-    select_meter_form = SelectMeter(req.POST)
+    select_meter_form = SelectMeter(request_data(req))
     if not select_meter_form.is_valid():
         return view_select_meter(req, select_meter_form.errors.as_text())
     meter = select_meter_form.cleaned_data['meter']
@@ -289,16 +254,11 @@ def select_meter(req):
     end_date = select_meter_form.cleaned_data['end_date']
     if start_date > end_date:
         start_date, end_date = end_date, start_date
-    start_date_midnight = (pd.to_datetime(start_date)
-                           .tz_localize(tz=TIME_ZONE, ambiguous=False))
-    end_date_next_midnight = (pd.to_datetime(end_date + pd.Timedelta(days=1))
-                              .tz_localize(tz=TIME_ZONE, ambiguous=False))
-    usage = Usage.objects.filter(
-        meter=meter, time_slot__gte=start_date_midnight,
-        time_slot__lt=end_date_next_midnight, value__isnull=False,
-    ).order_by('time_slot').values('time_slot', 'value')
-    usage = pd.DataFrame.from_records(usage)
-    usage['time_slot'] = usage['time_slot'].dt.tz_convert(tz=TIME_ZONE)
+    validators = page_validators(req, *usage_version(meter))
+    if response := not_modified(req, validators):
+        return response
+    time_slot, value = load_usage(meter, start_date, end_date)
+    usage = pd.DataFrame({'time_slot': time_slot, 'value': value})
 
     line = pyecharts.charts.Line(init_opts=pyecharts.options.InitOpts(width="100%"))
     line.add_xaxis(usage['time_slot'].dt.strftime("%Y-%m-%d %H:%M").tolist())
@@ -389,17 +349,129 @@ def select_meter(req):
     tab.add(heatmap, "Calendar view")
     tab.add(bar, "Circadian view")
     tab.add(total, "Total view")
-    htm = tab.render_embed()
-
-    tree = BeautifulSoup(htm, 'html.parser')
-    tab_tag = tree.find('div', class_='tab')
-    back_tag = tree.new_tag(
-        'a', href='/meters',
-        style='font-family: "Helvetica Neue", Helvetica, Arial, sans-serif; '
-              'padding: 10px; '
+    with stage('render'):
+        htm = tab.render_embed()
+
+    with stage('soup'):
+        tree = BeautifulSoup(htm, 'html.parser')
+        tab_tag = tree.find('div', class_='tab')
+        back_tag = tree.new_tag(
+            'a', href='/meters',
+            style='font-family: "Helvetica Neue", Helvetica, Arial, sans-serif; '
+                  'padding: 10px; '
+        )
+        back_tag.string = 'Back'
+        if tab_tag:
+            tab_tag.insert_before(back_tag)
+        htm = str(tree)
+
+    return set_validators(HttpResponse(htm), validators)
+
+
+class ChangeMeterGroup(forms.ModelForm):
+    class Meta:
+        model = MeterGroup
+        fields = ['name', 'meters']
+        widgets = {
+            "name": forms.TextInput({"class": "form-control"}),
+            "meters": forms.SelectMultiple({'style': 'display: block; width: 100%;',
+                                            'size': '5', 'class': 'form-control'}),
+        }
+        help_texts = {
+            "meters": "Hold \"Control\" and click to select multiple items.",
+        }
+
+
+def view_meter_groups(req, failed_reason=None):
+    return render(req, 'meter_groups.html', context={
+        "groups": MeterGroup.objects.prefetch_related('meters'),
+        "group_form": ChangeMeterGroup(),
+        "failed_reason": failed_reason,
+    })
+
+
+@require_POST
+def add_meter_group(req):
+    group_form = ChangeMeterGroup(req.POST)
+    if not group_form.is_valid():
+        return view_meter_groups(req, failed_reason=group_form.errors.as_text())
+    group_form.save()
+    return redirect("/meter_groups")
+
+
+def delete_meter_group(req, group_id: int):
+    MeterGroup.objects.filter(id=group_id).delete()
+    return redirect("/meter_groups")
+
+
+class ExportUsage(forms.Form):
+    meter = MeterOrGroupField(
+        required=True,
+        widget=forms.Select({"class": "form-select", "style": "white-space: normal;"})
+    )
+    start_date = forms.DateField(
+        required=True, widget=forms.DateInput({
+            "class": "form-control", "type": "date", "min": "1996-01-01"}),
     )
-    back_tag.string = 'Back'
-    if tab_tag:
-        tab_tag.insert_before(back_tag)
+    end_date = forms.DateField(
+        required=True, widget=forms.DateInput({
+            "class": "form-control", "type": "date", "min": "1996-01-01"}),
+    )
+    format = forms.ChoiceField(
+        required=True, choices=[('csv', "CSV"), ('parquet', "Parquet")],
+        widget=forms.Select({"class": "form-select"}),
+        help_text="Parquet needs pyarrow installed.",
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        try:
+            self.fields['meter'].initial = first_meter_choice()
+        except (OperationalError, ProgrammingError):
+            pass
+
+    def clean_format(self):
+        file_format = self.cleaned_data['format']
+        if file_format == 'parquet' and not parquet_available():
+            raise forms.ValidationError(
+                "Parquet needs pyarrow. Install it by \"pip install pyarrow\".")
+        return file_format
+
+
+def view_export(req, failed_reason=None):
+    return render(req, "export.html", context={
+        "export_form": ExportUsage(),
+        "failed_reason": failed_reason,
+    })
 
-    return HttpResponse(str(tree))
+
+async def _iterate_in_thread(iterator):
+    """
+    Serve a sync iterator under ASGI without reading all of it first, which Django does
+    to the sync iterator of StreamingHttpResponse. Its queries are in the thread of the
+    request, like the other sync_to_async calls of it.
+    """
+    iterator = iter(iterator)
+    while (part := await sync_to_async(next)(iterator, None)) is not None:
+        yield part
+
+
+@require_GET
+def export_usage(req):
+    export_form = ExportUsage(req.GET)
+    if not export_form.is_valid():
+        return view_export(req, failed_reason=export_form.errors.as_text())
+    meter = export_form.cleaned_data['meter']
+    start_date = export_form.cleaned_data['start_date']
+    end_date = export_form.cleaned_data['end_date']
+    file_format = export_form.cleaned_data['format']
+    if start_date > end_date:
+        start_date, end_date = end_date, start_date
+    content_type, _, to_bytes = FORMATS[file_format]
+    content = to_bytes(usage_chunks(meter, start_date, end_date))
+    if isinstance(req, ASGIRequest):
+        content = _iterate_in_thread(content)
+    filename = export_filename(meter, start_date, end_date, file_format)
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
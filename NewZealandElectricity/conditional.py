@@ -0,0 +1,75 @@
+"""
+HTTP conditional requests for the pages computed from the usage and the plans.
+
+A page's strong ETag is a digest of its URL, its parameters, and the versions of the
+data it's computed from, i.e. Meter.data_version and ChargingPlan.data_version. So a
+client which has the page gets 304 Not Modified before the page is computed again.
+The pages are sent with "Cache-Control: private, no-cache", so browsers keep them and
+revalidate them on each view. Browsers don't revalidate the responses to POST, so the
+forms of these pages are sent with GET.
+"""
+import hashlib
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+# Not parameters of the page.
+IGNORED_PARAMETERS = {'csrfmiddlewaretoken'}
+
+
+class Validators(NamedTuple):
+    etag: str
+    last_modified: Optional[object]  # Aware datetime
+
+
+def request_data(req):
+    """
+    :return: The parameters of the form, in the query string of GET, or the body of
+        POST.
+    """
+    return req.GET if req.method in ('GET', 'HEAD') else req.POST
+
+
+def page_validators(req, versions, last_modified=None) -> Validators:
+    """
+    :param versions: What the page is computed from besides its parameters, which repr
+        describes. E.g. a list of (Meter id, data_version).
+    :param last_modified: The latest data_modified of the data.
+    """
+    parameters = sorted((key, value) for key, values in request_data(req).lists()
+                        if key not in IGNORED_PARAMETERS for value in values)
+    digest = hashlib.sha256(repr(
+        [settings.PAGE_VERSION, req.path, parameters, versions]).encode()).hexdigest()
+    return Validators(f'"{digest[:32]}"', last_modified)
+
+
+def not_modified(req, validators):
+    """
+    :return: 304 Not Modified if the client has the page, 412 Precondition Failed if
+        the client's precondition doesn't hold, or None to compute the page.
+    """
+    if req.method not in ('GET', 'HEAD'):
+        return None
+    last_modified = validators.last_modified
+    # The headers of the page, which 304 keeps.
+    page = set_validators(HttpResponse(), validators)
+    response = get_conditional_response(
+        req, etag=validators.etag,
+        last_modified=last_modified and int(last_modified.timestamp()), response=page)
+    return None if response is page else response
+
+
+def set_validators(response, validators):
+    """
+    :return: response, with the ETag and Last-Modified headers if it's successful.
+    """
+    if response.status_code == 200:
+        response.headers['ETag'] = validators.etag
+        if validators.last_modified:
+            response.headers['Last-Modified'] = http_date(
+                validators.last_modified.timestamp())
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
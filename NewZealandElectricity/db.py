@@ -0,0 +1,77 @@
+"""
+Let the pages read SQLite while usage is being written.
+
+settings.DATABASES has the OPTIONS of settings.SQLITE_OPTIONS: every new SQLite
+connection runs the pragmas of settings.SQLITE_PRAGMAS, and transactions begin
+IMMEDIATE. In WAL journal mode, readers see the last committed data instead of waiting
+for the writer, and a writer waits busy_timeout for the lock instead of failing with
+"database is locked". SQLite allows one writer at a time, so the writers of every
+process queue on the lock of the database when they begin their transaction.
+
+UsageRouter keeps the usage, and the other time series written in bulk, in their own
+database if settings.DATABASES has a USAGE_DB, so writing, backing up or vacuuming
+them does not lock the plans, sessions and auth tables.
+"""
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, router, transaction
+
+
+@contextmanager
+def write_transaction(model=None):
+    """
+    transaction.atomic on the database of model, which begins after the other writers
+    to that database have finished. Keep the block short, as reads are not blocked but
+    other writes are.
+
+    :param model: Whose database to write. None means the default database.
+    """
+    using = router.db_for_write(model) if model is not None else DEFAULT_DB_ALIAS
+    with transaction.atomic(using=using):
+        yield
+
+
+USAGE_DB = 'usage'
+# Read only connection to the same database, if configured.
+USAGE_REPLICA_DB = 'usage_replica'
+# Their foreign keys have no database constraint, and related rows are deleted by
+# signals, as they may be in another database than the referenced rows.
+USAGE_MODELS = {'Meter.usage', 'Plan.dailycost', 'Plan.seriesprice'}
+
+
+class UsageRouter:
+    """
+    Write USAGE_MODELS to USAGE_DB, and read them from USAGE_REPLICA_DB, except in a
+    transaction of USAGE_DB which must see its own writes. Other models stay in the
+    default database. Nothing is routed if USAGE_DB is not configured.
+    """
+    @staticmethod
+    def routed(model):
+        return (USAGE_DB in settings.DATABASES
+                and model._meta.label_lower in USAGE_MODELS)
+
+    def db_for_read(self, model, **hints):
+        if not self.routed(model):
+            return None
+        if (USAGE_REPLICA_DB in settings.DATABASES
+                and not connections[USAGE_DB].in_atomic_block):
+            return USAGE_REPLICA_DB
+        return USAGE_DB
+
+    def db_for_write(self, model, **hints):
+        return USAGE_DB if self.routed(model) else None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if self.routed(obj1) or self.routed(obj2):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if USAGE_DB not in settings.DATABASES:
+            return None
+        if db == USAGE_REPLICA_DB:
+            return False
+        if model_name is None:
+            return db != USAGE_DB
+        return (f"{app_label}.{model_name}" in USAGE_MODELS) == (db == USAGE_DB)
@@ -0,0 +1,213 @@
+"""
+Counters and histograms kept in the process, served at /metrics in the Prometheus text
+format.
+
+The values are per process, and start from zero when it starts. Prometheus sees a
+restart as a counter reset, which rate() allows for. Run one process, or scrape each
+of them, for the totals.
+"""
+import bisect
+import threading
+import time
+from abc import ABC, abstractmethod
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.http import HttpResponse
+
+REGISTRY = []
+# Like the Prometheus client libraries. Unit: second
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0,
+                   7.5, 10.0)
+
+
+def _float(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+def _escape(value, quote=True) -> str:
+    value = str(value).replace('\\', r'\\').replace('\n', r'\n')
+    return value.replace('"', r'\"') if quote else value
+
+
+def _label_text(labels) -> str:
+    labels = list(labels)
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+class _Metric(ABC):
+    type = None
+    # Added to the name in the exposition.
+    suffix = ''
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        """
+        :param labelnames: Names of the labels, whose values are given to each update.
+        :param registry: Where exposition finds the metric.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}  # Label values: value
+        registry.append(self)
+
+    def _key(self, labels) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} has the labels {self.labelnames}, "
+                             f"but got {tuple(labels)}.")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    @abstractmethod
+    def _samples(self):
+        """
+        :return: Generator of (suffix, labels, value), where labels are (name, value).
+        """
+
+    def exposition(self) -> str:
+        name = self.name + self.suffix
+        lines = [f"# HELP {name} {_escape(self.documentation, quote=False)}",
+                 f"# TYPE {name} {self.type}"]
+        with self._lock:
+            samples = list(self._samples())
+        lines += [f"{name}{suffix}{_label_text(labels)} {_float(value)}"
+                  for suffix, labels, value in samples]
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    type = 'counter'
+    suffix = '_total'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        values = self._values
+        if not self.labelnames and not values:
+            values = {(): 0}
+        for key, value in values.items():
+            yield '', zip(self.labelnames, key), value
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY,
+                 buckets=DEFAULT_BUCKETS):
+        """
+        :param buckets: Upper bounds of the buckets, ascending. +Inf is added.
+        """
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[i] += 1
+            self._values[key] = counts, total + value
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def _samples(self):
+        for key, (counts, total) in self._values.items():
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float('inf')), counts):
+                cumulative += count
+                yield '_bucket', [*labels, ('le', _float(bound))], cumulative
+            yield '_sum', labels, total
+            yield '_count', labels, cumulative
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start_time, **self.labels)
+
+
+def exposition(registry=REGISTRY) -> str:
+    return ''.join(metric.exposition() + '\n' for metric in registry)
+
+
+UPSTREAM_REQUEST_DURATION = Histogram(
+    'contact_energy_upstream_request_duration_seconds',
+    "Time of the requests to the Contact Energy API.", ['endpoint', 'status'])
+DAYS_FETCHED = Counter(
+    'contact_energy_days_fetched', "Days of usage fetched from Contact Energy and "
+                                   "saved.")
+DAYS_FAILED = Counter(
+    'contact_energy_days_failed', "Days of usage failed to fetch from Contact Energy.",
+    ['reason'])
+USAGE_ROWS_WRITTEN = Counter(
+    'usage_rows_written', "Rows of usage written by the Contact Energy pipeline.")
+RATE_LIMIT_WAIT = Histogram(
+    'contact_energy_rate_limit_wait_seconds',
+    "Time waited between requests to the Contact Energy API.",
+    buckets=(0.7, 0.8, 0.9, 1.0, 1.1, 1.2, 1.3))
+USAGE_CACHE_REQUESTS = Counter(
+    'usage_cache_requests', "Reads of the usage of a meter, by whether the usage cache "
+                            "had them.", ['result'])
+USAGE_CACHE_EVICTIONS = Counter(
+    'usage_cache_evictions', "Entries evicted from the usage cache to keep it within "
+                             "USAGE_CACHE_BYTES.")
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', "Time of the responses of this application.",
+    ['route', 'method', 'status'])
+
+
+class MetricsMiddleware:
+    """
+    Observe REQUEST_DURATION. The route is the URL pattern, so the label has a value for
+    each pattern, not each URL. It's async under ASGI, so async views aren't run in a
+    thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start_time = time.perf_counter()
+        response = self.get_response(request)
+        self.observe(request, response, start_time)
+        return response
+
+    async def __acall__(self, request):
+        start_time = time.perf_counter()
+        response = await self.get_response(request)
+        self.observe(request, response, start_time)
+        return response
+
+    @staticmethod
+    def observe(request, response, start_time):
+        match = request.resolver_match
+        REQUEST_DURATION.observe(
+            time.perf_counter() - start_time,
+            route='/' + match.route if match else 'unmatched', method=request.method,
+            status=response.status_code)
+
+
+def metrics(req):
+    return HttpResponse(exposition(),
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
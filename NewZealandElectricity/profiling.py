@@ -0,0 +1,238 @@
+"""
+Opt-in profiling of requests by stages.
+
+When settings.PROFILING is set, ProfilingMiddleware times each request, and the
+views mark their stages with "with stage('name') as s", calling s.count(n) with the
+rows they processed, and s.cache(hit) for each read of a cache. The wall time, and the
+number and time of SQL queries in every database, are recorded for each stage. They are
+sent in the Server-Timing header, and the last PROFILING_RECENT requests are shown by
+recent_requests.
+
+A stage includes the stages nested in it, and the stages of the same name in a
+request are added up. Without the middleware, stage does nothing.
+"""
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.shortcuts import render
+from django.utils import timezone
+
+_current_profile = ContextVar('current_profile', default=None)
+_recent_lock = threading.Lock()
+_recent = deque(maxlen=settings.PROFILING_RECENT)
+
+
+class Stage:
+    """
+    Totals of the stages of a name in a request. Unit of time: second
+    """
+    __slots__ = ('name', 'depth', 'wall_time', 'sql_count', 'sql_time', 'rows',
+                 'cache_hits', 'cache_reads')
+
+    def __init__(self, name, depth=0):
+        self.name = name
+        self.depth = depth
+        self.wall_time = 0.0
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.rows = None
+        self.cache_hits = 0
+        self.cache_reads = 0
+
+    def count(self, rows):
+        """
+        Add to the rows processed in the stage.
+        """
+        self.rows = (self.rows or 0) + rows
+
+    def cache(self, hit: bool):
+        """
+        Count a read of a cache in the stage.
+        """
+        self.cache_hits += hit
+        self.cache_reads += 1
+
+    @property
+    def wall_ms(self):
+        return self.wall_time * 1000
+
+    @property
+    def sql_ms(self):
+        return self.sql_time * 1000
+
+    def server_timing(self) -> str:
+        description = f"{self.sql_count} queries in {self.sql_ms:.1f}ms"
+        if self.cache_reads:
+            description += f", {self.cache_hits}/{self.cache_reads} cache hits"
+        if self.rows is not None:
+            description += f", {self.rows} rows"
+        return f'{self.name};dur={self.wall_ms:.1f};desc="{description}"'
+
+
+class _NullStage:
+    def count(self, rows):
+        pass
+
+    def cache(self, hit):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class Profile:
+    def __init__(self, method, path):
+        self.method = method
+        self.path = path
+        self.created = timezone.now()
+        self.status = None
+        self.total = Stage('total')
+        self.stages = {}  # Name: Stage, in the order they started.
+        self.open_stages = [self.total]
+
+    def query(self, duration):
+        for open_stage in self.open_stages:
+            open_stage.sql_count += 1
+            open_stage.sql_time += duration
+
+    @property
+    def other(self) -> Stage:
+        """
+        The time of the request out of the outermost stages, e.g. validating forms
+        and building charts.
+        """
+        other = Stage('other')
+        outermost = [s for s in self.stages.values() if s.depth == 1]
+        other.wall_time = self.total.wall_time - sum(s.wall_time for s in outermost)
+        other.sql_count = self.total.sql_count - sum(s.sql_count for s in outermost)
+        other.sql_time = self.total.sql_time - sum(s.sql_time for s in outermost)
+        return other
+
+    def server_timing(self) -> str:
+        return ', '.join(s.server_timing() for s in
+                         [*self.stages.values(), self.other, self.total])
+
+
+@contextmanager
+def stage(name):
+    """
+    Time a stage of the current request, if it is profiled.
+
+    :param name: A token of letters, digits and underscores, like "usage".
+    :return: The Stage, whose count method adds the rows processed.
+    """
+    profile = _current_profile.get()
+    if profile is None:
+        yield _NULL_STAGE
+        return
+    current_stage = profile.stages.get(name)
+    if current_stage in profile.open_stages:
+        # Nested in a stage of the same name, which already times it.
+        yield current_stage
+        return
+    if current_stage is None:
+        current_stage = Stage(name, len(profile.open_stages))
+        profile.stages[name] = current_stage
+    profile.open_stages.append(current_stage)
+    start_time = time.perf_counter()
+    try:
+        yield current_stage
+    finally:
+        current_stage.wall_time += time.perf_counter() - start_time
+        profile.open_stages.remove(current_stage)
+
+
+def _time_queries(profile):
+    def wrapper(execute, sql, params, many, context):
+        start_time = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            profile.query(time.perf_counter() - start_time)
+    return wrapper
+
+
+def _time_all_queries(stack, profile):
+    """
+    Time the queries of the connections of the current thread, until stack is closed.
+    """
+    for alias in connections:
+        stack.enter_context(connections[alias].execute_wrapper(_time_queries(profile)))
+
+
+class ProfilingMiddleware:
+    """
+    Put it first in MIDDLEWARE, so the time of the other middleware is included. It's
+    async under ASGI, so async views aren't run in a thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        profile = Profile(request.method, request.path)
+        token = _current_profile.set(profile)
+        start_time = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                _time_all_queries(stack, profile)
+                response = self.get_response(request)
+        finally:
+            profile.total.wall_time = time.perf_counter() - start_time
+            _current_profile.reset(token)
+        return self.finish(profile, response)
+
+    async def __acall__(self, request):
+        profile = Profile(request.method, request.path)
+        token = _current_profile.set(profile)
+        start_time = time.perf_counter()
+        try:
+            # The queries of a request under ASGI are run by sync_to_async in the
+            # thread of the request, whose connections aren't the event loop's.
+            stack = ExitStack()
+            await sync_to_async(_time_all_queries)(stack, profile)
+            try:
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(stack.close)()
+        finally:
+            profile.total.wall_time = time.perf_counter() - start_time
+            _current_profile.reset(token)
+        return self.finish(profile, response)
+
+    @staticmethod
+    def finish(profile, response):
+        profile.status = response.status_code
+        response['Server-Timing'] = profile.server_timing()
+        with _recent_lock:
+            _recent.appendleft(profile)
+        return response
+
+
+def recent_requests(req):
+    # Meter imports stage from this module.
+    from Meter.usage_cache import usage_cache
+
+    with _recent_lock:
+        profiles = list(_recent)
+    return render(req, 'profiling.html', context={
+        'enabled': settings.PROFILING,
+        'usage_cache': usage_cache,
+        'profiles': [(profile, [*profile.stages.values(), profile.other])
+                     for profile in profiles],
+    })
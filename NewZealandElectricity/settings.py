@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 import json
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -45,6 +46,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'NewZealandElectricity.profiling.ProfilingMiddleware',
+    'NewZealandElectricity.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -54,6 +57,19 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Time the stages of each request, and their SQL queries, in the Server-Timing header
+# and at /profiling, which keeps the last PROFILING_RECENT requests.
+PROFILING = False
+PROFILING_RECENT = 100
+
+# Size of the usage kept in each process for the pages reading the same meter and range
+# again. See Meter.usage_cache. 0 disables it. Unit: byte
+USAGE_CACHE_BYTES = 64 * 1024 * 1024
+
+# Part of the ETags of the pages computed from the usage and the plans. Change it when
+# a release changes these pages, so the browsers don't keep showing the old ones.
+PAGE_VERSION = 1
+
 ROOT_URLCONF = 'NewZealandElectricity.urls'
 
 TEMPLATES = [
@@ -79,13 +95,65 @@ WSGI_APPLICATION = 'NewZealandElectricity.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# Run on every new SQLite connection. WAL lets the pages read while usage is written,
+# and a writer waits busy_timeout (ms) for the lock instead of failing. mmap_size is in
+# bytes, and a negative cache_size is in KiB.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'busy_timeout': 5000,
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,
+}
+SQLITE_INIT_COMMAND = ';'.join(f"PRAGMA {name} = {value}"
+                               for name, value in SQLITE_PRAGMAS.items())
+# A transaction takes the write lock when it begins, so one which reads before it
+# writes waits busy_timeout for the other writers, instead of failing when its read
+# is older than their commits.
+SQLITE_OPTIONS = {
+    'transaction_mode': 'IMMEDIATE',
+    'init_command': SQLITE_INIT_COMMAND,
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': SQLITE_OPTIONS,
     }
 }
 
+# Set to a file to keep the usage, the ledger and the price series in their own
+# database (see NewZealandElectricity.db.UsageRouter), then run
+# "python manage.py migrate --database usage" and "python manage.py move_usage".
+USAGE_DATABASE = None
+# Read the usage database through another, read only, connection.
+USAGE_REPLICA = False
+if USAGE_DATABASE:
+    DATABASES['usage'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': USAGE_DATABASE,
+        'OPTIONS': SQLITE_OPTIONS,
+    }
+    if USAGE_REPLICA:
+        DATABASES['usage_replica'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': f"file:{USAGE_DATABASE}?mode=ro",
+            # Read only, so it never begins a write transaction.
+            'OPTIONS': {'init_command': SQLITE_INIT_COMMAND},
+            'TEST': {'MIRROR': 'usage'},
+        }
+elif sys.argv[1:2] == ['test']:
+    # A file, as the connections of an in-memory database share its locks. The tests
+    # which override DATABASE_ROUTERS with UsageRouter write the usage to it.
+    DATABASES['usage'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'test_usage.sqlite3',
+        'OPTIONS': SQLITE_OPTIONS,
+        'TEST': {'NAME': BASE_DIR / 'test_usage.sqlite3'},
+    }
+DATABASE_ROUTERS = ['NewZealandElectricity.db.UsageRouter'] if USAGE_DATABASE else []
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -0,0 +1,474 @@
+import io
+import re
+import subprocess
+import sys
+import threading
+import time
+from contextlib import ExitStack
+from datetime import date, datetime, timedelta, timezone
+
+import pandas as pd
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connections, router
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+
+from ContactEnergy.models import ContactEnergySession
+from Meter.fields import meter_choice
+from Meter.labels import invalidate_meter_index
+from Meter.models import MeterGroup, Usage
+from Meter.synthetic import create_synthetic_meters
+from Meter.usage import load_usage
+from Meter.usage_cache import usage_cache
+from NewZealandElectricity.db import USAGE_DB, write_transaction
+from NewZealandElectricity.metrics import Counter, Histogram, _Metric, exposition
+from Plan.ledger import plan_versions, read_ledger
+from Plan.models import DailyCost, Price, PriceSeries, SeriesPrice
+from Plan.synthetic import create_synthetic_plans
+
+# Only imported by the views that use them. See NewZealandElectricity.urls.
+LAZY_MODULES = ['numpy', 'pandas', 'scipy', 'pyecharts', 'bs4', 'requests',
+                'httpx', 'pyarrow']
+# Total import time of "manage.py check". Unit: second
+IMPORT_TIME_BUDGET = 1.5
+
+
+def route_usage():
+    """
+    Route USAGE_MODELS to USAGE_DB, which settings declares as a test database. Used
+    as a decorator or a context manager.
+    """
+    return override_settings(DATABASE_ROUTERS=['NewZealandElectricity.db.UsageRouter'])
+
+
+class ImportTimeTest(SimpleTestCase):
+    """
+    Management commands must start without the analytics and chart libraries.
+    """
+    def test_check_import_time(self):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', 'manage.py', 'check'],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, check=True)
+        # Lines of "import time: self [us] | cumulative | imported package"
+        imports = re.findall(r'^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$',
+                             result.stderr, re.MULTILINE)
+        self.assertTrue(imports, result.stderr)
+        modules = {name for _, _, _, name in imports}
+        self.assertEqual([m for m in LAZY_MODULES if m in modules], [])
+
+        total = sum(int(self_time) for self_time, _, _, _ in imports) / 1e6
+        slowest = sorted(((int(cumulative), name) for _, cumulative, indent, name
+                          in imports if not indent), reverse=True)[:10]
+        report = ', '.join(f"{name} {cumulative / 1000:.0f}ms"
+                           for cumulative, name in slowest)
+        self.assertLess(total, IMPORT_TIME_BUDGET, f"Slowest imports: {report}")
+
+
+class QueryBudgetTest(TestCase):
+    """
+    SQL queries of each page, counted in every database. There are several meters and
+    plans, so a query for each of them, e.g. Meter.__str__ getting its content_object,
+    exceeds the budget. The meter index is built in each request, as after a meter
+    changes.
+    """
+    databases = '__all__'
+    end_date = date(2024, 6, 30)
+    start_date = end_date - timedelta(days=13)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.meters = create_synthetic_meters(4, cls.start_date, cls.end_date, seed=0)
+        cls.plans = create_synthetic_plans(3, 4, cls.start_date, seed=0)
+        MeterGroup.objects.create(name="Home").meters.set(cls.meters[:2])
+        ContactEnergySession.objects.create(meter=cls.meters[0].content_object,
+                                            total_dates=10)
+        cls.usage_range = {'meter': meter_choice(cls.meters[0]),
+                           'start_date': cls.start_date, 'end_date': cls.end_date}
+
+    def queries(self, path, data=None) -> list:
+        """
+        :return: SQL of the queries of a request, as after a meter changes.
+        """
+        invalidate_meter_index()
+        usage_cache.clear()
+        with ExitStack() as stack:
+            contexts = [stack.enter_context(CaptureQueriesContext(connections[alias]))
+                        for alias in connections]
+            if data is None:
+                response = self.client.get(path)
+            else:
+                response = self.client.post(path, data)
+        self.assertEqual(response.status_code, 200)
+        return [query['sql'] for context in contexts
+                for query in context.captured_queries]
+
+    def assertQueryBudget(self, budget, path, data=None):
+        queries = self.queries(path, data)
+        self.assertLessEqual(len(queries), budget, '\n'.join(queries))
+
+    def pages(self) -> list:
+        """
+        :return: (budget, path, data) of the pages which list meters or plans.
+        """
+        return [(0, '/', None), (1, '/plans', None),
+                (4, f'/plans/{self.plans[0].id}', None), (5, '/meters', None),
+                (8, '/meter_groups', None), (5, '/migrate_meters', None),
+                (5, '/integrity', None), (5, '/export', None), (6, '/compare', None),
+                (6, '/scenarios', None), (8, '/sweep', None),
+                (0, '/get_data_contact', None), (7, '/select_meter', self.usage_range),
+                (7, '/integrity/check', self.usage_range)]
+
+    def test_pages(self):
+        for budget, path, data in self.pages():
+            with self.subTest(path=path):
+                self.assertQueryBudget(budget, path, data)
+
+    def test_more_meters(self):
+        # The same queries, however many meters, groups and plans there are, so a query
+        # for each of them fails even if it is within the budget.
+        counts = {path: len(self.queries(path, data)) for _, path, data in self.pages()}
+        meters = create_synthetic_meters(6, self.end_date, self.end_date, seed=1)
+        MeterGroup.objects.create(name="Office").meters.set(meters[:3])
+        MeterGroup.objects.create(name="Shop").meters.set(meters[3:])
+        create_synthetic_plans(5, 4, self.start_date, seed=1)
+        for _, path, data in self.pages():
+            with self.subTest(path=path):
+                queries = self.queries(path, data)
+                self.assertEqual(len(queries), counts[path], '\n'.join(queries))
+
+    def test_compare(self):
+        data = {**self.usage_range, 'plans': [plan.id for plan in self.plans],
+                'billing_day': 1, 'follow_versions': 'on', 'engine': 'ledger',
+                'resamples': 0}
+        # Building the ledger, then reading it.
+        self.assertQueryBudget(24, '/compare/action', data)
+        self.assertQueryBudget(9, '/compare/action', data)
+
+    def test_progress(self):
+        self.assertQueryBudget(4, '/get_data_contact/progress', {
+            'account_and_contract': self.meters[0].meter_id,
+            'start_date': self.start_date, 'end_date': self.end_date})
+
+
+class ProfilingTest(TestCase):
+    databases = '__all__'
+    end_date = date(2024, 6, 30)
+
+    @classmethod
+    def setUpTestData(cls):
+        meter = create_synthetic_meters(1, cls.end_date - timedelta(days=6), cls.end_date,
+                                        seed=0)[0]
+        cls.usage_range = {'meter': meter_choice(meter),
+                           'start_date': cls.end_date - timedelta(days=6),
+                           'end_date': cls.end_date}
+
+    def test_off(self):
+        response = self.client.post('/select_meter', self.usage_range)
+        self.assertNotIn('Server-Timing', response)
+
+    def timings(self):
+        response = self.client.post('/select_meter', self.usage_range)
+        # Descriptions are quoted, and may have commas.
+        return {metric.split(';')[0]: metric for metric in
+                re.split(r', (?=\w+;dur=)', response['Server-Timing'])}
+
+    @override_settings(PROFILING=True)
+    def test_stages(self):
+        usage_cache.clear()
+        timings = self.timings()
+        self.assertEqual(list(timings), ['usage', 'render', 'soup', 'other', 'total'])
+        # 7 days of half-hourly usage.
+        self.assertIn('1 queries in', timings['usage'])
+        self.assertIn(', 0/1 cache hits, 336 rows"', timings['usage'])
+        self.assertRegex(timings['total'], r'^total;dur=\d+\.\d;desc="\d+ queries in ')
+        # The same meter and range again.
+        timings = self.timings()
+        self.assertIn('"0 queries in', timings['usage'])
+        self.assertIn(', 1/1 cache hits, 336 rows"', timings['usage'])
+
+        response = self.client.get('/profiling')
+        self.assertContains(response, 'POST /select_meter')
+        self.assertContains(response, '336 rows')
+        self.assertContains(response, '1/1 cache hits')
+
+
+class MetricsTest(TestCase):
+    def test_exposition(self):
+        registry = []
+        counter = Counter('days', "Days.", ['reason'], registry=registry)
+        histogram = Histogram('wait_seconds', "Wait.", registry=registry,
+                              buckets=(0.5, 1.0))
+        counter.inc(reason='empty')
+        counter.inc(2, reason='say "no"')
+        for value in [0.2, 0.5, 0.7, 3]:
+            histogram.observe(value)
+        self.assertEqual(exposition(registry), '\n'.join([
+            '# HELP days_total Days.',
+            '# TYPE days_total counter',
+            'days_total{reason="empty"} 1.0',
+            'days_total{reason="say \\"no\\""} 2.0',
+            '# HELP wait_seconds Wait.',
+            '# TYPE wait_seconds histogram',
+            'wait_seconds_bucket{le="0.5"} 2.0',
+            'wait_seconds_bucket{le="1.0"} 3.0',
+            'wait_seconds_bucket{le="+Inf"} 4.0',
+            'wait_seconds_sum 4.4',
+            'wait_seconds_count 4.0',
+        ]) + '\n')
+        with self.assertRaises(ValueError):
+            counter.inc()
+
+    def test_samples_required(self):
+        class Gauge(_Metric):
+            type = 'gauge'
+
+        registry = []
+        with self.assertRaises(TypeError):
+            Gauge('temperature', "Temperature.", registry=registry)
+        self.assertEqual(registry, [])
+
+    def test_view_latency(self):
+        self.client.get('/plans')
+        response = self.client.get('/metrics')
+        self.assertEqual(response['Content-Type'],
+                         'text/plain; version=0.0.4; charset=utf-8')
+        self.assertRegex(response.content.decode(), r'\nhttp_request_duration_seconds_count'
+                         r'\{route="/plans",method="GET",status="200"\} [1-9]')
+        self.assertContains(response, '\ncontact_energy_days_fetched_total ')
+
+
+class ConditionalTest(TestCase):
+    """
+    Pages are revalidated by their ETags, which change with the usage and the plans.
+    """
+    databases = '__all__'
+    end_date = date(2024, 6, 30)
+    start_date = end_date - timedelta(days=6)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.meter = create_synthetic_meters(1, cls.start_date, cls.end_date, seed=0)[0]
+        cls.plans = create_synthetic_plans(2, 2, cls.start_date, seed=0)
+        cls.usage_range = {'meter': meter_choice(cls.meter),
+                           'start_date': cls.start_date, 'end_date': cls.end_date}
+
+    def assertRevalidated(self, path, data, change):
+        response = self.client.get(path, data)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+
+        response = self.client.get(path, data, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+        change()
+        response = self.client.get(path, data, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def save_usage(self):
+        from ContactEnergy.views import save_usage
+        save_usage(self.meter, pd.Timestamp(self.end_date),
+                   [{'date': '2024-06-30T00:00:00+12:00', 'value': '2.5'}])
+
+    def test_select_meter(self):
+        self.assertRevalidated('/select_meter', self.usage_range, self.save_usage)
+
+    def test_check_integrity(self):
+        self.assertRevalidated('/integrity/check', self.usage_range, self.save_usage)
+
+    def test_compare(self):
+        def change_price():
+            price = Price.objects.filter(plan=self.plans[0]).first()
+            price.unit_price += 1
+            price.save()
+
+        data = {**self.usage_range, 'plans': [plan.id for plan in self.plans],
+                'billing_day': 1, 'follow_versions': 'on', 'engine': 'ledger',
+                'resamples': 0}
+        self.assertRevalidated('/compare/action', data, change_price)
+        self.assertRevalidated('/compare/action', data, self.save_usage)
+
+    def test_post(self):
+        # Not revalidated, like before.
+        response = self.client.post('/select_meter', self.usage_range,
+                                    headers={'If-None-Match': '*'})
+        self.assertEqual(response.status_code, 200)
+
+
+class AsyncViewTest(TestCase):
+    """
+    The Contact Energy views are async, and so is the middleware before them under ASGI,
+    which AsyncClient is like.
+    """
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        meter = create_synthetic_meters(1, date(2024, 6, 24), date(2024, 6, 30),
+                                        seed=0)[0]
+        cls.session = ContactEnergySession.objects.create(
+            meter=meter.content_object, total_dates=4, finished_dates=1)
+        cls.data = {'account_and_contract': meter.meter_id,
+                    'start_date': '2024-06-24', 'end_date': '2024-06-30'}
+
+    def test_async(self):
+        for path in ['/get_data_contact/auth', '/get_data_contact/usage',
+                     '/get_data_contact/progress']:
+            self.assertTrue(iscoroutinefunction(resolve(path).func), path)
+
+    @override_settings(PROFILING=True)
+    async def test_progress(self):
+        path = '/get_data_contact/progress'
+        response = await self.async_client.get(path, self.data)
+        self.assertEqual(response.json(), {'success': 25, 'failed': 0, 'unhandled': 75})
+        # The queries run by sync_to_async are profiled.
+        self.assertRegex(response['Server-Timing'],
+                         r'total;dur=[\d.]+;desc="[1-9]\d* queries in ')
+
+        response = await self.async_client.get(
+            path, self.data, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+        self.session.finished_dates = 2
+        await self.session.asave()
+        response = await self.async_client.get(path, self.data)
+        self.assertEqual(response.json(), {'success': 50, 'failed': 0, 'unhandled': 50})
+
+        response = await self.async_client.get('/metrics')
+        self.assertContains(response, 'http_request_duration_seconds_count{route='
+                                      '"/get_data_contact/progress",method="GET",'
+                                      'status="304"} ')
+
+    async def test_invalid_login(self):
+        # Rejected before Contact Energy is requested.
+        response = await self.async_client.post('/get_data_contact/auth',
+                                                {'username': 'not an email'})
+        self.assertContains(response, 'Enter a valid email address.')
+
+
+@route_usage()
+class SQLiteOptionsTest(TransactionTestCase):
+    """
+    settings.SQLITE_OPTIONS, on a database file written by several threads.
+    """
+    databases = {DEFAULT_DB_ALIAS, USAGE_DB}
+
+    def test_pragmas(self):
+        # PRAGMA synchronous reads as a number.
+        with connections[USAGE_DB].cursor() as cursor:
+            for name, value in [('journal_mode', 'wal'), ('busy_timeout', 5000),
+                                ('synchronous', 1), ('cache_size', -64 * 1024)]:
+                cursor.execute(f"PRAGMA {name}")
+                self.assertEqual(cursor.fetchone()[0], value)
+
+    def test_concurrent_writers(self):
+        # Each writer reads, then writes what it read. Only transactions which begin
+        # IMMEDIATE wait for each other, the others fail with "database is locked".
+        start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        errors = []
+
+        def write():
+            try:
+                with write_transaction(Usage):
+                    n = Usage.objects.filter(meter_id=1).count()
+                    time.sleep(0.02)
+                    Usage.objects.create(meter_id=1, value=n,
+                                         time_slot=start + timedelta(minutes=30 * n))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=write) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(Usage.objects.values_list('value', flat=True)),
+                         list(range(8)))
+
+
+@route_usage()
+class UsageDatabaseTest(TransactionTestCase):
+    """
+    USAGE_MODELS in their own database. Committed, as move_usage reads the default
+    database from the connection of the usage database.
+    """
+    databases = {DEFAULT_DB_ALIAS, USAGE_DB}
+    start_date = date(2024, 6, 24)
+    end_date = date(2024, 6, 30)
+
+    def setUp(self):
+        usage_cache.clear()
+        invalidate_meter_index()
+
+    def create_rows(self):
+        """
+        :return: (meter, series), with usage, ledger and prices.
+        """
+        meter, = create_synthetic_meters(1, self.start_date, self.end_date, seed=0)
+        plans = create_synthetic_plans(2, 2, self.start_date, seed=0)
+        read_ledger(meter, plan_versions(plans), self.start_date, self.end_date)
+        series = PriceSeries.objects.create(name="HAY2201")
+        SeriesPrice.objects.create(series=series, time_slot=datetime(
+            2024, 6, 24, tzinfo=timezone.utc), unit_price=10)
+        return meter, series
+
+    def counts(self, alias) -> list:
+        return [model.objects.using(alias).count()
+                for model in (Usage, DailyCost, SeriesPrice)]
+
+    def test_routing(self):
+        self.assertEqual(router.db_for_write(Usage), USAGE_DB)
+        self.assertEqual(router.db_for_read(DailyCost), USAGE_DB)
+        self.assertEqual(router.db_for_write(MeterGroup), DEFAULT_DB_ALIAS)
+        meter, _ = self.create_rows()
+        self.assertEqual(self.counts(DEFAULT_DB_ALIAS), [0, 0, 0])
+        self.assertEqual(self.counts(USAGE_DB), [48 * 7, 2 * 7, 1])
+        time_slot, value = load_usage(meter, self.start_date, self.end_date)
+        self.assertEqual(value.shape[0], 48 * 7)
+
+    def test_move_usage(self):
+        # Written before the usage database is configured.
+        with override_settings(DATABASE_ROUTERS=[]):
+            meter, _ = self.create_rows()
+        rows = self.counts(DEFAULT_DB_ALIAS)
+        self.assertNotIn(0, rows)
+        usage = list(Usage.objects.using(DEFAULT_DB_ALIAS).order_by(
+            'time_slot').values_list('time_slot', 'value'))
+        call_command('move_usage', stdout=io.StringIO())
+        self.assertEqual(self.counts(USAGE_DB), rows)
+        self.assertEqual(self.counts(DEFAULT_DB_ALIAS), [0, 0, 0])
+        # Interrupted after copying a row, before deleting it from the default
+        # database.
+        Usage.objects.using(DEFAULT_DB_ALIAS).create(
+            meter=meter, time_slot=usage[0][0], value=usage[0][1])
+        output = io.StringIO()
+        call_command('move_usage', stdout=output)
+        self.assertIn("usages: 0 rows moved", output.getvalue())
+        self.assertEqual(self.counts(USAGE_DB), rows)
+        self.assertEqual(self.counts(DEFAULT_DB_ALIAS), [0, 0, 0])
+        self.assertEqual(list(Usage.objects.order_by('time_slot').values_list(
+            'time_slot', 'value')), usage)
+
+    def assertDeleted(self, alias):
+        meter, series = self.create_rows()
+        self.assertNotIn(0, self.counts(alias))
+        meter.delete()
+        series.delete()
+        self.assertEqual(self.counts(alias), [0, 0, 0])
+
+    def test_delete(self):
+        # The foreign keys have no constraint in either case.
+        with self.subTest(databases=1), override_settings(DATABASE_ROUTERS=[]):
+            self.assertDeleted(DEFAULT_DB_ALIAS)
+        with self.subTest(databases=2):
+            self.assertDeleted(USAGE_DB)
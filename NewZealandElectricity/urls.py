@@ -16,35 +16,71 @@ Including another URLconf
 """
 # from django.contrib import admin
 from django.urls import path
-import ContactEnergy.views as v1
-import Meter.views as v2
-import Plan.views as v3
+from django.utils.module_loading import import_string
+
+
+def lazy(view_path, is_async=False):
+    """
+    Import the view on its first request, so the analytics and chart libraries that
+    the view modules use are not loaded by management commands and system checks.
+
+    :param view_path: Dotted path of the view.
+    :param is_async: Whether the view is a coroutine function. Django runs it in the
+        event loop only if the view in urlpatterns is one too.
+    """
+    if is_async:
+        async def view(request, *args, **kwargs):
+            return await import_string(view_path)(request, *args, **kwargs)
+    else:
+        def view(request, *args, **kwargs):
+            return import_string(view_path)(request, *args, **kwargs)
+    return view
+
 
 urlpatterns = [
     # path('admin/', admin.site.urls),
-    path('get_data_contact', v1.contact_energy_login),
-    path('get_data_contact/auth', v1.contact_energy_auth),
-    path('get_data_contact/account', v1.contact_energy_account),
-    path('get_data_contact/usage', v1.contact_energy_usage),
-    path('get_data_contact/progress', v1.contact_energy_progress),
-    path('', v2.main),
-    path('migrate_meters', v2.view_migrate_meters),
-    path('migrate_meters/migrate', v2.migrate_meters),
-    path('integrity', v2.view_integrity),
-    path('integrity/check', v2.check_integrity),
-    path('plans', v3.view_plans),
-    path('plans/<int:plan_id>', v3.view_change_plan),
-    path('plans/change/<int:plan_id>', v3.change_plan),
-    path('plans/new', v3.view_add_plan),
-    path('plans/add', v3.add_plan),
-    path('plans/delete/<int:plan_id>', v3.delete_plan),
-    path('prices/<int:price_id>', v3.view_change_price),
-    path('prices/change/<int:price_id>', v3.change_price),
-    path('prices/new/<int:plan_id>', v3.view_add_price),
-    path('prices/add', v3.add_price),
-    path('prices/delete/<int:price_id>', v3.delete_price),
-    path('meters', v2.view_select_meter),
-    path('select_meter', v2.select_meter),
-    path('compare', v3.view_compare),
-    path('compare/action', v3.compare),
+    path('get_data_contact', lazy('ContactEnergy.views.contact_energy_login')),
+    path('get_data_contact/auth',
+         lazy('ContactEnergy.views.contact_energy_auth', is_async=True)),
+    path('get_data_contact/account', lazy('ContactEnergy.views.contact_energy_account')),
+    path('get_data_contact/usage',
+         lazy('ContactEnergy.views.contact_energy_usage', is_async=True)),
+    path('get_data_contact/progress',
+         lazy('ContactEnergy.views.contact_energy_progress', is_async=True)),
+    path('', lazy('Meter.views.main')),
+    path('migrate_meters', lazy('Meter.views.view_migrate_meters')),
+    path('migrate_meters/migrate', lazy('Meter.views.migrate_meters')),
+    path('integrity', lazy('Meter.views.view_integrity')),
+    path('integrity/check', lazy('Meter.views.check_integrity')),
+    path('export', lazy('Meter.views.view_export')),
+    path('export/usage', lazy('Meter.views.export_usage')),
+    path('plans', lazy('Plan.views.view_plans')),
+    path('plans/<int:plan_id>', lazy('Plan.views.view_change_plan')),
+    path('plans/change/<int:plan_id>', lazy('Plan.views.change_plan')),
+    path('plans/new', lazy('Plan.views.view_add_plan')),
+    path('plans/add', lazy('Plan.views.add_plan')),
+    path('plans/delete/<int:plan_id>', lazy('Plan.views.delete_plan')),
+    path('prices/<int:price_id>', lazy('Plan.views.view_change_price')),
+    path('prices/change/<int:price_id>', lazy('Plan.views.change_price')),
+    path('prices/new/<int:plan_id>', lazy('Plan.views.view_add_price')),
+    path('prices/add', lazy('Plan.views.add_price')),
+    path('prices/delete/<int:price_id>', lazy('Plan.views.delete_price')),
+    path('tiers/<int:tier_id>', lazy('Plan.views.view_change_tier')),
+    path('tiers/change/<int:tier_id>', lazy('Plan.views.change_tier')),
+    path('tiers/new/<int:plan_id>', lazy('Plan.views.view_add_tier')),
+    path('tiers/add', lazy('Plan.views.add_tier')),
+    path('tiers/delete/<int:tier_id>', lazy('Plan.views.delete_tier')),
+    path('meters', lazy('Meter.views.view_select_meter')),
+    path('meter_groups', lazy('Meter.views.view_meter_groups')),
+    path('meter_groups/add', lazy('Meter.views.add_meter_group')),
+    path('meter_groups/delete/<int:group_id>', lazy('Meter.views.delete_meter_group')),
+    path('select_meter', lazy('Meter.views.select_meter')),
+    path('compare', lazy('Plan.views.view_compare')),
+    path('compare/action', lazy('Plan.views.compare')),
+    path('scenarios', lazy('Plan.views.view_scenarios')),
+    path('scenarios/action', lazy('Plan.views.scenarios')),
+    path('sweep', lazy('Plan.views.view_sweep')),
+    path('sweep/action', lazy('Plan.views.sweep')),
+    path('profiling', lazy('NewZealandElectricity.profiling.recent_requests')),
+    path('metrics', lazy('NewZealandElectricity.metrics.metrics')),
 ]
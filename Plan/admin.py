@@ -1,19 +1,55 @@
 from django.contrib import admin
 
-from Plan.models import ChargingPlan, Price
+from Plan.models import (ChargingPlan, Price, DailyCost, PlanFamily, PriceSeries,
+                         SeriesPrice, PriceTier, FleetReport)
 
 
 # Register your models here.
 @admin.register(ChargingPlan)
 class ChargingPlanAdmin(admin.ModelAdmin):
-    list_display = ['company', 'name', 'applied_date', 'daily_fixed_price',
+    list_display = ['company', 'name', 'family', 'applied_date', 'daily_fixed_price',
                     'GST_ratio', 'levy', 'default_unit_price']
-    list_filter = ['company']
+    list_filter = ['company', 'family']
     search_fields = ['company']
 
+
+@admin.register(PlanFamily)
+class PlanFamilyAdmin(admin.ModelAdmin):
+    search_fields = ['name']
+
+
 @admin.register(Price)
 class PriceAdmin(admin.ModelAdmin):
     list_display = ['plan', 'unit_price'] + Price.DAYS_OF_WEEK + [
-        'time_from', 'time_to']
+        'time_from', 'time_to', 'month_from', 'month_to', 'public_holiday']
     list_filter = ['plan']
     search_fields = ['plan__company', 'plan__name', 'plan__applied_date']
+
+
+@admin.register(PriceTier)
+class PriceTierAdmin(admin.ModelAdmin):
+    list_display = ['plan', 'threshold', 'unit_price']
+    list_filter = ['plan']
+
+
+@admin.register(DailyCost)
+class DailyCostAdmin(admin.ModelAdmin):
+    list_display = ['meter', 'plan', 'date', 'cost', 'cumulative_cost']
+    list_filter = ['plan']
+
+
+@admin.register(PriceSeries)
+class PriceSeriesAdmin(admin.ModelAdmin):
+    search_fields = ['name']
+
+
+@admin.register(SeriesPrice)
+class SeriesPriceAdmin(admin.ModelAdmin):
+    list_display = ['series', 'time_slot', 'unit_price']
+    list_filter = ['series']
+
+
+@admin.register(FleetReport)
+class FleetReportAdmin(admin.ModelAdmin):
+    list_display = ['run', 'meter', 'plan', 'versioned', 'cost', 'rank']
+    list_filter = ['run', 'rank']
@@ -0,0 +1,126 @@
+"""
+Time the hot paths on synthetic data of several sizes, in temporary databases.
+"""
+import os
+import statistics
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+from django.db import connections
+from django.test import Client
+from django.test.utils import (setup_databases, setup_test_environment,
+                               teardown_databases, teardown_test_environment)
+
+from ContactEnergy.views import get_missing_dates_in_usage, save_usage
+from Meter.fields import meter_choice
+from Meter.models import Usage
+from Meter.synthetic import create_synthetic_meters, synthetic_usage
+from NewZealandElectricity.settings import TIME_ZONE
+from .ledger import invalidate_meter
+from .synthetic import create_synthetic_plans
+
+# Days written by each run of the ingestion benchmark.
+INGEST_DAYS = 30
+
+
+@contextmanager
+def temporary_databases(directory):
+    """
+    Like the test runner, create an empty database for each configured database, in
+    files under directory rather than in memory, and use them in the block.
+    """
+    for alias in connections:
+        settings_dict = connections[alias].settings_dict
+        if (connections[alias].vendor == 'sqlite'
+                and not settings_dict['TEST'].get('MIRROR')):
+            settings_dict['TEST']['NAME'] = os.path.join(directory, f'{alias}.sqlite3')
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False,
+                                 aliases=list(connections), serialized_aliases=[])
+    try:
+        yield
+    finally:
+        teardown_databases(old_config, verbosity=0)
+        teardown_test_environment()
+
+
+def measure(function, repeat) -> dict:
+    """
+    :return: The shortest, median and longest time of calling function. Unit: second
+    """
+    times = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start_time)
+    return {'min_s': min(times), 'median_s': statistics.median(times),
+            'max_s': max(times)}
+
+
+def _post(client, url, data):
+    response = client.post(url, data)
+    if response.status_code != 200:
+        raise RuntimeError(f"{url} returned {response.status_code}: "
+                           f"{response.content[:500]}")
+    return response
+
+
+def _ingest(meter, end_date, rng):
+    """
+    Overwrite the last INGEST_DAYS days of meter's usage like a Contact Energy backfill,
+    whose rows are hourly.
+    """
+    for day in pd.date_range(end=end_date, periods=INGEST_DAYS, freq='1d'):
+        time_slot = pd.date_range(day, day + pd.Timedelta(days=1), freq='h',
+                                  tz=TIME_ZONE, inclusive='left')
+        value = synthetic_usage(time_slot, 60, rng)
+        save_usage(meter, day, [{'date': t.isoformat(), 'value': f"{v:.2f}"}
+                                for t, v in zip(time_slot, value.tolist())])
+
+
+def run_benchmarks(sizes, end_date, n_plans=10, n_prices=8, repeat=3, interval=30,
+                   engines=('ledger', 'streaming', 'sql'), progress=None) -> list:
+    """
+    Run in temporary_databases.
+
+    :param sizes: Years of usage of the benchmarked meters.
+    :param progress: Called with each result.
+    :return: A dict for each benchmark at each size.
+    """
+    rng = np.random.default_rng(0)
+    client = Client()
+    results = []
+    for years in sizes:
+        start_date = end_date - timedelta(days=round(years * 365.25) - 1)
+        plans = create_synthetic_plans(n_plans, n_prices, start_date, seed=0)
+        meter = create_synthetic_meters(1, start_date, end_date, interval, seed=0)[0]
+        usage_range = {'meter': meter_choice(meter), 'start_date': start_date,
+                       'end_date': end_date}
+        compare = {**usage_range, 'plans': [plan.id for plan in plans],
+                   'billing_day': 1, 'follow_versions': 'on', 'resamples': 0}
+        benchmarks = {
+            'ingest': lambda: _ingest(meter, end_date, rng),
+            'get_missing_dates_in_usage': lambda: get_missing_dates_in_usage(
+                start_date, end_date, meter),
+            'select_meter': lambda: _post(client, '/select_meter', usage_range),
+            'check_integrity': lambda: _post(client, '/integrity/check', usage_range),
+            'compare:ledger_cold': lambda: (
+                invalidate_meter(meter),
+                _post(client, '/compare/action', {**compare, 'engine': 'ledger'})),
+        }
+        for engine in engines:
+            benchmarks[f'compare:{engine}'] = (
+                lambda engine=engine: _post(client, '/compare/action',
+                                            {**compare, 'engine': engine}))
+        n_rows = Usage.objects.filter(meter=meter).count()
+        for name, function in benchmarks.items():
+            result = {'name': name, 'years': years, 'usage_rows': n_rows,
+                      'plans': n_plans, 'prices_per_plan': n_prices, 'repeat': repeat,
+                      **measure(function, repeat)}
+            results.append(result)
+            if progress:
+                progress(result)
+    return results
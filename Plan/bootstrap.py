@@ -0,0 +1,38 @@
+"""
+How sure a comparison is, by resampling the dates in the compared range.
+"""
+from typing import NamedTuple
+
+import numpy as np
+
+
+class BootstrapResult(NamedTuple):
+    low: np.ndarray  # Lower bound of each plan's total cost
+    high: np.ndarray  # Upper bound of each plan's total cost
+    p_cheapest: np.ndarray  # Probability that each plan is the cheapest
+
+
+def bootstrap_cost(cost, n_resamples=2000, confidence=0.95, seed=None,
+                   batch_size=500) -> BootstrapResult:
+    """
+    Resample the dates with replacement, and total each plan's cost in every resample.
+    A resample is stored as how many times each date is drawn, so the totals of a
+    batch of resamples are one matrix product with the cost matrix.
+
+    :param cost: Array of shape (n_days, n_plans), the cost of each plan in each date.
+    :param confidence: Of the percentile intervals.
+    :param batch_size: Resamples drawn at a time, to bound the memory.
+    """
+    n_days, n_plans = cost.shape
+    rng = np.random.default_rng(seed)
+    totals = np.empty((n_resamples, n_plans))
+    for i in range(0, n_resamples, batch_size):
+        n = min(batch_size, n_resamples - i)
+        draw = (rng.integers(0, n_days, (n, n_days))
+                + (np.arange(n) * n_days)[:, np.newaxis])
+        counts = np.bincount(draw.ravel(), minlength=n * n_days).reshape(n, n_days)
+        totals[i:i + n] = counts @ cost
+    alpha = (1 - confidence) / 2
+    low, high = np.quantile(totals, [alpha, 1 - alpha], axis=0)
+    p_cheapest = np.bincount(np.argmin(totals, axis=1), minlength=n_plans) / n_resamples
+    return BootstrapResult(low, high, p_cheapest)
@@ -0,0 +1,51 @@
+"""
+Work done in each process of the compare_fleet command.
+"""
+import django
+from django.db import connections
+
+
+def init_worker():
+    """
+    A forked process must not share the parent's database connections, and a spawned
+    process has to set up Django first.
+    """
+    django.setup()
+    connections.close_all()
+
+
+def compare_meter(meter_id, plan_ids, follow_versions, billing_day, start_date,
+                  end_date):
+    """
+    Price the usage of one meter under a set of plans. The usage is read once and
+    priced for all plans together, and nothing is written to the database.
+
+    :return: (meter_id, rows, error), where rows are (plan_id, versioned, cost) with
+        the cost including GST in New Zealand cent, and error is a message if the
+        meter can't be priced.
+    """
+    from Meter.models import Meter
+    from Meter.usage import load_usage
+    from .ledger import plan_versions
+    from .models import ChargingPlan
+    from .scenarios import scenario_cost
+    from .tariff import CompiledTariff, MissingPriceError
+
+    try:
+        meter = Meter.objects.get(id=meter_id)
+    except Meter.DoesNotExist:
+        # Deleted after the command listed it.
+        return meter_id, [], "The meter does not exist."
+    plans = list(ChargingPlan.objects.filter(id__in=plan_ids).select_related('family'))
+    tariffs = plan_versions(plans, follow_versions, billing_day)
+    if not tariffs:
+        return meter_id, [], "None of the plans exist."
+    context_start = min(CompiledTariff(t.versions, t.billing_day or 1)
+                        .context_start(start_date) for t in tariffs)
+    time_slot, value = load_usage(meter, context_start, end_date)
+    try:
+        cost = scenario_cost(time_slot, value, tariffs, start_date, end_date)
+    except MissingPriceError as e:
+        return meter_id, [], str(e)
+    return meter_id, [(t.plan.id, t.versioned, c)
+                      for t, c in zip(tariffs, cost.tolist())], None
@@ -0,0 +1,115 @@
+"""
+National public holidays of New Zealand, computed offline. Regional anniversary days
+are not included.
+
+https://www.employment.govt.nz/leave-and-holidays/public-holidays/public-holidays-and-anniversary-dates
+"""
+import warnings
+from datetime import date, timedelta
+from functools import lru_cache
+
+import numpy as np
+
+# Te Kāhui o Matariki Public Holiday Act 2022, Schedule 1. Later years are not
+# scheduled yet.
+MATARIKI = {
+    2022: date(2022, 6, 24), 2023: date(2023, 7, 14), 2024: date(2024, 6, 28),
+    2025: date(2025, 6, 20), 2026: date(2026, 7, 10), 2027: date(2027, 6, 25),
+    2028: date(2028, 7, 14), 2029: date(2029, 7, 6), 2030: date(2030, 6, 21),
+    2031: date(2031, 7, 11), 2032: date(2032, 7, 2), 2033: date(2033, 6, 24),
+    2034: date(2034, 7, 7), 2035: date(2035, 6, 29), 2036: date(2036, 7, 18),
+    2037: date(2037, 7, 10), 2038: date(2038, 6, 25), 2039: date(2039, 7, 15),
+    2040: date(2040, 7, 6), 2041: date(2041, 7, 19), 2042: date(2042, 7, 11),
+    2043: date(2043, 7, 3), 2044: date(2044, 6, 24), 2045: date(2045, 7, 7),
+    2046: date(2046, 6, 29), 2047: date(2047, 7, 19), 2048: date(2048, 7, 3),
+    2049: date(2049, 6, 25), 2050: date(2050, 7, 15), 2051: date(2051, 6, 30),
+    2052: date(2052, 6, 21),
+}
+ONE_OFF = [
+    date(2022, 9, 26),  # Queen Elizabeth II Memorial Day
+]
+
+
+def easter_sunday(year: int) -> date:
+    """
+    Anonymous Gregorian algorithm.
+    """
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l_ = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l_) // 451
+    month, day = divmod(h + l_ - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def _nth_monday(year: int, month: int, n: int) -> date:
+    first = date(year, month, 1)
+    return first + timedelta(days=(7 - first.weekday()) % 7 + 7 * (n - 1))
+
+
+def _mondayise(days):
+    """
+    A holiday falling on a weekend is also observed on the next working day that is
+    not another holiday.
+    """
+    observed = []
+    for day in days:
+        observed_day = day
+        while observed_day.weekday() >= 5 or observed_day in observed:
+            observed_day += timedelta(days=1)
+        observed.append(observed_day)
+    return observed
+
+
+@lru_cache(maxsize=None)
+def nz_public_holidays(year: int) -> frozenset:
+    """
+    Public holidays in a year, including both the actual date and the observed date
+    of a Mondayised holiday. Warns once for a year after MATARIKI, whose Matariki is
+    not included.
+    """
+    holidays = []
+    for day in [date(year, 1, 1), date(year, 12, 25)]:
+        pair = [day, day + timedelta(days=1)]
+        holidays += pair + _mondayise(pair)
+    waitangi = date(year, 2, 6)
+    anzac = date(year, 4, 25)
+    holidays += [waitangi, anzac]
+    if year >= 2014:
+        holidays += _mondayise([waitangi])
+    if year >= 2015:
+        holidays += _mondayise([anzac])
+    easter = easter_sunday(year)
+    holidays += [
+        easter - timedelta(days=2),  # Good Friday
+        easter + timedelta(days=1),  # Easter Monday
+        _nth_monday(year, 6, 1),  # Sovereign's Birthday
+        _nth_monday(year, 10, 4),  # Labour Day
+    ]
+    if year in MATARIKI:
+        holidays.append(MATARIKI[year])
+    elif year > max(MATARIKI):
+        warnings.warn(f"The date of Matariki in {year} is not known, so it's priced as "
+                      f"a normal day. Add it to Plan.holidays.MATARIKI.", RuntimeWarning)
+    holidays += [day for day in ONE_OFF if day.year == year]
+    return frozenset(holidays)
+
+
+def is_public_holiday(dates) -> np.ndarray:
+    """
+    :param dates: Array of dtype datetime64[D].
+    :return: Boolean array.
+    """
+    if dates.shape[0] == 0:
+        return np.zeros(0, dtype=bool)
+    years = dates.astype('datetime64[Y]').astype(np.int64) + 1970
+    holidays = np.array(sorted(
+        day for year in range(years.min(), years.max() + 1)
+        for day in nz_public_holidays(int(year))
+    ), dtype='datetime64[D]')
+    return np.isin(dates, holidays)
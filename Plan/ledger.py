@@ -0,0 +1,231 @@
+from datetime import timedelta
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+from django.db.models import Min, Max, Q
+
+from Meter.usage import load_usage
+from NewZealandElectricity.db import write_transaction
+from NewZealandElectricity.profiling import stage
+from .models import ChargingPlan, DailyCost
+from .tariff import CompiledTariff, local_dates
+
+
+def _daily_cost(time_slot, value, tariff, start_date, n_days) -> np.ndarray:
+    dates = np.arange(n_days) + np.datetime64(start_date, 'D')
+    day = (local_dates(time_slot) - dates[0]).astype(np.int64)
+    variable_cost = np.bincount(day, weights=tariff.slot_cost(time_slot, value),
+                                minlength=n_days)
+    return tariff.daily_cost(dates, variable_cost)
+
+
+class Tariff(NamedTuple):
+    """
+    What a ledger is kept for. plan keys the ledger, and it's the earliest version
+    if versioned.
+    """
+    plan: ChargingPlan
+    versions: list
+    versioned: bool
+    billing_day: int
+
+
+def plan_versions(plans, versioned=False, billing_day=1):
+    """
+    Versions to bill with for each plan.
+
+    :param versioned: If true, a plan in a family is replaced by all versions of the
+        family, and a family is listed once however many of its versions are given.
+    :param billing_day: The day of month that each bill starts.
+    :return: List of Tariff.
+    """
+    families = {}
+    if versioned:
+        for version in ChargingPlan.objects.filter(
+                family__in={plan.family_id for plan in plans if plan.family_id}
+        ).order_by('applied_date', 'id'):
+            families.setdefault(version.family_id, []).append(version)
+    tariffs = {}
+    for plan in plans:
+        versions = families.get(plan.family_id)
+        if versions:
+            plan, versioned_ = versions[0], True
+        else:
+            versions, versioned_ = [plan], False
+        # Only tiers counting the usage in billing periods depend on billing day.
+        billing_day_ = billing_day if any(
+            v.tier_period == ChargingPlan.BILLING_PERIOD for v in versions) else 0
+        tariffs.setdefault((plan.id, versioned_),
+                           Tariff(plan, versions, versioned_, billing_day_))
+    return list(tariffs.values())
+
+
+def tariff_version(tariffs):
+    """
+    :param tariffs: Returned by plan_versions.
+    :return: (version, last_modified), where version changes with the plans of the
+        tariffs, and last_modified is their latest ChargingPlan.data_modified.
+    """
+    version = [(t.versioned, t.billing_day, [(p.id, p.data_version) for p in t.versions])
+               for t in tariffs]
+    return version, max((p.data_modified for t in tariffs for p in t.versions),
+                        default=None)
+
+
+def _ledger_filter(tariffs):
+    ledger_filter = Q()
+    for tariff in tariffs:
+        ledger_filter |= Q(plan=tariff.plan, versioned=tariff.versioned,
+                           billing_day=tariff.billing_day)
+    return ledger_filter
+
+
+def update_ledger(meter, tariffs, start_date, end_date):
+    """
+    Make sure the ledger of the meter covers start_date to end_date (inclusive) for
+    every tariff returned by plan_versions. Only the dates not in the ledger yet are
+    priced, and the usage is read once for all tariffs.
+    """
+    coverage = {
+        (row['plan'], row['versioned'], row['billing_day']): (
+            row['first_date'], row['last_date'])
+        for row in DailyCost.objects.filter(_ledger_filter(tariffs), meter=meter)
+        .values('plan', 'versioned', 'billing_day')
+        .annotate(first_date=Min('date'), last_date=Max('date'))
+    }
+    tasks = []  # (tariff, compiled_tariff, from_date, to_date, rebuild)
+    for tariff in tariffs:
+        first_date, last_date = coverage.get(
+            (tariff.plan.id, tariff.versioned, tariff.billing_day), (None, None))
+        if first_date is None or start_date < first_date:
+            to_date = end_date if last_date is None else max(end_date, last_date)
+            from_date, rebuild = start_date, True
+        elif end_date > last_date:
+            from_date, to_date, rebuild = last_date + timedelta(days=1), end_date, False
+        else:
+            continue
+        compiled_tariff = CompiledTariff(tariff.versions, tariff.billing_day or 1)
+        tasks.append((tariff, compiled_tariff, from_date, to_date, rebuild))
+    if not tasks:
+        return
+
+    from_date = min(compiled_tariff.context_start(task_from_date)
+                    for _, compiled_tariff, task_from_date, _, _ in tasks)
+    to_date = max(task[3] for task in tasks)
+    time_slot, value = load_usage(meter, from_date, to_date)
+    n_days = (to_date - from_date).days + 1
+    dates = [from_date + timedelta(days=i) for i in range(n_days)]
+    with write_transaction(DailyCost):
+        for tariff, compiled_tariff, task_from_date, task_to_date, rebuild in tasks:
+            i = (task_from_date - from_date).days
+            j = (task_to_date - from_date).days + 1
+            with stage('price') as price_stage:
+                cost = _daily_cost(time_slot, value, compiled_tariff, from_date,
+                                   n_days)[i:j]
+                price_stage.count(time_slot.shape[0])
+            ledger = DailyCost.objects.filter(
+                meter=meter, plan=tariff.plan, versioned=tariff.versioned,
+                billing_day=tariff.billing_day)
+            if rebuild:
+                ledger.delete()
+                base = 0.0
+            else:
+                base = ledger.get(date=task_from_date - timedelta(days=1)).cumulative_cost
+            cumulative_cost = base + np.cumsum(cost)
+            DailyCost.objects.bulk_create([
+                DailyCost(meter=meter, plan=tariff.plan, versioned=tariff.versioned,
+                          billing_day=tariff.billing_day, date=date_, cost=c,
+                          cumulative_cost=cc)
+                for date_, c, cc in zip(dates[i:j], cost.tolist(),
+                                        cumulative_cost.tolist())
+            ], batch_size=2000, ignore_conflicts=True)
+
+
+def read_ledger(meter, tariffs, start_date, end_date):
+    """
+    :param tariffs: Returned by plan_versions.
+    :return: (cost, cumulative_cost), DataFrames whose index is every date from
+        start_date to end_date, and the k-th column is the k-th tariff. Include GST.
+        Unit: New Zealand cent
+    """
+    update_ledger(meter, tariffs, start_date, end_date)
+    rows = DailyCost.objects.filter(
+        _ledger_filter(tariffs), meter=meter, date__gte=start_date, date__lte=end_date,
+    ).values_list('plan_id', 'versioned', 'billing_day', 'date', 'cost',
+                  'cumulative_cost')
+    columns = ['plan', 'versioned', 'billing_day']
+    ledger = pd.DataFrame.from_records(rows, columns=columns + ['date', 'cost',
+                                                                 'cumulative_cost'])
+    keys = pd.DataFrame([(t.plan.id, t.versioned, t.billing_day) for t in tariffs],
+                        columns=columns)
+    keys['tariff'] = keys.index
+    ledger = ledger.merge(keys, on=columns)
+    dates = pd.date_range(start_date, end_date, freq='1d').date
+    cost = (ledger.pivot(index='date', columns='tariff', values='cost')
+            .reindex(index=dates, columns=keys['tariff']))
+    cumulative_cost = (ledger.pivot(index='date', columns='tariff',
+                                    values='cumulative_cost')
+                       .reindex(index=dates, columns=keys['tariff']))
+    return cost, cumulative_cost
+
+
+def period_cost(cost, cumulative_cost, period_start, period_end) -> np.ndarray:
+    """
+    Total cost of each period, where period_start[k] and period_end[k] are positions
+    (inclusive) in the ledger returned by read_ledger.
+
+    :return: Array of shape (n_periods, n_plans).
+    """
+    cumulative_cost = cumulative_cost.to_numpy()
+    cumulative_before = cumulative_cost - cost.to_numpy()
+    return cumulative_cost[period_end] - cumulative_before[period_start]
+
+
+def billing_periods(start_date, end_date, billing_day: int):
+    """
+    Split start_date to end_date (inclusive) into bills starting on billing_day of
+    each month. The first and last bills may be partial.
+
+    :return: (period_start, period_end), positions of the first and last date of each
+        bill relative to start_date.
+    """
+    dates = pd.date_range(start_date, end_date, freq='1d')
+    period_start = np.flatnonzero(dates.day == billing_day)
+    if period_start.shape[0] == 0 or period_start[0] != 0:
+        period_start = np.concatenate([[0], period_start])
+    period_end = np.concatenate([period_start[1:] - 1, [dates.shape[0] - 1]])
+    return period_start, period_end
+
+
+def rolling_periods(n_days: int, window: int):
+    """
+    Every window of consecutive dates in a ledger of n_days dates.
+
+    :return: (period_start, period_end), positions in the ledger.
+    """
+    period_end = np.arange(window - 1, n_days)
+    return period_end - window + 1, period_end
+
+
+def invalidate_meter(meter, start_date=None):
+    """
+    Remove the ledger of a meter from start_date, because the cumulative costs after
+    a changed date are all stale.
+    """
+    ledger = DailyCost.objects.filter(meter=meter)
+    if start_date is not None:
+        ledger = ledger.filter(date__gte=start_date)
+    ledger.delete()
+
+
+def invalidate_plan(plan_id):
+    """
+    Remove the ledger of a plan, and the ledger of every family since the versions
+    of a family may have changed.
+    """
+    DailyCost.objects.filter(Q(plan_id=plan_id) | Q(versioned=True)).delete()
+
+
+def invalidate_families():
+    DailyCost.objects.filter(versioned=True).delete()
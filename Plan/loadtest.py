@@ -0,0 +1,167 @@
+"""
+Drive concurrent users through the URL routes of a local server, and measure the
+latency of each route.
+"""
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+import requests
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.core.wsgi import get_wsgi_application
+
+from ContactEnergy.models import ContactEnergySession
+from Meter.fields import meter_choice
+from Meter.synthetic import create_synthetic_meters
+from .synthetic import create_synthetic_plans
+
+# Routes requested by each user in turn. The progress is polled every few seconds while
+# usage is fetched, so it is requested more often.
+USER_ROUTES = ['plans', 'dashboard', 'progress', 'compare', 'progress', 'integrity',
+               'progress']
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def seed(end_date, years, n_plans, n_prices) -> dict:
+    """
+    Create a synthetic meter, plans, and a Contact Energy session to poll.
+
+    :return: The form data of each route.
+    """
+    start_date = end_date - timedelta(days=round(years * 365.25) - 1)
+    meter = create_synthetic_meters(1, start_date, end_date, seed=0)[0]
+    plans = create_synthetic_plans(n_plans, n_prices, start_date, seed=0)
+    ContactEnergySession.objects.create(
+        meter=meter.content_object, finished_dates=3, failed_dates=1, total_dates=10)
+    # Like the charts that users look at most, the last 90 days.
+    recent = {'meter': meter_choice(meter), 'start_date': end_date - timedelta(days=89),
+              'end_date': end_date}
+    return {
+        'plans': None,
+        'dashboard': recent,
+        # The usage of the last 3 days cannot be fetched.
+        'progress': {'account_and_contract': meter.meter_id,
+                     'start_date': end_date - timedelta(days=12),
+                     'end_date': end_date - timedelta(days=3)},
+        'compare': {'meter': meter_choice(meter), 'plans': [p.id for p in plans],
+                    'start_date': start_date, 'end_date': end_date, 'billing_day': 1,
+                    'follow_versions': 'on', 'engine': 'ledger', 'resamples': 0},
+        'integrity': recent,
+    }
+
+
+ROUTE_URLS = {
+    'plans': '/plans',
+    'dashboard': '/select_meter',
+    'progress': '/get_data_contact/progress',
+    'compare': '/compare/action',
+    'integrity': '/integrity/check',
+}
+
+
+def run_load(data, n_users, duration, progress=None) -> dict:
+    """
+    Serve the application on a local port, and let each of n_users users request
+    USER_ROUTES in turn, for duration seconds after one warm-up round.
+
+    :param data: Returned by seed.
+    :return: Latencies (unit: second) and the number of errors of each route, and the
+        measured time.
+    """
+    server = ThreadedWSGIServer(('127.0.0.1', 0), QuietRequestHandler)
+    server.set_app(get_wsgi_application())
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    latencies = {route: [] for route in ROUTE_URLS}
+    errors = {route: 0 for route in ROUTE_URLS}
+    lock = threading.Lock()
+    # Broken if a user fails to warm up, rather than waiting forever.
+    start = threading.Barrier(n_users + 1, timeout=300)
+    stop = threading.Event()
+
+    def request(session, route):
+        url = base_url + ROUTE_URLS[route]
+        if data[route] is None:
+            return session.get(url)
+        return session.post(url, data=data[route],
+                            headers={'X-CSRFToken': session.cookies['csrftoken']})
+
+    def user():
+        with requests.Session() as session:
+            session.trust_env = False
+            try:
+                session.get(base_url + '/compare')  # Sets the CSRF cookie.
+                for route in USER_ROUTES:
+                    request(session, route)
+            except requests.RequestException:
+                # The others and the measurement stop now, instead of at the timeout.
+                start.abort()
+                raise
+            start.wait()
+            i = 0
+            while not stop.is_set():
+                route = USER_ROUTES[i % len(USER_ROUTES)]
+                i += 1
+                start_time = time.perf_counter()
+                try:
+                    ok = request(session, route).status_code == 200
+                except requests.RequestException:
+                    # E.g. the connection is refused or reset under load.
+                    ok = False
+                latency = time.perf_counter() - start_time
+                with lock:
+                    if ok:
+                        latencies[route].append(latency)
+                    else:
+                        errors[route] += 1
+
+    users = [threading.Thread(target=user) for _ in range(n_users)]
+    try:
+        for thread in users:
+            thread.start()
+        start.wait()
+        start_time = time.perf_counter()
+        while time.perf_counter() - start_time < duration:
+            time.sleep(min(1.0, duration))
+            if progress:
+                with lock:
+                    progress(sum(map(len, latencies.values())),
+                             time.perf_counter() - start_time)
+        stop.set()
+        for thread in users:
+            thread.join()
+        elapsed = time.perf_counter() - start_time
+    finally:
+        stop.set()
+        server.shutdown()
+        server.server_close()
+    return {'latencies': latencies, 'errors': errors, 'elapsed': elapsed}
+
+
+def summarise(result) -> list:
+    """
+    :param result: Returned by run_load.
+    :return: For each route, and all routes, the number of requests and errors, the
+        throughput (unit: request/s), and the 50th, 95th and 99th percentile latency
+        (unit: millisecond).
+    """
+    rows = []
+    for route, latencies in [*result['latencies'].items(),
+                             ('all', sum(result['latencies'].values(), []))]:
+        latency = np.array(latencies) * 1000
+        p50, p95, p99 = (np.percentile(latency, [50, 95, 99]).tolist()
+                         if latency.shape[0] else [None] * 3)
+        rows.append({
+            'route': route, 'requests': latency.shape[0],
+            'errors': (sum(result['errors'].values()) if route == 'all'
+                       else result['errors'][route]),
+            'throughput': latency.shape[0] / result['elapsed'],
+            'p50_ms': p50, 'p95_ms': p95, 'p99_ms': p99,
+        })
+    return rows
@@ -0,0 +1,79 @@
+import json
+import platform
+import subprocess
+import tempfile
+from datetime import date, timedelta
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router
+from django.utils import timezone
+
+from Meter.models import Usage
+from Plan.benchmark import run_benchmarks, temporary_databases
+
+
+def _sizes(text):
+    return [float(size) for size in text.split(',')]
+
+
+class Command(BaseCommand):
+    help = ("Time ingestion, get_missing_dates_in_usage, select_meter, check_integrity "
+            "and compare on synthetic data of several sizes, in temporary databases, "
+            "and write the results as JSON to track them between commits.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=_sizes, default=[1, 2, 4],
+                            help="Years of usage, separated by commas. Default: 1,2,4")
+        parser.add_argument('--interval', type=int, default=30, choices=[30, 60],
+                            help="Length of a time slot of the usage. Unit: minute")
+        parser.add_argument('--plans', type=int, default=10,
+                            help="Number of compared plans.")
+        parser.add_argument('--prices', type=int, default=8,
+                            help="Special prices of each plan.")
+        parser.add_argument('--repeat', type=int, default=3,
+                            help="Times to run each benchmark.")
+        parser.add_argument('--output', help="Write the JSON to this file rather than "
+                                             "the standard output.")
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1 or min(options['sizes']) <= 0:
+            raise CommandError("--repeat and --sizes must be positive.")
+        engines = ['ledger', 'streaming']
+        if connections[router.db_for_read(Usage)].vendor == 'sqlite':
+            engines.append('sql')
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, text=True,
+                capture_output=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+
+        def progress(result):
+            self.stderr.write(f"{result['name']} {result['years']} years: "
+                              f"median {result['median_s']:.3f}s, "
+                              f"min {result['min_s']:.3f}s")
+
+        created = timezone.now()
+        with tempfile.TemporaryDirectory() as directory:
+            with temporary_databases(directory):
+                results = run_benchmarks(
+                    options['sizes'], date.today() - timedelta(days=1), options['plans'],
+                    options['prices'], options['repeat'], options['interval'], engines,
+                    progress)
+        report = {
+            'commit': commit,
+            'created': created.isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'parameters': {key: options[key] for key in
+                           ['sizes', 'interval', 'plans', 'prices', 'repeat']},
+            'results': results,
+        }
+        text = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(text + '\n')
+        else:
+            self.stdout.write(text)
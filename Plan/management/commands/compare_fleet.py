@@ -0,0 +1,103 @@
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.utils import timezone
+
+from Meter.models import Meter
+from Plan.fleet import init_worker, compare_meter
+from Plan.models import ChargingPlan, FleetReport
+
+
+class Command(BaseCommand):
+    help = ("Compare every meter under a set of plans in parallel, and record the cost "
+            "and rank of each plan for each meter.")
+
+    def add_arguments(self, parser):
+        yesterday = date.today() - timedelta(days=1)
+        parser.add_argument('--start-date', type=date.fromisoformat,
+                            default=yesterday - timedelta(days=364),
+                            help="Default: 365 days ending yesterday.")
+        parser.add_argument('--end-date', type=date.fromisoformat, default=yesterday)
+        parser.add_argument('--plan', type=int, action='append',
+                            help="ID of a plan to compare. Can be repeated. Default: all "
+                                 "plans.")
+        parser.add_argument('--meter', type=int, action='append',
+                            help="ID of a meter to compare. Can be repeated. Default: "
+                                 "all meters.")
+        parser.add_argument('--follow-versions', action='store_true',
+                            help="Bill each date with the version of the plan's family "
+                                 "applied on that date.")
+        parser.add_argument('--billing-day', type=int, default=1, choices=range(1, 29),
+                            metavar='1-28')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help="Number of processes.")
+        parser.add_argument('--csv', help="Also write the report to this CSV file.")
+
+    def handle(self, *args, **options):
+        start_date, end_date = options['start_date'], options['end_date']
+        if start_date > end_date:
+            raise CommandError("--start-date is later than --end-date.")
+        plans = ChargingPlan.objects.all()
+        if options['plan']:
+            plans = plans.filter(id__in=options['plan'])
+        plan_ids = list(plans.values_list('id', flat=True))
+        meters = Meter.objects.all()
+        if options['meter']:
+            meters = meters.filter(id__in=options['meter'])
+        meter_ids = list(meters.values_list('id', flat=True))
+        if not plan_ids or not meter_ids:
+            raise CommandError("No plan or meter to compare.")
+
+        run = timezone.now()
+        reports = []
+        n_done = 0
+        start_time = time.perf_counter()
+        # Forked workers must not inherit open connections.
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=options['workers'],
+                                 initializer=init_worker) as executor:
+            futures = [
+                executor.submit(compare_meter, meter_id, plan_ids,
+                                options['follow_versions'], options['billing_day'],
+                                start_date, end_date)
+                for meter_id in meter_ids
+            ]
+            for future in as_completed(futures):
+                meter_id, rows, error = future.result()
+                n_done += 1
+                elapsed = time.perf_counter() - start_time
+                progress = (f"[{n_done}/{len(meter_ids)}] {n_done / elapsed:.1f} "
+                            f"meters/s, meter {meter_id}: ")
+                if error:
+                    self.stderr.write(progress + error)
+                    continue
+                rows.sort(key=lambda row: row[2])
+                for rank, (plan_id, versioned, cost) in enumerate(rows, start=1):
+                    reports.append(FleetReport(
+                        run=run, meter_id=meter_id, plan_id=plan_id, versioned=versioned,
+                        start_date=start_date, end_date=end_date, cost=cost, rank=rank))
+                self.stdout.write(progress + f"best plan {rows[0][0]}, "
+                                             f"{round(rows[0][2]) / 100} NZD")
+
+        with transaction.atomic():
+            FleetReport.objects.bulk_create(reports, batch_size=2000)
+        if options['csv']:
+            plan_names = {plan.id: str(plan)
+                          for plan in ChargingPlan.objects.filter(id__in=plan_ids)}
+            with open(options['csv'], 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['meter', 'plan_id', 'plan', 'versioned', 'start_date',
+                                 'end_date', 'cost_nzd', 'rank'])
+                for r in reports:
+                    writer.writerow([r.meter_id, r.plan_id, plan_names[r.plan_id],
+                                     r.versioned, r.start_date, r.end_date,
+                                     round(r.cost) / 100, r.rank])
+        elapsed = time.perf_counter() - start_time
+        self.stdout.write(self.style.SUCCESS(
+            f"Compared {n_done} meters under {len(plan_ids)} plans in {elapsed:.1f}s "
+            f"({n_done * len(plan_ids) / elapsed:.1f} meter-plans/s). Run: {run}."))
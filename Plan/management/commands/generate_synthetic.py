@@ -0,0 +1,41 @@
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Meter.synthetic import create_synthetic_meters
+from Plan.synthetic import create_synthetic_plans
+
+
+class Command(BaseCommand):
+    help = ("Create synthetic Contact Energy meters with the usage of typical "
+            "households, and synthetic time of use plans with many special prices.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--meters', type=int, default=1,
+                            help="Number of meters to create.")
+        parser.add_argument('--years', type=float, default=1,
+                            help="Years of usage of each meter, ending yesterday.")
+        parser.add_argument('--interval', type=int, default=30, choices=[30, 60],
+                            help="Length of a time slot. Unit: minute")
+        parser.add_argument('--plans', type=int, default=0,
+                            help="Number of plans to create.")
+        parser.add_argument('--prices', type=int, default=8,
+                            help="Special prices of each plan.")
+        parser.add_argument('--seed', type=int, help="Seed of the random numbers.")
+
+    def handle(self, *args, **options):
+        if options['meters'] < 0 or options['plans'] < 0 or options['years'] <= 0:
+            raise CommandError("--years must be positive, and the numbers of meters "
+                               "and plans must not be negative.")
+        end_date = date.today() - timedelta(days=1)
+        start_date = end_date - timedelta(days=round(options['years'] * 365.25) - 1)
+        start_time = time.perf_counter()
+        meters = create_synthetic_meters(options['meters'], start_date, end_date,
+                                         options['interval'], options['seed'])
+        plans = create_synthetic_plans(options['plans'], options['prices'], start_date,
+                                       options['seed'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Created meters {[m.id for m in meters]} from {start_date} to {end_date}, "
+            f"and plans {[p.id for p in plans]} in "
+            f"{time.perf_counter() - start_time:.1f}s."))
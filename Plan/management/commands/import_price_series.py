@@ -0,0 +1,107 @@
+import itertools
+import time
+
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router
+
+from NewZealandElectricity.db import write_transaction
+from NewZealandElectricity.settings import TIME_ZONE
+from Plan.ledger import invalidate_plan
+from Plan.models import ChargingPlan, PriceSeries, SeriesPrice
+from Plan.signals import bump_data_version
+
+
+def read_price_csv(chunk, series_name=None, nodes=None):
+    """
+    Convert a chunk of a price CSV file to series prices.
+
+    Two formats are accepted.
+    - Wholesale prices published by Electricity Authority (https://www.emi.ea.govt.nz/)
+      with columns TradingDate, TradingPeriod, PointOfConnection and
+      DollarsPerMegawattHour. Trading period 1 starts at 00:00 local time, and each
+      trading period lasts 30 minutes.
+    - Columns time_slot (ISO 8601 with UTC offset) and unit_price (New Zealand cent
+      per kWh, exclude GST).
+
+    :return: DataFrame with columns series, time_slot (aware) and unit_price (New
+        Zealand cent).
+    """
+    if {'TradingDate', 'TradingPeriod', 'PointOfConnection',
+            'DollarsPerMegawattHour'}.issubset(chunk.columns):
+        if nodes:
+            chunk = chunk[chunk['PointOfConnection'].isin(nodes)]
+        trading_date = (pd.to_datetime(chunk['TradingDate'])
+                        .dt.tz_localize(TIME_ZONE, ambiguous=False))
+        time_slot = (trading_date + pd.to_timedelta(
+            (chunk['TradingPeriod'] - 1) * 30, unit='min')).dt.tz_convert('UTC')
+        return pd.DataFrame({
+            "series": series_name or chunk['PointOfConnection'],
+            "time_slot": time_slot,
+            # 1 dollar per MWh = 0.1 cent per kWh
+            "unit_price": chunk['DollarsPerMegawattHour'] * 0.1,
+        })
+    if {'time_slot', 'unit_price'}.issubset(chunk.columns):
+        if not series_name:
+            raise CommandError("--series is required for files with columns time_slot "
+                               "and unit_price.")
+        return pd.DataFrame({
+            "series": series_name,
+            "time_slot": pd.to_datetime(chunk['time_slot'], utc=True),
+            "unit_price": chunk['unit_price'].astype(float),
+        })
+    raise CommandError(f"Unknown columns: {', '.join(chunk.columns)}.")
+
+
+class Command(BaseCommand):
+    help = ("Import price series from CSV files, e.g. wholesale prices at each point of "
+            "connection. Existed prices at the same time are overwritten.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+')
+        parser.add_argument(
+            '--series', help="Name of the price series. By default, wholesale prices "
+                             "are imported to one series per point of connection.")
+        parser.add_argument(
+            '--node', action='append',
+            help="Only import wholesale prices at this point of connection, e.g. "
+                 "HAY2201. Can be repeated.")
+        parser.add_argument('--chunk-size', type=int, default=200000,
+                            help="Number of CSV rows read at a time.")
+
+    def handle(self, *args, **options):
+        # The ORM spends most of the time building model instances, which is
+        # significant for years of half-hourly prices at many nodes.
+        table = SeriesPrice._meta.db_table
+        sql_upsert = (
+            f"INSERT INTO {table} (series_id, time_slot, unit_price) VALUES (%s, %s, %s) "
+            f"ON CONFLICT (series_id, time_slot) DO UPDATE SET "
+            f"unit_price = excluded.unit_price"
+        )
+        connection = connections[router.db_for_write(SeriesPrice)]
+        series_objects = {}
+        n_rows = 0
+        start_time = time.perf_counter()
+        for path in options['files']:
+            for chunk in pd.read_csv(path, chunksize=options['chunk_size']):
+                prices = read_price_csv(chunk, options['series'], options['node'])
+                with write_transaction(SeriesPrice), connection.cursor() as cursor:
+                    for name, rows in prices.groupby('series'):
+                        if name not in series_objects:
+                            series_objects[name], created = (
+                                PriceSeries.objects.get_or_create(name=name))
+                        cursor.executemany(sql_upsert, zip(
+                            itertools.repeat(series_objects[name].id),
+                            rows['time_slot'].dt.strftime('%Y-%m-%d %H:%M:%S'),
+                            rows['unit_price'].tolist(),
+                        ))
+                n_rows += prices.shape[0]
+                elapsed = time.perf_counter() - start_time
+                self.stdout.write(f"{path}: {n_rows} prices imported, "
+                                  f"{n_rows / elapsed:.0f} rows/s.")
+        plans = ChargingPlan.objects.filter(price_series__in=series_objects.values())
+        for plan_id in plans.values_list('id', flat=True):
+            invalidate_plan(plan_id)
+        bump_data_version(plans)
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {n_rows} prices into {len(series_objects)} series."))
@@ -0,0 +1,60 @@
+import json
+import tempfile
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from Plan.benchmark import temporary_databases
+from Plan.loadtest import ROUTE_URLS, USER_ROUTES, run_load, seed, summarise
+
+
+class Command(BaseCommand):
+    help = ("Serve the application on a local port against temporary databases seeded "
+            "with synthetic data, drive concurrent users through the plan list, usage "
+            "chart, compare, integrity check and progress poll routes, and report the "
+            "latency percentiles and throughput of each route.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=8,
+                            help="Number of concurrent users.")
+        parser.add_argument('--duration', type=float, default=30,
+                            help="Measured time after warming up. Unit: second")
+        parser.add_argument('--years', type=float, default=1,
+                            help="Years of usage of the seeded meter.")
+        parser.add_argument('--plans', type=int, default=10,
+                            help="Number of seeded plans, all compared.")
+        parser.add_argument('--prices', type=int, default=8,
+                            help="Special prices of each plan.")
+        parser.add_argument('--output', help="Also write the summary to this JSON file.")
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['duration'] <= 0 or options['years'] <= 0:
+            raise CommandError("--users, --duration and --years must be positive.")
+
+        def progress(n_requests, elapsed):
+            self.stderr.write(f"{elapsed:.0f}s: {n_requests} requests.")
+
+        with tempfile.TemporaryDirectory() as directory, \
+                temporary_databases(directory), \
+                override_settings(DEBUG=False, ALLOWED_HOSTS=['127.0.0.1']):
+            data = seed(date.today() - timedelta(days=1), options['years'],
+                        options['plans'], options['prices'])
+            result = run_load(data, options['users'], options['duration'], progress)
+        rows = summarise(result)
+
+        self.stdout.write(f"{'Route':<10}{'Requests':>10}{'Errors':>8}{'Req/s':>9}"
+                          f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for row in rows:
+            percentiles = ''.join(f"{'-' if row[key] is None else f'{row[key]:.1f}':>10}"
+                                  for key in ['p50_ms', 'p95_ms', 'p99_ms'])
+            self.stdout.write(f"{row['route']:<10}{row['requests']:>10}{row['errors']:>8}"
+                              f"{row['throughput']:>9.1f}{percentiles}")
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({
+                    'parameters': {key: options[key] for key in
+                                   ['users', 'duration', 'years', 'plans', 'prices']},
+                    'routes': {route: ROUTE_URLS[route] for route in USER_ROUTES},
+                    'results': rows,
+                }, f, indent=2)
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.15 on 2026-10-19 15:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Meter', '0006_usage_unique_usage'),
+        ('Plan', '0002_alter_chargingplan_daily_fixed_price_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyCost',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('cost', models.FloatField(help_text='Include GST. Unit: New Zealand cent')),
+                ('cumulative_cost', models.FloatField(help_text='Cost from the first date of this meter and plan in the ledger to this date (inclusive). Include GST. Unit: New Zealand cent')),
+                ('meter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='Meter.meter')),
+                ('plan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='Plan.chargingplan')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('meter', 'plan', 'date'), name='unique_daily_cost')],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.15 on 2026-10-19 15:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Meter', '0006_usage_unique_usage'),
+        ('Plan', '0003_dailycost'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlanFamily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=96, unique=True)),
+            ],
+        ),
+        migrations.RemoveConstraint(
+            model_name='dailycost',
+            name='unique_daily_cost',
+        ),
+        migrations.AddField(
+            model_name='dailycost',
+            name='versioned',
+            field=models.BooleanField(default=False, help_text="If true, each date is billed with the version of the plan's family applied on that date, and the plan is the earliest version."),
+        ),
+        migrations.AddConstraint(
+            model_name='dailycost',
+            constraint=models.UniqueConstraint(fields=('meter', 'plan', 'versioned', 'date'), name='unique_daily_cost'),
+        ),
+        migrations.AddField(
+            model_name='chargingplan',
+            name='family',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='Plan.planfamily'),
+        ),
+    ]
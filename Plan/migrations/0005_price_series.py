@@ -0,0 +1,43 @@
+# Generated by Django 5.1.15 on 2026-10-19 15:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Plan', '0004_planfamily'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceSeries',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, unique=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='chargingplan',
+            name='price_type',
+            field=models.CharField(choices=[('time_of_use', 'Time of use'), ('spot', 'Spot price')], default='time_of_use', help_text="For spot price, the unit price of each time slot is the price in the price series plus the time of use price, which usually covers network charges and the retailer's margin.", max_length=16),
+        ),
+        migrations.AddField(
+            model_name='chargingplan',
+            name='price_series',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='Plan.priceseries'),
+        ),
+        migrations.CreateModel(
+            name='SeriesPrice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('time_slot', models.DateTimeField(help_text='When this price starts to apply.')),
+                ('unit_price', models.FloatField(help_text='Exclude GST. Unit: New Zealand cent')),
+                ('series', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='Plan.priceseries')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('series', 'time_slot'), name='unique_series_price')],
+            },
+        ),
+    ]
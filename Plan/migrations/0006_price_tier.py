@@ -0,0 +1,46 @@
+# Generated by Django 5.1.15 on 2026-10-19 15:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Meter', '0006_usage_unique_usage'),
+        ('Plan', '0005_price_series'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceTier',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('threshold', models.FloatField(help_text='The tier applies to the usage above this amount in a day or billing period, until the threshold of the next tier. Unit: kWh')),
+                ('unit_price', models.FloatField(help_text='Added to the unit price of the usage in this tier. Negative for a discount. Exclude GST. Unit: New Zealand cent')),
+            ],
+        ),
+        migrations.RemoveConstraint(
+            model_name='dailycost',
+            name='unique_daily_cost',
+        ),
+        migrations.AddField(
+            model_name='chargingplan',
+            name='tier_period',
+            field=models.CharField(choices=[('day', 'Day'), ('billing_period', 'Billing period')], default='day', help_text='Thresholds of price tiers count the usage in each day or each billing period.', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='dailycost',
+            name='billing_day',
+            field=models.PositiveSmallIntegerField(default=0, help_text='The day of month that each bill starts, if price tiers count the usage in each billing period. Otherwise 0.'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailycost',
+            constraint=models.UniqueConstraint(fields=('meter', 'plan', 'versioned', 'billing_day', 'date'), name='unique_daily_cost'),
+        ),
+        migrations.AddField(
+            model_name='pricetier',
+            name='plan',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='Plan.chargingplan'),
+        ),
+    ]
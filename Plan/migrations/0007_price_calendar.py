@@ -0,0 +1,28 @@
+# Generated by Django 5.1.15 on 2026-10-19 15:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Plan', '0006_price_tier'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='price',
+            name='month_from',
+            field=models.PositiveSmallIntegerField(blank=True, choices=[(1, 'January'), (2, 'February'), (3, 'March'), (4, 'April'), (5, 'May'), (6, 'June'), (7, 'July'), (8, 'August'), (9, 'September'), (10, 'October'), (11, 'November'), (12, 'December')], help_text='Leave empty if this price applies in all seasons.', null=True),
+        ),
+        migrations.AddField(
+            model_name='price',
+            name='month_to',
+            field=models.PositiveSmallIntegerField(blank=True, choices=[(1, 'January'), (2, 'February'), (3, 'March'), (4, 'April'), (5, 'May'), (6, 'June'), (7, 'July'), (8, 'August'), (9, 'September'), (10, 'October'), (11, 'November'), (12, 'December')], help_text='Inclusive. It can be earlier than the first month, e.g. from November to March.', null=True),
+        ),
+        migrations.AddField(
+            model_name='price',
+            name='public_holiday',
+            field=models.CharField(choices=[('day_of_week', 'As its day of week'), ('always', 'Always'), ('never', 'Never')], default='day_of_week', help_text='Whether this price applies on New Zealand public holidays.', max_length=16),
+        ),
+    ]
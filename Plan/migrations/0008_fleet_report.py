@@ -0,0 +1,29 @@
+# Generated by Django 5.1.15 on 2026-10-19 15:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Meter', '0006_usage_unique_usage'),
+        ('Plan', '0007_price_calendar'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FleetReport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('run', models.DateTimeField(db_index=True, help_text='When the run started.')),
+                ('versioned', models.BooleanField(default=False, help_text="If true, each date is billed with the version of the plan's family applied on that date, and the plan is the earliest version.")),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField()),
+                ('cost', models.FloatField(help_text='Include GST. Unit: New Zealand cent')),
+                ('rank', models.PositiveSmallIntegerField(help_text='1 for the cheapest plan.')),
+                ('meter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='Meter.meter')),
+                ('plan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='Plan.chargingplan')),
+            ],
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.15 on 2026-10-19 16:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Meter', '0008_usage_database'),
+        ('Plan', '0008_fleet_report'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='dailycost',
+            name='meter',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='Meter.meter'),
+        ),
+        migrations.AlterField(
+            model_name='dailycost',
+            name='plan',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='Plan.chargingplan'),
+        ),
+        migrations.AlterField(
+            model_name='seriesprice',
+            name='series',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='Plan.priceseries'),
+        ),
+    ]
@@ -1,10 +1,62 @@
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.utils import timezone
+
+from Meter.models import Meter, VersionedModel
 
 
 # Create your models here.
-class ChargingPlan(models.Model):
+class PlanFamily(models.Model):
+    """
+    Versions of the same charging plan. Each version is a ChargingPlan that applies
+    from its applied_date until the next version's applied_date.
+    """
+    name = models.CharField(max_length=96, unique=True)
+
+    def __str__(self):
+        return self.name
+
+    def versions(self):
+        return self.chargingplan_set.order_by('applied_date', 'id')
+
+
+class PriceSeries(models.Model):
+    """
+    Time series of unit prices, e.g. wholesale prices at a grid node.
+    """
+    name = models.CharField(max_length=64, unique=True)
+
+    def __str__(self):
+        return self.name
+
+
+class SeriesPrice(models.Model):
+    # May be in another database than the series. See NewZealandElectricity.db.
+    series = models.ForeignKey(PriceSeries, on_delete=models.DO_NOTHING,
+                               db_constraint=False)
+    time_slot = models.DateTimeField(help_text="When this price starts to apply.")
+    unit_price = models.FloatField(help_text="Exclude GST. Unit: New Zealand cent")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['series', 'time_slot'],
+                                    name='unique_series_price'),
+        ]
+
+    def __str__(self):
+        return f"{self.series} {self.time_slot.strftime('%Y-%m-%d %H:%M')}"
+
+
+class ChargingPlan(VersionedModel, models.Model):
+    TIME_OF_USE = 'time_of_use'
+    SPOT = 'spot'
+    DAY = 'day'
+    BILLING_PERIOD = 'billing_period'
+
     company = models.CharField(max_length=32)
     name = models.CharField(max_length=64)
+    family = models.ForeignKey(PlanFamily, on_delete=models.SET_NULL, null=True,
+                               blank=True)
     applied_date = models.DateField()
     daily_fixed_price = models.FloatField(help_text="Exclude GST. Unit: New Zealand cent")
     GST_ratio = models.FloatField(default=0.15)
@@ -13,10 +65,33 @@ class ChargingPlan(models.Model):
         help_text="The unit price in other time. It excludes the time when special prices "
                   "are applied. Exclude GST.  Unit: New Zealand cent"
     )
+    price_type = models.CharField(
+        max_length=16, default=TIME_OF_USE,
+        choices=[(TIME_OF_USE, "Time of use"), (SPOT, "Spot price")],
+        help_text="For spot price, the unit price of each time slot is the price in the "
+                  "price series plus the time of use price, which usually covers network "
+                  "charges and the retailer's margin."
+    )
+    price_series = models.ForeignKey(PriceSeries, on_delete=models.PROTECT, null=True,
+                                     blank=True)
+    tier_period = models.CharField(
+        max_length=16, default=DAY,
+        choices=[(DAY, "Day"), (BILLING_PERIOD, "Billing period")],
+        help_text="Thresholds of price tiers count the usage in each day or each "
+                  "billing period."
+    )
+    # Changed with the plan, its prices, tiers, family and price series, by
+    # Plan.signals. For the ETags of the pages computed from the plan.
+    data_version = models.PositiveBigIntegerField(default=0, editable=False)
+    data_modified = models.DateTimeField(default=timezone.now, editable=False)
 
     def __str__(self):
         return f"{self.company} {self.name} {self.applied_date.strftime('%Y-%m-%d')}"
 
+    def clean(self):
+        if self.price_type == self.SPOT and self.price_series_id is None:
+            raise ValidationError({"price_series": "Spot price needs a price series."})
+
 
 class Price(models.Model):
     plan = models.ForeignKey(ChargingPlan, on_delete=models.CASCADE)
@@ -36,6 +111,48 @@ class Price(models.Model):
                   "If ends at midnight, input 23:59:59. If lasts to next day, create "
                   "another record that time_from = 00:00:00 (remember days of week +1)."
     )
+    MONTHS = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August',
+              'September', 'October', 'November', 'December']
+    month_from = models.PositiveSmallIntegerField(
+        null=True, blank=True, choices=[(i + 1, m) for i, m in enumerate(MONTHS)],
+        help_text="Leave empty if this price applies in all seasons."
+    )
+    month_to = models.PositiveSmallIntegerField(
+        null=True, blank=True, choices=[(i + 1, m) for i, m in enumerate(MONTHS)],
+        help_text="Inclusive. It can be earlier than the first month, e.g. from November "
+                  "to March."
+    )
+    AS_DAY_OF_WEEK = 'day_of_week'
+    ALWAYS = 'always'
+    NEVER = 'never'
+    public_holiday = models.CharField(
+        max_length=16, default=AS_DAY_OF_WEEK,
+        choices=[(AS_DAY_OF_WEEK, "As its day of week"), (ALWAYS, "Always"),
+                 (NEVER, "Never")],
+        help_text="Whether this price applies on New Zealand public holidays."
+    )
+
+    def clean(self):
+        if (self.month_from is None) != (self.month_to is None):
+            raise ValidationError("Set both the first and the last month, or neither.")
+
+    def applies_on(self, day_of_week: int, month: int, holiday: bool) -> bool:
+        """
+        :param day_of_week: Monday = 0, Sunday = 6.
+        :param month: January = 1.
+        """
+        if self.month_from is not None and self.month_to is not None:
+            if self.month_from <= self.month_to:
+                in_season = self.month_from <= month <= self.month_to
+            else:
+                in_season = month >= self.month_from or month <= self.month_to
+            if not in_season:
+                return False
+        if holiday and self.public_holiday == self.ALWAYS:
+            return True
+        if holiday and self.public_holiday == self.NEVER:
+            return False
+        return getattr(self, self.DAYS_OF_WEEK[day_of_week])
 
     def day_of_week_full_name(self):
         days = []
@@ -62,3 +179,78 @@ class Price(models.Model):
             if self.__dict__[day]:
                 days.append(str(i+1))
         return ", ".join(days)
+
+
+class PriceTier(models.Model):
+    plan = models.ForeignKey(ChargingPlan, on_delete=models.CASCADE)
+    threshold = models.FloatField(
+        help_text="The tier applies to the usage above this amount in a day or billing "
+                  "period, until the threshold of the next tier. Unit: kWh"
+    )
+    unit_price = models.FloatField(
+        help_text="Added to the unit price of the usage in this tier. Negative for a "
+                  "discount. Exclude GST. Unit: New Zealand cent"
+    )
+
+    def __str__(self):
+        return f"{self.plan} above {self.threshold} kWh"
+
+
+class DailyCost(models.Model):
+    """
+    Ledger of what a meter would be charged under a plan in each local date. Rows of
+    a (meter, plan, versioned, billing_day) tuple cover consecutive dates, so the cost
+    of any period is the difference of two cumulative costs.
+    """
+    # May be in another database than the meters and plans. See
+    # NewZealandElectricity.db.
+    meter = models.ForeignKey(Meter, on_delete=models.DO_NOTHING, db_constraint=False)
+    plan = models.ForeignKey(ChargingPlan, on_delete=models.DO_NOTHING,
+                             db_constraint=False)
+    versioned = models.BooleanField(
+        default=False,
+        help_text="If true, each date is billed with the version of the plan's family "
+                  "applied on that date, and the plan is the earliest version."
+    )
+    billing_day = models.PositiveSmallIntegerField(
+        default=0,
+        help_text="The day of month that each bill starts, if price tiers count the "
+                  "usage in each billing period. Otherwise 0."
+    )
+    date = models.DateField()
+    cost = models.FloatField(help_text="Include GST. Unit: New Zealand cent")
+    cumulative_cost = models.FloatField(
+        help_text="Cost from the first date of this meter and plan in the ledger to "
+                  "this date (inclusive). Include GST. Unit: New Zealand cent"
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['meter', 'plan', 'versioned', 'billing_day', 'date'],
+                name='unique_daily_cost'),
+        ]
+
+    def __str__(self):
+        return f"{self.meter} {self.plan} {self.date.strftime('%Y-%m-%d')}"
+
+
+class FleetReport(models.Model):
+    """
+    Cost of every meter under every plan in a run of the compare_fleet command.
+    """
+    run = models.DateTimeField(db_index=True, help_text="When the run started.")
+    meter = models.ForeignKey(Meter, on_delete=models.CASCADE)
+    plan = models.ForeignKey(ChargingPlan, on_delete=models.CASCADE)
+    versioned = models.BooleanField(
+        default=False,
+        help_text="If true, each date is billed with the version of the plan's family "
+                  "applied on that date, and the plan is the earliest version."
+    )
+    start_date = models.DateField()
+    end_date = models.DateField()
+    cost = models.FloatField(help_text="Include GST. Unit: New Zealand cent")
+    rank = models.PositiveSmallIntegerField(help_text="1 for the cheapest plan.")
+
+    def __str__(self):
+        return f"{self.run.strftime('%Y-%m-%d %H:%M')} {self.meter} {self.plan}"
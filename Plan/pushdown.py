@@ -0,0 +1,200 @@
+"""
+Price usage inside SQLite, so only the daily cost of each plan leaves the database.
+
+The compiled prices of each plan are materialised into temporary tables: the day
+pattern of every local date, and the unit price of every pattern in runs of minutes.
+Usage is converted to local time with a table of UTC offsets, which covers daylight
+saving changes, and joined against those tables. Price tiers use a window sum of the
+usage in each day or billing period, and spot prices are looked up in the price
+series like CompiledTariff does.
+"""
+import numpy as np
+import pandas as pd
+from django.db import connections, router
+
+from Meter.models import Usage
+from Meter.usage import local_date_range
+from NewZealandElectricity.settings import TIME_ZONE
+from .models import SeriesPrice
+from .tariff import (CompiledTariff, MissingPriceError, SERIES_PRICE_TOLERANCE,
+                     billing_period)
+
+# The format of DateTimeField in SQLite, in UTC.
+SQLITE_DATETIME = '%Y-%m-%d %H:%M:%S'
+# SQLite has no infinity literal. Higher than any usage.
+UNBOUNDED = 1e300
+
+TEMPORARY_TABLES = {
+    'pushdown_offset': "(utc_from TEXT, utc_to TEXT, minutes INTEGER)",
+    'pushdown_day': "(tariff INTEGER, date TEXT, version INTEGER, pattern INTEGER, "
+                    "period INTEGER)",
+    'pushdown_price': "(tariff INTEGER, pattern INTEGER, minute_from INTEGER, "
+                      "minute_to INTEGER, unit_price REAL)",
+    'pushdown_version': "(tariff INTEGER, version INTEGER, levy REAL, series_id INTEGER)",
+    'pushdown_tier': "(tariff INTEGER, version INTEGER, tier_from REAL, tier_to REAL, "
+                     "unit_price REAL)",
+}
+TEMPORARY_INDEXES = [
+    "CREATE INDEX temp.pushdown_day_date ON pushdown_day (date, tariff)",
+    "CREATE INDEX temp.pushdown_price_pattern ON pushdown_price "
+    "(tariff, pattern, minute_from)",
+]
+
+SQL_DAILY_COST = f"""
+WITH local_usage AS (
+    SELECT u.time_slot, u.value,
+           datetime(u.time_slot, o.minutes || ' minutes') AS local_time
+    FROM {Usage._meta.db_table} u
+    JOIN pushdown_offset o ON u.time_slot >= o.utc_from AND u.time_slot < o.utc_to
+    WHERE u.meter_id = %s AND u.time_slot >= %s AND u.time_slot < %s
+        AND u.value IS NOT NULL
+), slot AS (
+    SELECT d.tariff, d.date, d.version, d.period, lu.time_slot, lu.value,
+           p.unit_price, v.levy, v.series_id
+    FROM local_usage lu
+    JOIN pushdown_day d ON d.date = date(lu.local_time)
+    JOIN pushdown_price p ON p.tariff = d.tariff AND p.pattern = d.pattern
+        AND p.minute_from <= CAST(strftime('%%H', lu.local_time) AS INTEGER) * 60
+            + CAST(strftime('%%M', lu.local_time) AS INTEGER)
+        AND p.minute_to > CAST(strftime('%%H', lu.local_time) AS INTEGER) * 60
+            + CAST(strftime('%%M', lu.local_time) AS INTEGER)
+    JOIN pushdown_version v ON v.tariff = d.tariff AND v.version = d.version
+), priced AS (
+    SELECT s.tariff, s.date, s.version, s.value, s.levy,
+           s.unit_price + CASE WHEN s.series_id IS NULL THEN 0 ELSE (
+               SELECT sp.unit_price FROM {SeriesPrice._meta.db_table} sp
+               WHERE sp.series_id = s.series_id AND sp.time_slot <= s.time_slot
+                   AND sp.time_slot > datetime(s.time_slot, %s)
+               ORDER BY sp.time_slot DESC LIMIT 1
+           ) END AS slot_price,
+           SUM(s.value) OVER (PARTITION BY s.tariff, s.period ORDER BY s.time_slot)
+               AS cumulative_usage
+    FROM slot s
+)
+SELECT tariff, date,
+       SUM(slot_price * (value + levy)) + COALESCE(SUM((
+           SELECT SUM(t.unit_price * (
+               MIN(MAX(cumulative_usage, t.tier_from), t.tier_to)
+               - MIN(MAX(cumulative_usage - value, t.tier_from), t.tier_to)))
+           FROM pushdown_tier t
+           WHERE t.tariff = priced.tariff AND t.version = priced.version
+       )), 0),
+       SUM(slot_price IS NULL)
+FROM priced
+GROUP BY tariff, date
+"""
+
+
+def _utc_offsets(start_time, end_time):
+    """
+    :return: Rows of (utc_from, utc_to, minutes), the offset from UTC to TIME_ZONE in
+        each interval between start_time and end_time.
+    """
+    hours = pd.date_range(start_time.tz_convert('UTC').floor('h'),
+                          end_time.tz_convert('UTC').ceil('h'), freq='h')
+    offset = (hours.tz_convert(TIME_ZONE).tz_localize(None)
+              - hours.tz_localize(None)).total_seconds().to_numpy() // 60
+    change = np.flatnonzero(np.diff(offset)) + 1
+    bounds = np.concatenate([[0], change, [hours.shape[0] - 1]])
+    utc = hours.strftime(SQLITE_DATETIME)
+    return [(utc[i], utc[j], int(offset[i])) for i, j in zip(bounds[:-1], bounds[1:])]
+
+
+def _materialise(cursor, tariffs, from_date, end_date):
+    """
+    :return: CompiledTariff of each tariff.
+    """
+    dates = np.arange(np.datetime64(from_date, 'D'), np.datetime64(end_date, 'D') + 1)
+    date_text = np.datetime_as_string(dates).tolist()
+    compiled_tariffs = []
+    for k, tariff in enumerate(tariffs):
+        compiled_tariff = CompiledTariff(tariff.versions, tariff.billing_day or 1)
+        compiled_tariffs.append(compiled_tariff)
+        version = compiled_tariff.version_index(dates)
+        pattern, price_index = compiled_tariff.day_pattern(dates)
+        by_billing_period = compiled_tariff.tier_by_billing_period[version]
+        # Tiers restart when the period changes, including from days to bills.
+        period = np.where(by_billing_period,
+                          billing_period(dates, compiled_tariff.billing_day),
+                          dates.astype(np.int64)) * 2 + by_billing_period
+        cursor.executemany(
+            "INSERT INTO pushdown_day VALUES (%s, %s, %s, %s, %s)",
+            zip([k] * dates.shape[0], date_text, version.tolist(), pattern.tolist(),
+                period.tolist()))
+        prices = []
+        for i, unit_price in enumerate(compiled_tariff.price_table[price_index]):
+            # Runs of minutes with the same price.
+            start = np.concatenate([[0], np.flatnonzero(np.diff(unit_price)) + 1])
+            end = np.concatenate([start[1:], [unit_price.shape[0]]])
+            prices += [(k, i, int(a), int(b), float(unit_price[a]))
+                       for a, b in zip(start, end)]
+        cursor.executemany("INSERT INTO pushdown_price VALUES (%s, %s, %s, %s, %s)",
+                           prices)
+        cursor.executemany(
+            "INSERT INTO pushdown_version VALUES (%s, %s, %s, %s)",
+            [(k, j, float(compiled_tariff.levy[j]),
+              series.id if series is not None else None)
+             for j, series in enumerate(compiled_tariff.price_series)])
+        cursor.executemany(
+            "INSERT INTO pushdown_tier VALUES (%s, %s, %s, %s, %s)",
+            [(k, j, float(tier_from), float(min(tier_to, UNBOUNDED)), float(unit_price))
+             for j in range(len(tariff.versions))
+             for tier_from, tier_to, unit_price in zip(
+                compiled_tariff.tier_from[j], compiled_tariff.tier_to[j],
+                compiled_tariff.tier_price[j])
+             if tier_to > tier_from])
+    return compiled_tariffs
+
+
+def sql_daily_cost(meter, tariffs, start_date, end_date):
+    """
+    Only available if the usage is in SQLite.
+
+    :param tariffs: Returned by plan_versions.
+    :return: DataFrame like the cost returned by read_ledger, whose index is every
+        date from start_date to end_date, and the k-th column is the k-th tariff.
+        Include GST. Unit: New Zealand cent
+    """
+    from_date = min(CompiledTariff(t.versions, t.billing_day or 1)
+                    .context_start(start_date) for t in tariffs)
+    start_time, end_time = local_date_range(from_date, end_date)
+    n_days = (end_date - from_date).days + 1
+    variable_cost = np.zeros((n_days, len(tariffs)))
+    # Usage and prices are in the same database. See NewZealandElectricity.db.
+    using = router.db_for_read(Usage)
+    # Not in a transaction, which would begin IMMEDIATE (see settings.SQLITE_OPTIONS)
+    # and hold the write lock of the database. The temporary tables are in temp.
+    with connections[using].cursor() as cursor:
+        for name, columns in TEMPORARY_TABLES.items():
+            cursor.execute(f"DROP TABLE IF EXISTS temp.{name}")
+            cursor.execute(f"CREATE TEMPORARY TABLE {name} {columns}")
+        for sql in TEMPORARY_INDEXES:
+            cursor.execute(sql)
+        try:
+            cursor.executemany("INSERT INTO pushdown_offset VALUES (%s, %s, %s)",
+                               _utc_offsets(start_time, end_time))
+            compiled_tariffs = _materialise(cursor, tariffs, from_date, end_date)
+            cursor.execute(SQL_DAILY_COST, [
+                meter.id, start_time.tz_convert('UTC').strftime(SQLITE_DATETIME),
+                end_time.tz_convert('UTC').strftime(SQLITE_DATETIME),
+                f"-{SERIES_PRICE_TOLERANCE.total_seconds():.0f} seconds",
+            ])
+            rows = cursor.fetchall()
+        finally:
+            for name in TEMPORARY_TABLES:
+                cursor.execute(f"DROP TABLE IF EXISTS temp.{name}")
+    for k, date_, cost, n_missing in rows:
+        if n_missing:
+            series = [s for s in compiled_tariffs[k].price_series if s is not None]
+            raise MissingPriceError(
+                f"Price series {', '.join(map(str, series))} has no price on {date_}.")
+        variable_cost[(pd.Timestamp(date_).date() - from_date).days, k] = cost
+
+    all_dates = np.arange(n_days) + np.datetime64(from_date, 'D')
+    skip = (start_date - from_date).days
+    cost = np.column_stack([
+        ct.daily_cost(all_dates, variable_cost[:, k])
+        for k, ct in enumerate(compiled_tariffs)
+    ]).reshape(n_days, len(tariffs))[skip:]
+    return pd.DataFrame(cost, index=pd.date_range(start_date, end_date, freq='1d').date,
+                        columns=range(len(tariffs)))
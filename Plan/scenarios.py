@@ -0,0 +1,104 @@
+"""
+What-if simulation of shifting electricity usage between times of day.
+
+A shift rule moves a fraction of the usage in a source window of each day to a target
+window of the same day, spread evenly over the target time slots. The shifted usage is
+linear in the fraction, so every scenario is the original usage plus a multiple of the
+rule's usage change, and all scenarios are built and priced as matrices at once.
+"""
+from typing import NamedTuple
+
+import numpy as np
+
+from .tariff import CompiledTariff, local_dates, minute_of_day
+
+
+class ShiftRule(NamedTuple):
+    """
+    Windows are [from, to) in minutes of a day, and wrap over midnight if from >= to.
+    """
+    source_from: int
+    source_to: int
+    target_from: int
+    target_to: int
+
+    def __str__(self):
+        def hhmm(minute):
+            return f"{minute // 60:02d}:{minute % 60:02d}"
+        return (f"{hhmm(self.source_from)}-{hhmm(self.source_to)} > "
+                f"{hhmm(self.target_from)}-{hhmm(self.target_to)}")
+
+
+def in_window(minute, window_from: int, window_to: int) -> np.ndarray:
+    if window_from < window_to:
+        return (minute >= window_from) & (minute < window_to)
+    return (minute >= window_from) | (minute < window_to)
+
+
+def shift_delta(time_slot, value, rule: ShiftRule) -> np.ndarray:
+    """
+    Change of usage in each time slot if all the usage in the source window is
+    shifted. Days without any time slot in the target window are not changed.
+
+    :param time_slot: DatetimeIndex in local time.
+    :param value: Electricity usage (kWh) of each time slot.
+    """
+    minute = minute_of_day(time_slot)
+    source = in_window(minute, rule.source_from, rule.source_to)
+    target = in_window(minute, rule.target_from, rule.target_to)
+    # Overlapped slots are both source and target, so they keep their usage.
+    source &= ~target
+    dates = local_dates(time_slot)
+    unique_dates, day = np.unique(dates, return_inverse=True)
+    n_days = unique_dates.shape[0]
+    n_target = np.bincount(day, weights=target, minlength=n_days)
+    source &= n_target[day] > 0
+    shifted = np.bincount(day, weights=value * source, minlength=n_days)
+    return (np.where(target, shifted[day] / np.maximum(n_target[day], 1), 0)
+            - value * source)
+
+
+def scenario_usage(time_slot, value, rules, fractions) -> np.ndarray:
+    """
+    :param rules: List of ShiftRule.
+    :param fractions: Fractions of the source window's usage to shift, in [0, 1].
+    :return: Array of shape (len(rules), len(fractions), n_slots), the usage of every
+        combination of a rule and a fraction.
+    """
+    delta = np.stack([shift_delta(time_slot, value, rule) for rule in rules])
+    return value + np.asarray(fractions)[:, np.newaxis] * delta[:, np.newaxis, :]
+
+
+def scenario_cost(time_slot, usage, tariffs, start_date, end_date) -> np.ndarray:
+    """
+    Total cost of every usage scenario under every tariff from start_date to
+    end_date (inclusive).
+
+    Apart from price tiers, the cost is linear in the usage, so all scenarios are
+    priced against all tariffs by one matrix product. Tiers are added for the tariffs
+    that have them.
+
+    :param time_slot: DatetimeIndex in local time, until end_date. Time slots before
+        start_date are only counted towards price tiers, so they should begin at the
+        earliest CompiledTariff.context_start of the tariffs.
+    :param usage: Array of shape (..., n_slots).
+    :param tariffs: Returned by plan_versions.
+    :return: Array of shape (..., len(tariffs)). Include GST. Unit: New Zealand cent
+    """
+    all_dates = np.arange(np.datetime64(start_date, 'D'),
+                          np.datetime64(end_date, 'D') + 1)
+    n_slots = time_slot.shape[0]
+    weight = np.empty((len(tariffs), n_slots))
+    constant = np.empty(len(tariffs))
+    tier = np.zeros(usage.shape[:-1] + (len(tariffs),))
+    for k, tariff in enumerate(tariffs):
+        compiled_tariff = CompiledTariff(tariff.versions, tariff.billing_day or 1)
+        dates, version, unit_price = compiled_tariff.unit_price(time_slot)
+        gst = (1 + compiled_tariff.GST_ratio[version]) * (dates >= all_dates[0])
+        weight[k] = unit_price * gst
+        constant[k] = ((weight[k] * compiled_tariff.levy[version]).sum()
+                       + compiled_tariff.daily_cost(all_dates, 0).sum())
+        if compiled_tariff.tier_price.shape[1] > 0:
+            tier[..., k] = (compiled_tariff.tier_cost(dates, version, usage)
+                            * gst).sum(axis=-1)
+    return usage @ weight.T + constant + tier
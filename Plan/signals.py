@@ -0,0 +1,66 @@
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from Meter.models import Meter
+from Meter.signals import usage_changed
+from .models import ChargingPlan, Price, PlanFamily, PriceTier, PriceSeries, SeriesPrice
+
+# The ledger imports numpy and pandas, so the handlers import it when they are called,
+# rather than every process at startup.
+
+
+def bump_data_version(plans):
+    """
+    Mark the plans as changed, e.g. their prices, for the ETags of the pages computed
+    from them.
+
+    :param plans: QuerySet of ChargingPlan.
+    """
+    plans.update(data_version=F('data_version') + 1, data_modified=timezone.now())
+
+
+@receiver(usage_changed)
+def usage_changed_handler(sender, meter, start_date=None, **kwargs):
+    from .ledger import invalidate_meter
+    invalidate_meter(meter, start_date)
+
+
+@receiver([post_save, post_delete], sender=ChargingPlan)
+def plan_changed_handler(sender, instance, **kwargs):
+    from .ledger import invalidate_plan
+    invalidate_plan(instance.id)
+    bump_data_version(ChargingPlan.objects.filter(id=instance.id))
+
+
+@receiver([post_save, post_delete], sender=Price)
+@receiver([post_save, post_delete], sender=PriceTier)
+def price_changed_handler(sender, instance, **kwargs):
+    from .ledger import invalidate_plan
+    invalidate_plan(instance.plan_id)
+    bump_data_version(ChargingPlan.objects.filter(id=instance.plan_id))
+
+
+@receiver(post_save, sender=PlanFamily)
+def family_saved_handler(sender, instance, **kwargs):
+    # The family's name is in the pages of its versions.
+    bump_data_version(ChargingPlan.objects.filter(family=instance))
+
+
+@receiver(post_delete, sender=PlanFamily)
+def family_deleted_handler(sender, instance, **kwargs):
+    from .ledger import invalidate_families
+    invalidate_families()
+
+
+# The ledger and prices are not cascaded, as they may be in another database.
+@receiver(post_delete, sender=Meter)
+def meter_deleted_handler(sender, instance, **kwargs):
+    from .ledger import invalidate_meter
+    invalidate_meter(instance)
+
+
+@receiver(post_delete, sender=PriceSeries)
+def series_deleted_handler(sender, instance, **kwargs):
+    SeriesPrice.objects.filter(series_id=instance.id).delete()
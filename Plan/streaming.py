@@ -0,0 +1,66 @@
+"""
+Compare without holding the usage of the whole range in memory.
+
+The usage is read through a cursor in chunks. A chunk is only priced up to the last
+period boundary in it, i.e. midnight, or the start of a bill if any price tiers count
+the usage in billing periods, so price tiers never span two priced chunks. The rest is
+carried to the next chunk. Only the daily costs of each plan are kept.
+"""
+import numpy as np
+import pandas as pd
+
+from Meter.usage import iter_usage
+from NewZealandElectricity.profiling import stage
+from .tariff import CompiledTariff, local_dates, billing_period
+
+STREAMING_CHUNK_SIZE = 20000
+
+
+def stream_daily_cost(meter, tariffs, start_date, end_date,
+                      chunk_size=STREAMING_CHUNK_SIZE):
+    """
+    :param tariffs: Returned by plan_versions.
+    :return: DataFrame like the cost returned by read_ledger, whose index is every
+        date from start_date to end_date, and the k-th column is the k-th tariff.
+        Include GST. Unit: New Zealand cent
+    """
+    compiled_tariffs = [CompiledTariff(t.versions, t.billing_day or 1) for t in tariffs]
+    from_date = min(ct.context_start(start_date) for ct in compiled_tariffs)
+    billing_day = max((t.billing_day for t in tariffs), default=0)
+    first_date = np.datetime64(from_date, 'D')
+    n_days = (end_date - from_date).days + 1
+    variable_cost = np.zeros((n_days, len(tariffs)))
+
+    def price(time_slot, value):
+        if time_slot.shape[0] == 0:
+            return
+        with stage('price') as price_stage:
+            day = (local_dates(time_slot) - first_date).astype(np.int64)
+            for k, compiled_tariff in enumerate(compiled_tariffs):
+                variable_cost[day[0]:day[-1] + 1, k] += np.bincount(
+                    day - day[0], weights=compiled_tariff.slot_cost(time_slot, value))
+            price_stage.count(time_slot.shape[0] * len(compiled_tariffs))
+
+    carry_time_slot, carry_value = None, None
+    for time_slot, value in iter_usage(meter, from_date, end_date, chunk_size):
+        if carry_time_slot is not None:
+            time_slot = carry_time_slot.append(time_slot)
+            value = np.concatenate([carry_value, value])
+        dates = local_dates(time_slot)
+        period = (billing_period(dates, billing_day) if billing_day
+                  else dates.astype(np.int64))
+        # Keep the last period, which may continue in the next chunk.
+        cut = np.searchsorted(period, period[-1])
+        price(time_slot[:cut], value[:cut])
+        carry_time_slot, carry_value = time_slot[cut:], value[cut:]
+    if carry_time_slot is not None:
+        price(carry_time_slot, carry_value)
+
+    all_dates = first_date + np.arange(n_days)
+    skip = (start_date - from_date).days
+    cost = np.column_stack([
+        ct.daily_cost(all_dates, variable_cost[:, k])
+        for k, ct in enumerate(compiled_tariffs)
+    ]).reshape(n_days, len(tariffs))[skip:]
+    return pd.DataFrame(cost, index=pd.date_range(start_date, end_date, freq='1d').date,
+                        columns=range(len(tariffs)))
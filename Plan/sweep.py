@@ -0,0 +1,116 @@
+"""
+Sweep the parameters of a charging plan over ranges, and find where it breaks even
+with other plans.
+
+For one meter and date range, the cost of a plan only depends on a few aggregates of
+the usage: the energy and the number of time slots billed with each of its prices.
+Hypothetical tariffs are priced from the aggregates by broadcasting, so a grid of tens
+of thousands of tariffs costs about as much as pricing one.
+"""
+from typing import NamedTuple
+
+import numpy as np
+
+from .tariff import CompiledTariff
+
+DAILY_FIXED_PRICE = 'daily_fixed_price'
+DEFAULT_UNIT_PRICE = 'default_unit_price'
+LEVY = 'levy'
+PRICE_PREFIX = 'price:'
+# Tariffs priced in one sweep, x_steps * y_steps, which bounds the memory of the grid.
+MAX_SWEEP_POINTS = 50000
+
+
+class ProfileAggregates(NamedTuple):
+    n_days: int
+    energy: np.ndarray  # kWh billed with each price of CompiledTariff.price_table
+    n_slots: np.ndarray  # Number of time slots billed with each price
+    series_energy: float  # Sum of series unit price * usage. Unit: New Zealand cent
+    series_slots: float  # Sum of series unit price. Unit: New Zealand cent
+    tier_cost: float  # Exclude GST. Unit: New Zealand cent
+
+
+def profile_aggregates(compiled_tariff, time_slot, value, start_date,
+                       end_date) -> ProfileAggregates:
+    """
+    :param compiled_tariff: CompiledTariff of a single version.
+    :param time_slot: DatetimeIndex in local time, until end_date. Time slots before
+        start_date are only counted towards price tiers.
+    :param value: Electricity usage (kWh) of each time slot.
+    """
+    dates, version, price_index = compiled_tariff.price_index(time_slot)
+    in_range = dates >= np.datetime64(start_date, 'D')
+    n_prices = compiled_tariff.price_table.shape[0]
+    series = compiled_tariff.series_unit_price(time_slot, version)[in_range]
+    return ProfileAggregates(
+        n_days=(end_date - start_date).days + 1,
+        energy=np.bincount(price_index[in_range], weights=value[in_range],
+                           minlength=n_prices),
+        n_slots=np.bincount(price_index[in_range], minlength=n_prices).astype(float),
+        series_energy=float(series @ value[in_range]),
+        series_slots=float(series.sum()),
+        tier_cost=float(compiled_tariff.tier_cost(dates, version, value)[in_range].sum()),
+    )
+
+
+def sweep_cost(plan, prices, aggregates: ProfileAggregates, **parameters) -> np.ndarray:
+    """
+    Total cost of a plan with some parameters replaced.
+
+    :param plan: ChargingPlan that the aggregates are computed with.
+    :param prices: Special prices of the plan, sorted by ID.
+    :param parameters: Arrays broadcast together. Keys are DAILY_FIXED_PRICE,
+        DEFAULT_UNIT_PRICE, LEVY, or PRICE_PREFIX followed by the ID of a special price.
+        Missing parameters keep the value of the plan.
+    :return: Array of the broadcast shape. Include GST. Unit: New Zealand cent
+    """
+    shape = np.broadcast_shapes(*(np.shape(x) for x in parameters.values()))
+    unit_price = np.empty(shape + (len(prices) + 1,))
+    unit_price[...] = [plan.default_unit_price] + [p.unit_price for p in prices]
+    if DEFAULT_UNIT_PRICE in parameters:
+        unit_price[..., 0] = parameters[DEFAULT_UNIT_PRICE]
+    for j, price in enumerate(prices, start=1):
+        if f"{PRICE_PREFIX}{price.id}" in parameters:
+            unit_price[..., j] = parameters[f"{PRICE_PREFIX}{price.id}"]
+    daily_fixed_price = parameters.get(DAILY_FIXED_PRICE, plan.daily_fixed_price)
+    levy = parameters.get(LEVY, plan.levy)
+    variable_cost = (unit_price @ aggregates.energy + aggregates.series_energy
+                     + levy * (unit_price @ aggregates.n_slots + aggregates.series_slots)
+                     + aggregates.tier_cost)
+    return ((aggregates.n_days * daily_fixed_price + variable_cost)
+            * (1 + plan.GST_ratio))
+
+
+def plan_aggregates(plan, time_slot, value, start_date, end_date, billing_day=1):
+    """
+    :return: (prices, aggregates), the special prices of the plan and its
+        ProfileAggregates.
+    """
+    compiled_tariff = CompiledTariff([plan], billing_day)
+    return compiled_tariff.prices[0], profile_aggregates(
+        compiled_tariff, time_slot, value, start_date, end_date)
+
+
+def break_even(x, cost, other_cost) -> np.ndarray:
+    """
+    Where a cost curve crosses a constant, by linear interpolation between the grid
+    points. The cost is linear in every single parameter, so it's exact unless both
+    the levy and a unit price are swept.
+
+    :param x: Parameter values, sorted ascending.
+    :param cost: Cost at each x, in the last axis.
+    :param other_cost: Broadcast to cost without its last axis.
+    :return: Array of shape cost.shape[:-1], the first crossing point of each curve,
+        or NaN if it never crosses.
+    """
+    difference = cost - np.asarray(other_cost)[..., np.newaxis]
+    crossing = (np.sign(difference[..., 1:]) != np.sign(difference[..., :-1]))
+    crossing |= difference[..., :-1] == 0
+    has_crossing = crossing.any(axis=-1)
+    i = np.argmax(crossing, axis=-1)[..., np.newaxis]
+    d0 = np.take_along_axis(difference, i, axis=-1)[..., 0]
+    d1 = np.take_along_axis(difference, i + 1, axis=-1)[..., 0]
+    i = i[..., 0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.where(d0 == d1, 0, d0 / (d0 - d1))
+    return np.where(has_crossing, x[i] + ratio * (x[i + 1] - x[i]), np.nan)
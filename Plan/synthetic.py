@@ -0,0 +1,45 @@
+"""
+Synthetic catalogues of charging plans, for benchmarks.
+"""
+from datetime import time
+
+import numpy as np
+
+from .models import ChargingPlan, Price
+
+SYNTHETIC_COMPANY = "Synthetic"
+
+
+def create_synthetic_plans(n_plans, n_prices, applied_date, seed=None) -> list:
+    """
+    Create time of use plans, each with n_prices special prices in random windows of
+    whole half hours, on random days of week, and some only in a range of months.
+
+    :return: The created ChargingPlan objects.
+    """
+    rng = np.random.default_rng(seed)
+    n_existed = ChargingPlan.objects.filter(company=SYNTHETIC_COMPANY).count()
+    plans = []
+    for i in range(n_existed, n_existed + n_plans):
+        plan = ChargingPlan.objects.create(
+            company=SYNTHETIC_COMPANY, name=f"Plan {i}", applied_date=applied_date,
+            daily_fixed_price=round(rng.uniform(30, 250), 2),
+            levy=round(rng.uniform(0.1, 0.4), 3),
+            default_unit_price=round(rng.uniform(18, 35), 2))
+        prices = []
+        for j in range(n_prices):
+            start, end = map(int, np.sort(rng.choice(49, 2, replace=False)))
+            days = rng.random(7) < 0.6
+            seasonal = rng.random() < 0.3
+            prices.append(Price(
+                plan=plan, name=f"Window {j}", unit_price=round(rng.uniform(0, 45), 2),
+                time_from=time(start // 2, start % 2 * 30),
+                time_to=time(23, 59, 59) if end == 48 else time(end // 2, end % 2 * 30),
+                month_from=int(rng.integers(1, 13)) if seasonal else None,
+                month_to=int(rng.integers(1, 13)) if seasonal else None,
+                public_holiday=str(rng.choice([Price.AS_DAY_OF_WEEK, Price.ALWAYS,
+                                               Price.NEVER])),
+                **dict(zip(Price.DAYS_OF_WEEK, days.tolist()))))
+        Price.objects.bulk_create(prices)
+        plans.append(plan)
+    return plans
@@ -0,0 +1,289 @@
+import numpy as np
+import pandas as pd
+
+from .holidays import is_public_holiday
+from .models import ChargingPlan, SeriesPrice
+
+MINUTES_PER_DAY = 24 * 60
+# A price in a price series applies until the next price, but no longer than this.
+SERIES_PRICE_TOLERANCE = pd.Timedelta(hours=1)
+
+
+class MissingPriceError(ValueError):
+    pass
+
+
+def _minute_ceil(t) -> int:
+    seconds = t.hour * 3600 + t.minute * 60 + t.second + t.microsecond / 1e6
+    return int(np.ceil(seconds / 60))
+
+
+def minute_of_day(time_slot) -> np.ndarray:
+    """
+    :param time_slot: DatetimeIndex in local time.
+    """
+    return time_slot.hour.to_numpy() * 60 + time_slot.minute.to_numpy()
+
+
+def local_dates(time_slot) -> np.ndarray:
+    """
+    :param time_slot: DatetimeIndex in local time.
+    :return: The local date of each time slot, in dtype datetime64[D].
+    """
+    return time_slot.tz_localize(None).to_numpy().astype('datetime64[D]')
+
+
+def day_of_week(dates) -> np.ndarray:
+    """
+    :param dates: Array of dtype datetime64[D].
+    :return: Monday = 0, Sunday = 6.
+    """
+    # 1970-01-01 is Thursday.
+    return (dates.astype(np.int64) + 3) % 7
+
+
+def billing_period(dates, billing_day: int) -> np.ndarray:
+    """
+    :param dates: Array of dtype datetime64[D].
+    :return: The billing period of each date, numbered by the month that it starts.
+    """
+    month = dates.astype('datetime64[M]')
+    day_of_month = (dates - month).astype(np.int64) + 1
+    return month.astype(np.int64) - (day_of_month < billing_day)
+
+
+def compile_day_price_source(prices, day_of_week_: int, month: int,
+                             holiday: bool) -> np.ndarray:
+    """
+    Which price of a charging plan applies in every minute of a kind of day.
+
+    A special price applies to the slots starting in [time_from, time_to). When
+    special prices overlap, the one created later wins.
+
+    :param prices: Special prices of the plan, sorted by ID.
+    :return: 0 for the default unit price, and j for prices[j - 1].
+    """
+    source = np.zeros(MINUTES_PER_DAY, dtype=np.int64)
+    for j, price in enumerate(prices, start=1):
+        if price.applies_on(day_of_week_, month, holiday):
+            source[_minute_ceil(price.time_from):_minute_ceil(price.time_to)] = j
+    return source
+
+
+def series_unit_price(series, time_slot) -> np.ndarray:
+    """
+    Align a price series to time slots, like pandas.merge_asof in backward direction:
+    each time slot gets the latest price that starts at or before it.
+
+    :param series: PriceSeries
+    :param time_slot: DatetimeIndex, sorted ascending.
+    :return: Exclude GST. Unit: New Zealand cent
+    """
+    if time_slot.shape[0] == 0:
+        return np.empty(0)
+    prices = SeriesPrice.objects.filter(
+        series=series, time_slot__gt=time_slot[0] - SERIES_PRICE_TOLERANCE,
+        time_slot__lte=time_slot[-1],
+    ).order_by('time_slot').values_list('time_slot', 'unit_price')
+    price_time, unit_price = zip(*prices) if prices else ((), ())
+    price_time = pd.DatetimeIndex(price_time, tz='UTC').asi8
+    unit_price = np.asarray(unit_price, dtype=np.float64)
+    t = time_slot.asi8
+    i = np.searchsorted(price_time, t, side='right') - 1
+    missing = i < 0
+    if price_time.shape[0] > 0:
+        missing |= t - price_time[np.maximum(i, 0)] >= SERIES_PRICE_TOLERANCE.value
+    if missing.any():
+        raise MissingPriceError(
+            f"Price series {series} has no price at {time_slot[np.argmax(missing)]}.")
+    return unit_price[i]
+
+
+class CompiledTariff:
+    """
+    Unit prices of one or more versions of a charging plan. Every date is mapped to a
+    day pattern, which is decided by the version, day of week, month and whether it's
+    a public holiday. Each distinct pattern is compiled once, so pricing a usage series
+    is a single gather instead of one mask per special price and version.
+
+    Each date is billed with the latest version applied on or before it. The dates
+    before the first version are billed with the first version.
+    """
+
+    def __init__(self, versions, billing_day=1):
+        """
+        :param versions: Charging plans sorted by applied_date ascending.
+        :param billing_day: The day of month that each bill starts. Only used by price
+            tiers counting the usage in each billing period.
+        """
+        self.versions = list(versions)
+        self.applied_date = np.array([v.applied_date for v in self.versions],
+                                     dtype='datetime64[D]')
+        self.prices = [list(v.price_set.order_by('id')) for v in self.versions]
+        # Version k's default unit price is price_table[price_offset[k]], followed by
+        # its special prices.
+        self.price_table = np.array([
+            price for v, prices in zip(self.versions, self.prices)
+            for price in [v.default_unit_price] + [p.unit_price for p in prices]
+        ])
+        self.price_offset = np.cumsum([0] + [len(p) + 1 for p in self.prices])[:-1]
+        self._patterns = {}
+        self.daily_fixed_price = np.array([v.daily_fixed_price for v in self.versions])
+        self.levy = np.array([v.levy for v in self.versions])
+        self.GST_ratio = np.array([v.GST_ratio for v in self.versions])
+        self.price_series = [v.price_series if v.price_type == ChargingPlan.SPOT else None
+                             for v in self.versions]
+
+        # Tier j of version k covers the cumulative usage in [tier_from[k, j],
+        # tier_to[k, j]). Versions with fewer tiers are padded with empty tiers.
+        tiers = [list(v.pricetier_set.order_by('threshold')
+                      .values_list('threshold', 'unit_price')) for v in self.versions]
+        n_tiers = max(len(t) for t in tiers)
+        self.tier_from = np.zeros((len(self.versions), n_tiers))
+        self.tier_to = np.zeros((len(self.versions), n_tiers))
+        self.tier_price = np.zeros((len(self.versions), n_tiers))
+        for k, version_tiers in enumerate(tiers):
+            for j, (threshold, unit_price) in enumerate(version_tiers):
+                self.tier_from[k, j] = threshold
+                self.tier_to[k, j] = np.inf
+                self.tier_price[k, j] = unit_price
+                if j > 0:
+                    self.tier_to[k, j - 1] = threshold
+        self.tier_by_billing_period = np.array([
+            v.tier_period == ChargingPlan.BILLING_PERIOD and bool(t)
+            for v, t in zip(self.versions, tiers)
+        ])
+        self.billing_day = billing_day
+
+    def version_index(self, dates) -> np.ndarray:
+        """
+        :param dates: Array of dtype datetime64[D].
+        :return: Position in self.versions of the version applied on each date.
+        """
+        return np.maximum(
+            np.searchsorted(self.applied_date, dates, side='right') - 1, 0)
+
+    def day_pattern(self, dates):
+        """
+        :param dates: Array of dtype datetime64[D].
+        :return: (pattern, price_index), where the price in minute m of dates[i] is
+            self.price_table[price_index[pattern[i], m]].
+        """
+        version = self.version_index(dates)
+        month = dates.astype('datetime64[M]').astype(np.int64) % 12 + 1
+        key = np.stack([version, day_of_week(dates), month, is_public_holiday(dates)],
+                       axis=1)
+        unique_key, pattern = np.unique(key, axis=0, return_inverse=True)
+        price_index = np.empty((unique_key.shape[0], MINUTES_PER_DAY), dtype=np.int64)
+        for i, (k, day_of_week_, month_, holiday) in enumerate(unique_key.tolist()):
+            if (k, day_of_week_, month_, holiday) not in self._patterns:
+                self._patterns[k, day_of_week_, month_, holiday] = (
+                    self.price_offset[k] + compile_day_price_source(
+                        self.prices[k], day_of_week_, month_, bool(holiday)))
+            price_index[i] = self._patterns[k, day_of_week_, month_, holiday]
+        return pattern.ravel(), price_index
+
+    def context_start(self, date_):
+        """
+        The earliest date whose usage affects the cost of date_. It's the first date
+        of the billing period if price tiers count the usage in billing periods.
+        """
+        if not self.tier_by_billing_period.any():
+            return date_
+        date_ = pd.Timestamp(date_)
+        if date_.day < self.billing_day:
+            date_ -= pd.DateOffset(months=1)
+        return date_.replace(day=self.billing_day).date()
+
+    def tier_cost(self, dates, version, value) -> np.ndarray:
+        """
+        Extra cost of price tiers in each time slot. Exclude GST.
+
+        :param dates: Local date of each time slot, in dtype datetime64[D]. The time
+            slots must be sorted, and the first one starts a day or billing period.
+        :param version: Position of the version applied on each time slot.
+        :param value: Electricity usage (kWh) of each time slot, in the last axis.
+            Leading axes, e.g. one per usage scenario, are priced independently.
+        :return: Same shape as value. Unit: New Zealand cent
+        """
+        if self.tier_price.shape[1] == 0 or value.shape[-1] == 0:
+            return np.zeros(value.shape)
+        by_billing_period = self.tier_by_billing_period[version]
+        period = np.where(by_billing_period, billing_period(dates, self.billing_day),
+                          dates.astype(np.int64))
+        period_start = np.ones(value.shape[-1], dtype=bool)
+        period_start[1:] = ((period[1:] != period[:-1])
+                            | (by_billing_period[1:] != by_billing_period[:-1]))
+        # Cumulative usage in the period at the end of each time slot.
+        cumulative_usage = np.cumsum(value, axis=-1)
+        period_base = (cumulative_usage - value)[..., period_start]
+        cumulative_usage -= period_base[..., np.cumsum(period_start) - 1]
+        tier_from = self.tier_from[version]
+        tier_to = self.tier_to[version]
+        usage_in_tier = (np.clip(cumulative_usage[..., np.newaxis], tier_from, tier_to)
+                         - np.clip((cumulative_usage - value)[..., np.newaxis], tier_from,
+                                   tier_to))
+        return (usage_in_tier * self.tier_price[version]).sum(axis=-1)
+
+    def price_index(self, time_slot):
+        """
+        :param time_slot: DatetimeIndex in local time.
+        :return: (dates, version, price_index), the local date, the position of the
+            applied version and the position in self.price_table of the applied price
+            of each time slot.
+        """
+        dates = local_dates(time_slot)
+        version = self.version_index(dates)
+        unique_dates, date_position = np.unique(dates, return_inverse=True)
+        pattern, pattern_price_index = self.day_pattern(unique_dates)
+        price_index = pattern_price_index.ravel()[
+            pattern[date_position] * MINUTES_PER_DAY + minute_of_day(time_slot)]
+        return dates, version, price_index
+
+    def series_unit_price(self, time_slot, version) -> np.ndarray:
+        """
+        Unit price of the price series of spot versions in each time slot, and 0 for
+        the other versions.
+        """
+        unit_price = np.zeros(time_slot.shape[0])
+        for k, series in enumerate(self.price_series):
+            if series is None:
+                continue
+            mask = version == k
+            unit_price[mask] = series_unit_price(series, time_slot[mask])
+        return unit_price
+
+    def unit_price(self, time_slot):
+        """
+        :param time_slot: DatetimeIndex in local time.
+        :return: (dates, version, unit_price), the local date, the position of the
+            applied version and the unit price (exclude GST, New Zealand cent) of each
+            time slot.
+        """
+        dates, version, price_index = self.price_index(time_slot)
+        return (dates, version, self.price_table[price_index]
+                + self.series_unit_price(time_slot, version))
+
+    def slot_cost(self, time_slot, value) -> np.ndarray:
+        """
+        Variable cost of each time slot. Exclude daily fixed charge and GST.
+
+        :param time_slot: DatetimeIndex in local time.
+        :param value: Electricity usage (kWh) of each time slot.
+        :return: Unit: New Zealand cent
+        """
+        dates, version, unit_price = self.unit_price(time_slot)
+        return (unit_price * (value + self.levy[version])
+                + self.tier_cost(dates, version, value))
+
+    def daily_cost(self, dates, variable_cost) -> np.ndarray:
+        """
+        Add daily fixed charge and GST to the variable cost of each date.
+
+        :param dates: Array of dtype datetime64[D].
+        :param variable_cost: Variable cost of each date, exclude GST.
+        :return: Include GST. Unit: New Zealand cent
+        """
+        version = self.version_index(dates)
+        return ((variable_cost + self.daily_fixed_price[version])
+                * (1 + self.GST_ratio[version]))
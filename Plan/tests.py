@@ -1,3 +1,459 @@
-from django.test import TestCase
+import csv
+import io
+import os
+import sqlite3
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, time
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+
+from ContactEnergy.models import ContactEnergyMeter
+from Meter.fields import meter_choice
+from Meter.models import Meter, MeterGroup, Usage
+from Meter.signals import usage_changed
+from Meter.synthetic import create_synthetic_meters
+from Meter.usage import load_usage
+from NewZealandElectricity.db import USAGE_DB
+from NewZealandElectricity.settings import TIME_ZONE
+from .fleet import compare_meter
+from .holidays import easter_sunday, is_public_holiday, nz_public_holidays
+from .ledger import (billing_periods, period_cost, plan_versions, read_ledger,
+                     rolling_periods)
+from .models import (ChargingPlan, DailyCost, FleetReport, Price, PlanFamily, PriceTier,
+                     PriceSeries, SeriesPrice)
+from .pushdown import sql_daily_cost
+from .streaming import stream_daily_cost
+from .sweep import DEFAULT_UNIT_PRICE, break_even, plan_aggregates, sweep_cost
+from .synthetic import create_synthetic_plans
+from .tariff import CompiledTariff, MissingPriceError
+from .views import daily_cost_table
+
 
 # Create your tests here.
+class PricingEngineTest(TestCase):
+    """
+    The SQL pushdown engine against the pandas engines, over both daylight saving
+    changes of 2023.
+    """
+    databases = '__all__'
+    start_date = date(2023, 3, 20)
+    end_date = date(2023, 10, 10)
+
+    @classmethod
+    def setUpTestData(cls):
+        contact_energy_meter = ContactEnergyMeter.objects.create(
+            account_number="500", contract_id="900")
+        cls.meter = Meter.objects.create(
+            provider=ContentType.objects.get_for_model(ContactEnergyMeter),
+            meter_id=contact_energy_meter.id)
+        time_slot = pd.date_range(cls.start_date, cls.end_date + pd.Timedelta(days=1),
+                                  freq='30min', tz=TIME_ZONE, inclusive='left')
+        value = np.random.default_rng(0).uniform(0, 1.5, time_slot.shape[0])
+        value[100:110] = np.nan
+        Usage.objects.bulk_create([
+            Usage(meter=cls.meter, time_slot=t, value=None if np.isnan(v) else v)
+            for t, v in zip(time_slot, value.tolist())
+        ])
+
+        family = PlanFamily.objects.create(name="Good Nights")
+        weekdays = dict(Monday=True, Tuesday=True, Wednesday=True, Thursday=True,
+                        Friday=True)
+        for applied_date, night_price in [(date(2023, 1, 1), 0),
+                                          (date(2023, 6, 15), 5)]:
+            plan = ChargingPlan.objects.create(
+                company="Contact", name="Good Nights", family=family,
+                applied_date=applied_date, daily_fixed_price=100, levy=0.3,
+                default_unit_price=30)
+            Price.objects.create(plan=plan, name="night", unit_price=night_price,
+                                 time_from=time(21), time_to=time(23, 59, 59),
+                                 public_holiday=Price.ALWAYS, **weekdays)
+            Price.objects.create(plan=plan, name="winter peak", unit_price=40,
+                                 time_from=time(7), time_to=time(9, 30), month_from=5,
+                                 month_to=8, **weekdays)
+
+        tier_day = ChargingPlan.objects.create(
+            company="X", name="Tier day", applied_date=date(2023, 1, 1),
+            daily_fixed_price=50, levy=0.2, default_unit_price=25)
+        PriceTier.objects.create(plan=tier_day, threshold=8, unit_price=5)
+        PriceTier.objects.create(plan=tier_day, threshold=15, unit_price=10)
+        tier_bill = ChargingPlan.objects.create(
+            company="X", name="Tier bill", applied_date=date(2023, 1, 1),
+            daily_fixed_price=50, levy=0.2, default_unit_price=25,
+            tier_period=ChargingPlan.BILLING_PERIOD)
+        PriceTier.objects.create(plan=tier_bill, threshold=300, unit_price=-3)
+
+        cls.series = PriceSeries.objects.create(name="HAY2201")
+        price_time = pd.date_range(cls.start_date - pd.Timedelta(days=1),
+                                   cls.end_date + pd.Timedelta(days=1), freq='h',
+                                   tz=TIME_ZONE)
+        SeriesPrice.objects.bulk_create([
+            SeriesPrice(series=cls.series, time_slot=t, unit_price=p)
+            for t, p in zip(price_time, np.random.default_rng(1).uniform(
+                5, 30, price_time.shape[0]).tolist())
+        ])
+        ChargingPlan.objects.create(
+            company="Flick", name="Spot", applied_date=date(2023, 1, 1),
+            daily_fixed_price=80, levy=0.3, default_unit_price=8,
+            price_type=ChargingPlan.SPOT, price_series=cls.series)
+
+    def assertEnginesAgree(self, versioned, billing_day, start_date, end_date):
+        tariffs = plan_versions(list(ChargingPlan.objects.all()), versioned, billing_day)
+        ledger_cost, _ = read_ledger(self.meter, tariffs, start_date, end_date)
+        streaming_cost = stream_daily_cost(self.meter, tariffs, start_date, end_date,
+                                           chunk_size=1000)
+        sql_cost = sql_daily_cost(self.meter, tariffs, start_date, end_date)
+        np.testing.assert_allclose(streaming_cost.to_numpy(), ledger_cost.to_numpy())
+        np.testing.assert_allclose(sql_cost.to_numpy(), ledger_cost.to_numpy())
+        self.assertEqual(list(sql_cost.index), list(ledger_cost.index))
+
+    def test_whole_range(self):
+        self.assertEnginesAgree(False, 1, self.start_date, self.end_date)
+
+    def test_versions_and_billing_day(self):
+        self.assertEnginesAgree(True, 17, date(2023, 4, 1), date(2023, 9, 30))
+
+    def test_missing_spot_price(self):
+        SeriesPrice.objects.filter(
+            series=self.series, time_slot__date=date(2023, 5, 2)).delete()
+        tariffs = plan_versions(list(ChargingPlan.objects.filter(
+            price_type=ChargingPlan.SPOT)))
+        with self.assertRaises(MissingPriceError):
+            sql_daily_cost(self.meter, tariffs, self.start_date, self.end_date)
+        with self.assertRaises(MissingPriceError):
+            stream_daily_cost(self.meter, tariffs, self.start_date, self.end_date)
+
+    def test_sweep(self):
+        # The sweep prices unsaved tariffs like the ledger prices saved ones.
+        plan = ChargingPlan.objects.get(name="Tier bill")
+        other = ChargingPlan.objects.get(name="Spot")
+        start_date, end_date = date(2023, 4, 10), date(2023, 6, 30)
+
+        def total_cost(plan_):
+            cost, _ = read_ledger(self.meter, plan_versions([plan_], False, 17),
+                                  start_date, end_date)
+            return cost.to_numpy().sum()
+
+        context_start = CompiledTariff([plan], 17).context_start(start_date)
+        time_slot, value = load_usage(self.meter, context_start, end_date)
+        prices, aggregates = plan_aggregates(plan, time_slot, value, start_date,
+                                             end_date, 17)
+        x = np.linspace(0, 60, 7)
+        cost = sweep_cost(plan, prices, aggregates, **{DEFAULT_UNIT_PRICE: x})
+        for unit_price, c in zip(x[::3].tolist(), cost[::3].tolist()):
+            plan.default_unit_price = unit_price
+            plan.save()
+            self.assertAlmostEqual(c, total_cost(plan), delta=1)
+
+        other_cost = total_cost(other)
+        point, = break_even(x, cost, [other_cost]).tolist()
+        plan.default_unit_price = point
+        plan.save()
+        self.assertAlmostEqual(total_cost(plan), other_cost, delta=1)
+        self.assertTrue(np.isnan(break_even(x, cost, cost.max() + 1)))
+
+    def test_sweep_size(self):
+        plan = ChargingPlan.objects.get(name="Tier bill")
+        data = {'meter': meter_choice(self.meter), 'start_date': date(2023, 4, 1),
+                'end_date': date(2023, 4, 30), 'plan': plan.id,
+                'x_parameter': 'daily_fixed_price', 'x_from': 0, 'x_to': 100,
+                'y_parameter': 'levy', 'y_from': 0, 'y_to': 1}
+        for x_steps, y_steps, error in [(201, 201, False), (1001, 51, True),
+                                        (2001, 2, True)]:
+            with self.subTest(x_steps=x_steps, y_steps=y_steps):
+                response = self.client.post('/sweep/action', {
+                    **data, 'x_steps': x_steps, 'y_steps': y_steps})
+                self.assertEqual(error, b"Sweep at most" in response.content
+                                 or b"less than or equal to 1001" in response.content)
+
+
+@override_settings(DATABASE_ROUTERS=['NewZealandElectricity.db.UsageRouter'])
+class PushdownLockTest(TransactionTestCase):
+    """
+    The SQL pushdown engine reads the usage database while another connection writes
+    it, instead of waiting for the write lock.
+    """
+    databases = {DEFAULT_DB_ALIAS, USAGE_DB}
+    start_date = date(2024, 6, 24)
+    end_date = date(2024, 6, 30)
+
+    def test_compare_while_writing(self):
+        meter, = create_synthetic_meters(1, self.start_date, self.end_date, seed=0)
+        tariffs = plan_versions(create_synthetic_plans(2, 2, self.start_date, seed=0))
+        writer = sqlite3.connect(connections[USAGE_DB].settings_dict['NAME'],
+                                 isolation_level=None)
+        try:
+            writer.execute("BEGIN IMMEDIATE")
+            sql_cost = sql_daily_cost(meter, tariffs, self.start_date, self.end_date)
+            writer.execute("ROLLBACK")
+        finally:
+            writer.close()
+        streaming_cost = stream_daily_cost(meter, tariffs, self.start_date,
+                                           self.end_date)
+        np.testing.assert_allclose(sql_cost.to_numpy(), streaming_cost.to_numpy())
+
+
+class LedgerTest(TestCase):
+    """
+    The ledger is extended and rebuilt only from the changed dates, and gives the same
+    costs as when built at once.
+    """
+    databases = '__all__'
+    start_date = date(2024, 1, 15)
+    end_date = date(2024, 4, 10)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.meter, = create_synthetic_meters(1, cls.start_date, cls.end_date, seed=0)
+        plans = create_synthetic_plans(2, 2, date(2024, 1, 1), seed=0)
+        tier_bill = ChargingPlan.objects.create(
+            company="X", name="Tier bill", applied_date=date(2024, 1, 1),
+            daily_fixed_price=50, levy=0.2, default_unit_price=25,
+            tier_period=ChargingPlan.BILLING_PERIOD)
+        PriceTier.objects.create(plan=tier_bill, threshold=300, unit_price=-3)
+        cls.tariffs = plan_versions(plans + [tier_bill], billing_day=28)
+
+    def ledger_rows(self) -> dict:
+        return {(row.plan_id, row.date): row.id
+                for row in DailyCost.objects.filter(meter=self.meter)}
+
+    def assertSameAsRebuilt(self, start_date, end_date):
+        cost, cumulative_cost = read_ledger(self.meter, self.tariffs, start_date,
+                                            end_date)
+        DailyCost.objects.filter(meter=self.meter).delete()
+        rebuilt_cost, rebuilt_cumulative = read_ledger(self.meter, self.tariffs,
+                                                       self.start_date, end_date)
+        np.testing.assert_allclose(cost.to_numpy(), rebuilt_cost.loc[start_date:]
+                                   .to_numpy())
+        # The cumulative costs may start from another date, but not their differences.
+        np.testing.assert_allclose(np.diff(cumulative_cost.to_numpy(), axis=0),
+                                   np.diff(rebuilt_cumulative.loc[start_date:].to_numpy(),
+                                           axis=0))
+
+    def test_incremental(self):
+        read_ledger(self.meter, self.tariffs, self.start_date, date(2024, 2, 20))
+        rows = self.ledger_rows()
+        read_ledger(self.meter, self.tariffs, date(2024, 2, 1), self.end_date)
+        extended = self.ledger_rows()
+        self.assertEqual({key: extended[key] for key in rows}, rows)
+        self.assertEqual(len(extended), len(self.tariffs) * 87)
+        self.assertSameAsRebuilt(self.start_date, self.end_date)
+
+    def test_invalidation(self):
+        read_ledger(self.meter, self.tariffs, self.start_date, self.end_date)
+        rows = self.ledger_rows()
+        changed = date(2024, 3, 5)
+        Usage.objects.filter(meter=self.meter, time_slot=pd.Timestamp(
+            '2024-03-05 18:00', tz=TIME_ZONE)).update(value=25)
+        usage_changed.send(sender=Usage, meter=self.meter, start_date=changed,
+                           end_date=changed)
+        self.assertEqual(set(self.ledger_rows()),
+                         {key for key in rows if key[1] < changed})
+        read_ledger(self.meter, self.tariffs, self.start_date, self.end_date)
+        rebuilt = self.ledger_rows()
+        self.assertEqual({key for key in rows if rebuilt[key] == rows[key]},
+                         {key for key in rows if key[1] < changed})
+        self.assertSameAsRebuilt(self.start_date, self.end_date)
+
+    def test_periods(self):
+        cost, cumulative_cost = read_ledger(self.meter, self.tariffs, self.start_date,
+                                            self.end_date)
+        period_start, period_end = billing_periods(self.start_date, self.end_date, 28)
+        dates = cost.index
+        # Partial first and last bills, and the bill with 29 February.
+        self.assertEqual(list(zip(dates[period_start], dates[period_end])), [
+            (date(2024, 1, 15), date(2024, 1, 27)),
+            (date(2024, 1, 28), date(2024, 2, 27)),
+            (date(2024, 2, 28), date(2024, 3, 27)),
+            (date(2024, 3, 28), date(2024, 4, 10)),
+        ])
+        np.testing.assert_allclose(
+            period_cost(cost, cumulative_cost, period_start, period_end),
+            [cost.iloc[i:j + 1].sum().to_numpy()
+             for i, j in zip(period_start, period_end)])
+
+        period_start, period_end = rolling_periods(cost.shape[0], 30)
+        np.testing.assert_allclose(
+            period_cost(cost, cumulative_cost, period_start, period_end),
+            cost.rolling(30).sum().iloc[29:].to_numpy())
+
+
+class GroupCostTest(TestCase):
+    """
+    A meter group is priced by streaming, whatever the engine.
+    """
+    databases = '__all__'
+    start_date = date(2024, 6, 24)
+    end_date = date(2024, 7, 3)
+
+    def test_streaming(self):
+        meters = create_synthetic_meters(2, self.start_date, self.end_date, seed=0)
+        meters += create_synthetic_meters(1, self.start_date, self.end_date,
+                                          interval_minutes=60, seed=1)
+        group = MeterGroup.objects.create(name="Home")
+        group.meters.set(meters)
+        plans = create_synthetic_plans(2, 2, date(2024, 1, 1), seed=0)
+        tier_bill = ChargingPlan.objects.create(
+            company="X", name="Tier bill", applied_date=date(2024, 1, 1),
+            daily_fixed_price=50, levy=0.2, default_unit_price=25,
+            tier_period=ChargingPlan.BILLING_PERIOD)
+        PriceTier.objects.create(plan=tier_bill, threshold=100, unit_price=-3)
+        tariffs = plan_versions(plans + [tier_bill], billing_day=28)
+
+        # In one chunk, as the group is summed by load_group_usage.
+        at_once = stream_daily_cost(group, tariffs, self.start_date, self.end_date,
+                                    chunk_size=10 ** 6)
+        in_chunks = stream_daily_cost(group, tariffs, self.start_date, self.end_date,
+                                      chunk_size=50)
+        np.testing.assert_allclose(in_chunks.to_numpy(), at_once.to_numpy())
+        cost, cumulative_cost = daily_cost_table(group, tariffs, self.start_date,
+                                                 self.end_date, engine='ledger')
+        np.testing.assert_allclose(cost.to_numpy(), at_once.to_numpy())
+        self.assertFalse(DailyCost.objects.exists())
+
+
+class CompareFleetTest(TransactionTestCase):
+    """
+    compare_fleet, whose workers are threads here, as the processes wouldn't see the
+    test database. Committed, for the connections of the threads.
+    """
+    databases = '__all__'
+    start_date = date(2024, 6, 24)
+    end_date = date(2024, 6, 30)
+
+    def test_compare_fleet(self):
+        meters = create_synthetic_meters(2, self.start_date, self.end_date, seed=0)
+        plans = create_synthetic_plans(3, 2, date(2024, 1, 1), seed=0)
+        tariffs = plan_versions(plans)
+        with tempfile.TemporaryDirectory() as directory, mock.patch(
+                'Plan.management.commands.compare_fleet.ProcessPoolExecutor',
+                ThreadPoolExecutor):
+            path = os.path.join(directory, 'fleet.csv')
+            call_command('compare_fleet', '--start-date', str(self.start_date),
+                         '--end-date', str(self.end_date), '--workers', '2',
+                         '--csv', path, stdout=io.StringIO())
+            with open(path, newline='') as f:
+                rows = list(csv.DictReader(f))
+        self.assertEqual(len(rows), 2 * 3)
+        for meter in meters:
+            cost = stream_daily_cost(meter, tariffs, self.start_date,
+                                     self.end_date).sum().to_numpy()
+            reports = FleetReport.objects.filter(meter=meter).order_by('rank')
+            self.assertEqual([report.plan_id for report in reports],
+                             [tariffs[k].plan.id for k in np.argsort(cost)])
+            np.testing.assert_allclose([report.cost for report in reports],
+                                       np.sort(cost))
+
+    def test_missing(self):
+        plan, = create_synthetic_plans(1, 2, date(2024, 1, 1), seed=0)
+        args = (False, 1, self.start_date, self.end_date)
+        self.assertEqual(compare_meter(404, [plan.id], *args),
+                         (404, [], "The meter does not exist."))
+        meter, = create_synthetic_meters(1, self.start_date, self.end_date, seed=0)
+        self.assertEqual(compare_meter(meter.id, [404], *args),
+                         (meter.id, [], "None of the plans exist."))
+
+
+class TierTest(TestCase):
+    """
+    CompiledTariff.tier_cost against costs computed by hand.
+    """
+    def compiled(self, tier_period, tiers, billing_day=1):
+        plan = ChargingPlan.objects.create(
+            company="X", name="Tiers", applied_date=date(2024, 1, 1),
+            daily_fixed_price=50, levy=0.2, default_unit_price=25,
+            tier_period=tier_period)
+        for threshold, unit_price in tiers:
+            PriceTier.objects.create(plan=plan, threshold=threshold,
+                                     unit_price=unit_price)
+        return CompiledTariff([plan], billing_day)
+
+    def test_threshold_in_slot(self):
+        compiled_tariff = self.compiled(ChargingPlan.DAY, [(8, 5), (15, 10)])
+        dates = np.array(['2024-03-01'] * 3 + ['2024-03-02'], dtype='datetime64[D]')
+        value = np.array([[5, 5, 10, 9], [0, 8, 0, 16]], dtype=float)
+        # 8 to 10 kWh in the first tier; 10 to 15 in the first and 15 to 20 in the
+        # second; the next day from 0 again.
+        np.testing.assert_allclose(
+            compiled_tariff.tier_cost(dates, np.zeros(4, dtype=int), value),
+            [[0, 2 * 5, 5 * 5 + 5 * 10, 1 * 5], [0, 0, 0, 7 * 5 + 1 * 10]])
+
+    def test_billing_period(self):
+        compiled_tariff = self.compiled(ChargingPlan.BILLING_PERIOD, [(300, -3)], 28)
+        dates = np.array(['2024-01-27', '2024-01-28', '2024-02-10', '2024-02-27',
+                          '2024-02-28'], dtype='datetime64[D]')
+        value = np.array([400, 200, 150, 10, 10], dtype=float)
+        # Bills start on 28 December, 28 January and 28 February, not on 1 February.
+        np.testing.assert_allclose(
+            compiled_tariff.tier_cost(dates, np.zeros(5, dtype=int), value),
+            [-100 * 3, 0, -50 * 3, -10 * 3, 0])
+
+
+class DataVersionTest(TestCase):
+    def test_save(self):
+        plan = ChargingPlan.objects.create(company="Contact", name="Basic",
+                                           applied_date=date(2024, 1, 1),
+                                           daily_fixed_price=100, levy=0.3,
+                                           default_unit_price=30)
+        version = ChargingPlan.objects.get(id=plan.id).data_version
+        Price.objects.create(plan=plan, name="night", unit_price=10, time_from=time(21),
+                             time_to=time(23, 59, 59))
+        # Saved again with the version before the price was added.
+        plan.name = "Basic 2"
+        plan.save()
+        self.assertGreater(ChargingPlan.objects.get(id=plan.id).data_version, version + 1)
+
+
+class HolidayTest(SimpleTestCase):
+    def test_easter_sunday(self):
+        for day in [date(2019, 4, 21), date(2024, 3, 31), date(2025, 4, 20),
+                    date(2038, 4, 25), date(2285, 3, 22)]:
+            self.assertEqual(easter_sunday(day.year), day)
+
+    def test_mondayisation(self):
+        for observed, holiday in [
+            (date(2021, 12, 27), True),  # Christmas on Saturday
+            (date(2021, 12, 28), True),  # Boxing Day on Sunday
+            (date(2022, 12, 27), True),  # Christmas on Sunday, Boxing Day on Monday
+            (date(2022, 12, 28), False),
+            (date(2022, 1, 3), True),  # New Year's Day on Saturday
+            (date(2022, 1, 4), True),
+            (date(2021, 2, 8), True),  # Waitangi Day on Saturday
+            (date(2013, 2, 8), False),  # Before Waitangi Day was Mondayised
+            (date(2020, 4, 27), True),  # Anzac Day on Saturday
+            (date(2009, 4, 27), False),  # Before Anzac Day was Mondayised
+        ]:
+            with self.subTest(observed=observed):
+                self.assertEqual(observed in nz_public_holidays(observed.year), holiday)
+
+    def test_matariki(self):
+        self.assertIn(date(2052, 6, 21), nz_public_holidays(2052))
+        self.assertEqual(is_public_holiday(np.array(
+            ['2024-06-28', '2024-06-21'], dtype='datetime64[D]')).tolist(),
+            [True, False])
+        nz_public_holidays.cache_clear()
+        with self.assertWarnsRegex(RuntimeWarning, "Matariki in 2053"):
+            nz_public_holidays(2053)
+
+    def test_applies_on(self):
+        price = Price(name="summer weekday", unit_price=10, time_from=time(7),
+                      time_to=time(9), month_from=11, month_to=2, Monday=True)
+        # (day of week, month, holiday): applies for each public_holiday
+        for args, as_day, always, never in [
+            ((0, 12, False), True, True, True),
+            ((0, 1, True), True, True, False),
+            ((5, 2, True), False, True, False),
+            ((0, 3, True), False, False, False),  # Out of season
+        ]:
+            for public_holiday, expected in [(Price.AS_DAY_OF_WEEK, as_day),
+                                              (Price.ALWAYS, always),
+                                              (Price.NEVER, never)]:
+                with self.subTest(args=args, public_holiday=public_holiday):
+                    price.public_holiday = public_holiday
+                    self.assertEqual(price.applies_on(*args), expected)
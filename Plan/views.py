@@ -1,29 +1,55 @@
-import pandas as pd
+import re
+
+import numpy as np
 import pyecharts
+import pyecharts.components
 from bs4 import BeautifulSoup
 from django import forms
+from django.db import connections, router
 from django.db.utils import OperationalError, ProgrammingError
 from django.http import HttpResponse
 from django.shortcuts import render, redirect
-from django.views.decorators.http import require_POST
-
-from Meter.models import Meter, Usage
+from django.views.decorators.http import require_POST, require_http_methods
+
+from Meter.fields import MeterOrGroupField, first_meter_choice
+from Meter.models import MeterGroup, Usage
+from Meter.usage import load_usage, usage_version
+from NewZealandElectricity.conditional import (not_modified, page_validators,
+                                               request_data, set_validators)
+from NewZealandElectricity.profiling import stage
 from NewZealandElectricity.settings import TIME_ZONE
-from .models import ChargingPlan, Price
+from .bootstrap import bootstrap_cost
+from .ledger import (read_ledger, period_cost, billing_periods, rolling_periods,
+                     plan_versions, tariff_version)
+from .models import ChargingPlan, Price, PlanFamily, PriceTier
+from .pushdown import sql_daily_cost
+from .streaming import stream_daily_cost
+from .scenarios import ShiftRule, scenario_usage, scenario_cost
+from .sweep import (DAILY_FIXED_PRICE, DEFAULT_UNIT_PRICE, LEVY, MAX_SWEEP_POINTS,
+                    PRICE_PREFIX, plan_aggregates, sweep_cost, break_even)
+from .tariff import CompiledTariff, MissingPriceError
 
 
 # Create your views here.
 def view_plans(req, failed_reason=None):
-    plans = ChargingPlan.objects.all()
+    plans = ChargingPlan.objects.select_related('family')
     return render(req, "plans.html", context={
         "plans": plans, "failed_reason": failed_reason,
     })
 
 
 class ChangeChargingPlan(forms.ModelForm):
+    family_name = forms.CharField(
+        required=False, max_length=96, label="Family",
+        widget=forms.TextInput({"class": "form-control"}),
+        help_text="Versions of the same plan share a family name, and each version "
+                  "applies from its applied date. Leave empty if this plan has no other "
+                  "versions.",
+    )
+
     class Meta:
         model = ChargingPlan
-        exclude = []
+        exclude = ['family']
         widgets = {
             "company": forms.TextInput({"class": "form-control"}),
             "name": forms.TextInput({"class": "form-control"}),
@@ -38,12 +64,31 @@ class ChangeChargingPlan(forms.ModelForm):
             "default_unit_price": forms.TextInput(
                 {"class": "form-control", "type": "number",
                  "step": "any"}),
+            "price_type": forms.Select({"class": "form-select"}),
+            "price_series": forms.Select({"class": "form-select"}),
+            "tier_period": forms.Select({"class": "form-select"}),
         }
         labels = {
             "daily_fixed_price": "Fixed daily charge",
             "default_unit_price": "Unit price in other time",
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance and self.instance.family_id:
+            self.fields['family_name'].initial = self.instance.family.name
+
+    def save(self, commit=True):
+        instance = super().save(commit=False)
+        family_name = self.cleaned_data.get('family_name', '').strip()
+        if family_name:
+            instance.family, _ = PlanFamily.objects.get_or_create(name=family_name)
+        else:
+            instance.family = None
+        if commit:
+            instance.save()
+        return instance
+
 
 def view_change_plan(req, plan_id: int, failed_reason=None):
     try:
@@ -113,7 +158,8 @@ class ChangePrice(forms.ModelForm):
 
     class Meta:
         model = Price
-        fields = ['plan', 'name', 'unit_price', 'time_from', 'time_to']
+        fields = ['plan', 'name', 'unit_price', 'time_from', 'time_to', 'month_from',
+                  'month_to', 'public_holiday']
         widgets = {
             'plan': forms.HiddenInput(),
             "name": forms.TextInput({"class": "form-control"}),
@@ -123,6 +169,14 @@ class ChangePrice(forms.ModelForm):
                                           "step": 1}),
             "time_to": forms.TimeInput({"class": "form-control", "type": "time",
                                         "step": 1}),
+            "month_from": forms.Select({"class": "form-select"}),
+            "month_to": forms.Select({"class": "form-select"}),
+            "public_holiday": forms.Select({"class": "form-select"}),
+        }
+        labels = {
+            "month_from": "First month",
+            "month_to": "Last month",
+            "public_holiday": "On public holidays",
         }
         help_texts = {
             "time_from": f"Time zone is {TIME_ZONE}.",
@@ -226,11 +280,111 @@ def delete_price(req, price_id: int):
         return redirect("/plans")
 
 
+class ChangePriceTier(forms.ModelForm):
+    class Meta:
+        model = PriceTier
+        fields = ['plan', 'threshold', 'unit_price']
+        widgets = {
+            'plan': forms.HiddenInput(),
+            "threshold": forms.TextInput({"class": "form-control", "type": "number",
+                                          "step": "any"}),
+            "unit_price": forms.TextInput({"class": "form-control", "type": "number",
+                                           "step": "any"}),
+        }
+
+
+def view_change_tier(req, tier_id: int, failed_reason=None):
+    try:
+        tier = PriceTier.objects.get(id=tier_id)
+    except PriceTier.DoesNotExist:
+        return view_plans(req, "This price tier is not found.")
+    return render(req, 'change_tier.html', context={
+        "plan": tier.plan,
+        "change_tier_form": ChangePriceTier(instance=tier),
+        "tier": tier,
+        "failed_reason": failed_reason,
+    })
+
+
+@require_POST
+def change_tier(req, tier_id: int):
+    try:
+        tier = PriceTier.objects.get(id=tier_id)
+    except PriceTier.DoesNotExist:
+        return add_tier(req)
+    tier_form = ChangePriceTier(req.POST, instance=tier)
+    if not tier_form.is_valid():
+        return render(req, 'change_tier.html', context={
+            "plan": tier.plan,
+            "change_tier_form": ChangePriceTier(instance=tier),
+            "tier": tier,
+            "failed_reason": tier_form.errors.as_text(),
+        })
+    tier_form.save()
+    return redirect(f'/tiers/{tier.id}')
+
+
+@require_POST
+def add_tier(req):
+    tier = PriceTier()
+    tier_form = ChangePriceTier(req.POST, instance=tier)
+    if not tier_form.is_valid():
+        try:
+            plan = ChargingPlan.objects.get(id=int(req.POST.get('plan')))
+        except (TypeError, ValueError, ChargingPlan.DoesNotExist):
+            return view_plans(req, "This charging plan is not found.")
+        return render(req, 'change_tier.html', context={
+            "plan": plan,
+            "change_tier_form": tier_form,
+            "tier": None,
+            "failed_reason": tier_form.errors.as_text(),
+        })
+    tier_form.save()
+    return redirect(f'/tiers/{tier.id}')
+
+
+def view_add_tier(req, plan_id: int, failed_reason=None):
+    try:
+        plan = ChargingPlan.objects.get(id=plan_id)
+    except ChargingPlan.DoesNotExist:
+        return view_plans(req, "This charging plan is not found.")
+    return render(req, 'change_tier.html', context={
+        "plan": plan,
+        "change_tier_form": ChangePriceTier(initial={"plan": plan}),
+        "failed_reason": failed_reason,
+    })
+
+
+def delete_tier(req, tier_id: int):
+    try:
+        tier = PriceTier.objects.get(id=tier_id)
+        plan = tier.plan
+        tier.delete()
+        return redirect(f'/plans/{plan.id}')
+    except PriceTier.DoesNotExist:
+        return redirect("/plans")
+
+
+def daily_cost_table(meter, tariffs, start_date, end_date, engine='ledger'):
+    """
+    :param meter: Meter or MeterGroup.
+    :param engine: 'ledger', 'streaming' or 'sql'.
+    :return: (cost, cumulative_cost) like read_ledger.
+    """
+    if isinstance(meter, MeterGroup):
+        # The ledger and SQL pushdown read the usage of one meter.
+        engine = 'streaming'
+    if engine == 'streaming':
+        cost = stream_daily_cost(meter, tariffs, start_date, end_date)
+    elif engine == 'sql':
+        cost = sql_daily_cost(meter, tariffs, start_date, end_date)
+    else:
+        return read_ledger(meter, tariffs, start_date, end_date)
+    return cost, cost.cumsum()
+
+
 class Compare(forms.Form):
-    meter = forms.ModelChoiceField(
-        queryset=Meter.objects.all(), required=True,
-        widget=forms.Select({"class": "form-select"}),
-    )
+    meter = MeterOrGroupField(required=True)
     plans = forms.ModelMultipleChoiceField(
         queryset=ChargingPlan.objects.all(),
         widget=forms.SelectMultiple({'style': 'display: block; width: 100%;',
@@ -246,11 +400,41 @@ class Compare(forms.Form):
         required=True, widget=forms.DateInput({
             "class": "form-control", "type": "date", "min": "1996-01-01"}),
     )
+    billing_day = forms.IntegerField(
+        required=False, initial=1, min_value=1, max_value=28,
+        widget=forms.NumberInput({"class": "form-control"}),
+        help_text="The day of month that each bill starts.",
+    )
+    follow_versions = forms.BooleanField(
+        required=False, initial=True,
+        widget=forms.CheckboxInput({"style": "width: 1.5rem; height: 1.5rem;"}),
+        help_text="Bill each date with the version of the plan's family applied on "
+                  "that date. Otherwise, each selected plan applies to all dates.",
+    )
+    engine = forms.ChoiceField(
+        required=False, initial='ledger',
+        choices=[('ledger', "Daily cost ledger"), ('streaming', "Streaming"),
+                 ('sql', "SQL pushdown")],
+        widget=forms.Select({"class": "form-select"}),
+        help_text="The ledger stores the daily cost of each plan, so repeated "
+                  "comparisons only price new dates. Streaming reads the usage in chunks "
+                  "and keeps no ledger, which bounds the memory for very long ranges. "
+                  "SQL pushdown prices the usage inside SQLite and only reads the daily "
+                  "costs. Meter groups are always priced by streaming.",
+    )
+    resamples = forms.IntegerField(
+        required=False, initial=0, min_value=0, max_value=100000,
+        label="Bootstrap resamples",
+        widget=forms.NumberInput({"class": "form-control"}),
+        help_text="Resample the dates with replacement this many times, e.g. 2000, to "
+                  "estimate 95% confidence intervals and the probability that each plan "
+                  "is the cheapest. 0 to disable.",
+    )
 
     def __init__(self, *args, **kwargs):
         super(Compare, self).__init__(*args, **kwargs)
         try:
-            self.fields['meter'].initial = Meter.objects.first()
+            self.fields['meter'].initial = first_meter_choice()
         except (OperationalError, ProgrammingError):
             pass
 
@@ -263,48 +447,54 @@ def view_compare(req, failed_reason=None):
     })
 
 
-@require_POST
+@require_http_methods(['GET', 'POST'])
 def compare(req):
-    compare_form = Compare(req.POST)
+    compare_form = Compare(request_data(req))
     if not compare_form.is_valid():
         return view_compare(req, failed_reason=compare_form.errors.as_text())
     meter = compare_form.cleaned_data['meter']
+    plans = list(compare_form.cleaned_data['plans'])
     start_date = compare_form.cleaned_data['start_date']
     end_date = compare_form.cleaned_data['end_date']
+    billing_day = compare_form.cleaned_data['billing_day'] or 1
     if start_date > end_date:
         start_date, end_date = end_date, start_date
-    start_date_midnight = (pd.to_datetime(start_date)
-                           .tz_localize(tz=TIME_ZONE, ambiguous=False))
-    end_date_next_midnight = (pd.to_datetime(end_date + pd.Timedelta(days=1))
-                              .tz_localize(tz=TIME_ZONE, ambiguous=False))
-    usage = Usage.objects.filter(
-        meter=meter, time_slot__gte=start_date_midnight,
-        time_slot__lt=end_date_next_midnight, value__isnull=False,
-    ).order_by('time_slot').values('time_slot', 'value')
-    usage = pd.DataFrame.from_records(usage)
-    usage['time_slot'] = usage['time_slot'].dt.tz_convert(tz=TIME_ZONE)
-    usage['time'] = usage['time_slot'].dt.time
-    usage['day_of_week'] = usage['time_slot'].dt.dayofweek
+    tariffs = plan_versions(plans, compare_form.cleaned_data['follow_versions'],
+                            billing_day)
+    engine = compare_form.cleaned_data['engine']
+    if engine == 'sql' and connections[router.db_for_read(Usage)].vendor != 'sqlite':
+        return view_compare(req, failed_reason="SQL pushdown needs SQLite.")
+    meter_version, meter_modified = usage_version(meter)
+    plan_version, plan_modified = tariff_version(tariffs)
+    validators = page_validators(
+        req, [meter_version, plan_version],
+        max((t for t in [meter_modified, plan_modified] if t), default=None))
+    if response := not_modified(req, validators):
+        return response
+    try:
+        with stage('cost') as cost_stage:
+            cost, cumulative_cost = daily_cost_table(meter, tariffs, start_date,
+                                                     end_date, engine)
+            cost_stage.count(cost.size)
+    except MissingPriceError as e:
+        return view_compare(req, failed_reason=str(e))
+    dates = cost.index
 
     plan_name = []
-    total_price = []
-    total_days = (end_date_next_midnight - start_date_midnight) / pd.Timedelta(days=1)
-    for i, plan in enumerate(compare_form.cleaned_data['plans']):
-        usage[str(plan.id)] = plan.default_unit_price
-        for price in plan.price_set.all():
-            for j, day in enumerate(Price.DAYS_OF_WEEK):
-                if getattr(price, day):
-                    usage.loc[(usage['day_of_week'] == j) &
-                              (usage['time'] < price.time_to) &
-                              (usage['time'] >= price.time_from), str(plan.id)] = (
-                        price.unit_price
-                    )
-        total_price.append(round((
-                (usage[str(plan.id)] * (usage['value'] + plan.levy)).sum()
-                + total_days * plan.daily_fixed_price
-        ) * (1 + plan.GST_ratio)) / 100)
-        plan_name.append(("\n\n\n" if i % 2 == 0 else "") +
-                         f"{plan.company}\n{plan.name}\n{plan.applied_date}")
+    plan_label = []
+    for i, tariff in enumerate(tariffs):
+        plan = tariff.plan
+        if tariff.versioned:
+            description = [plan.company, plan.family.name,
+                           f"{len(tariff.versions)} versions"]
+        else:
+            description = [plan.company, plan.name, str(plan.applied_date)]
+        plan_name.append(("\n\n\n" if i % 2 == 0 else "") + "\n".join(description))
+        plan_label.append(" ".join(description))
+    total_price = [
+        round(x) / 100 for x in
+        period_cost(cost, cumulative_cost, [0], [dates.shape[0] - 1])[0].tolist()
+    ]
 
     bar = pyecharts.charts.Bar()
     bar.add_xaxis(plan_name)
@@ -323,14 +513,467 @@ def compare(req):
     bar_grid = pyecharts.charts.Grid(init_opts=pyecharts.options.InitOpts(width="100%"))
     bar_grid.add(bar, grid_opts=pyecharts.options.GridOpts(pos_bottom="20%"))
 
+    period_start, period_end = billing_periods(start_date, end_date, billing_day)
+    bills = np.round(period_cost(cost, cumulative_cost, period_start, period_end)) / 100
+    period_name = [f"{dates[i]} ~ {dates[j]}" for i, j in zip(period_start, period_end)]
+    bills_bar = pyecharts.charts.Bar(init_opts=pyecharts.options.InitOpts(width="100%"))
+    bills_bar.add_xaxis(period_name)
+    for k, label in enumerate(plan_label):
+        bills_bar.add_yaxis(label, bills[:, k].tolist(),
+                            label_opts=pyecharts.options.LabelOpts(is_show=False))
+    bills_bar.set_global_opts(
+        title_opts=pyecharts.options.TitleOpts(
+            title=f"Electricity fee of bills starting on day {billing_day} of each month",
+        ),
+        datazoom_opts=[
+            pyecharts.options.DataZoomOpts(xaxis_index=0),
+        ],
+        xaxis_opts=pyecharts.options.AxisOpts(type_="category", name="Bill"),
+        yaxis_opts=pyecharts.options.AxisOpts(min_=0, name="Electricity fee (NZD)"),
+        legend_opts=pyecharts.options.LegendOpts(pos_top="30px"),
+        tooltip_opts=pyecharts.options.TooltipOpts(trigger="axis"),
+    )
+    bills_table = pyecharts.components.Table()
+    bills_table.add(["Bill"] + plan_label,
+                    [[name] + row for name, row in zip(period_name, bills.tolist())])
+
+    rolling_start, rolling_end = rolling_periods(dates.shape[0], 30)
+    rolling = np.round(period_cost(cost, cumulative_cost, rolling_start, rolling_end)) / 100
+    rolling_line = pyecharts.charts.Line(init_opts=pyecharts.options.InitOpts(width="100%"))
+    rolling_line.add_xaxis([str(dates[j]) for j in rolling_end])
+    for k, label in enumerate(plan_label):
+        rolling_line.add_yaxis(label, rolling[:, k].tolist(), is_symbol_show=False,
+                               label_opts=pyecharts.options.LabelOpts(is_show=False))
+    rolling_line.set_global_opts(
+        title_opts=pyecharts.options.TitleOpts(
+            title="Electricity fee of the 30 days ending on each date",
+        ),
+        datazoom_opts=[
+            pyecharts.options.DataZoomOpts(xaxis_index=0),
+        ],
+        yaxis_opts=pyecharts.options.AxisOpts(min_=0, name="Electricity fee (NZD)"),
+        legend_opts=pyecharts.options.LegendOpts(pos_top="30px"),
+        tooltip_opts=pyecharts.options.TooltipOpts(trigger="axis"),
+    )
+
     tab = pyecharts.charts.Tab(page_title="New Zealand Electricity")
     tab.add(bar_grid, "Comparison")
+    tab.add(bills_bar, "Bills")
+    tab.add(bills_table, "Bills table")
+    tab.add(rolling_line, "Rolling 30 days")
+
+    resamples = compare_form.cleaned_data['resamples']
+    if resamples:
+        with stage('bootstrap') as bootstrap_stage:
+            result = bootstrap_cost(cost.to_numpy(), resamples)
+            bootstrap_stage.count(resamples)
+        bootstrap_table = pyecharts.components.Table()
+        bootstrap_table.add(
+            ["Plan", "Electricity fee (NZD)", "95% confidence interval (NZD)",
+             "Probability of being the cheapest"],
+            [[label, total, f"{round(low) / 100} ~ {round(high) / 100}", f"{p:.1%}"]
+             for label, total, low, high, p in zip(
+                plan_label, total_price, result.low.tolist(), result.high.tolist(),
+                result.p_cheapest.tolist())],
+        )
+        tab.add(bootstrap_table, "Confidence")
+    with stage('render'):
+        htm = tab.render_embed()
+
+    with stage('soup'):
+        tree = BeautifulSoup(htm, 'html.parser')
+        tab_tag = tree.find('div', class_='tab')
+        back_tag = tree.new_tag(
+            'a', href='/compare',
+            style='font-family: "Helvetica Neue", Helvetica, Arial, sans-serif; '
+                  'padding: 10px; '
+        )
+        back_tag.string = 'Back'
+        if tab_tag:
+            tab_tag.insert_before(back_tag)
+        htm = str(tree)
+
+    return set_validators(HttpResponse(htm), validators)
+
+
+class ShiftScenarios(Compare):
+    engine = None
+    resamples = None
+    rules = forms.CharField(
+        required=True, initial="17:00-21:00 > 21:00-07:00\n07:00-09:00 > 10:00-16:00",
+        widget=forms.Textarea({"class": "form-control", "rows": "4"}),
+        help_text="One rule per line, as \"source window > target window\", e.g. "
+                  "\"17:00-21:00 > 21:00-07:00\". The usage moved from the source window "
+                  "is spread evenly over the target window of the same day.",
+    )
+    fractions = forms.CharField(
+        required=True, initial="10, 20, 30, 40, 50",
+        widget=forms.TextInput({"class": "form-control"}),
+        help_text="Percentages of the usage in the source window to move, separated by "
+                  "commas.",
+    )
+
+    def clean_rules(self):
+        time = r'([01]?\d|2[0-3]):([0-5]\d)'
+        pattern = re.compile(rf'^\s*{time}\s*-\s*{time}\s*>\s*{time}\s*-\s*{time}\s*$')
+        rules = []
+        for line in self.cleaned_data['rules'].splitlines():
+            if not line.strip():
+                continue
+            match = pattern.match(line)
+            if not match:
+                raise forms.ValidationError(f"Invalid shift rule: {line}")
+            minutes = [int(h) * 60 + int(m) for h, m in zip(match.groups()[::2],
+                                                            match.groups()[1::2])]
+            rules.append(ShiftRule(*minutes))
+        if not rules:
+            raise forms.ValidationError("At least one shift rule is required.")
+        return rules
+
+    def clean_fractions(self):
+        try:
+            percentages = [float(x) for x in self.cleaned_data['fractions'].split(',')
+                           if x.strip()]
+        except ValueError:
+            raise forms.ValidationError("Percentages must be numbers.")
+        if not percentages or not all(0 <= x <= 100 for x in percentages):
+            raise forms.ValidationError("Percentages must be between 0 and 100.")
+        return [x / 100 for x in percentages]
+
+
+def view_scenarios(req, failed_reason=None):
+    scenarios_form = ShiftScenarios()
+    return render(req, 'scenarios.html', context={
+        "failed_reason": failed_reason,
+        "scenarios_form": scenarios_form,
+    })
+
+
+@require_POST
+def scenarios(req):
+    scenarios_form = ShiftScenarios(req.POST)
+    if not scenarios_form.is_valid():
+        return view_scenarios(req, failed_reason=scenarios_form.errors.as_text())
+    meter = scenarios_form.cleaned_data['meter']
+    plans = list(scenarios_form.cleaned_data['plans'])
+    start_date = scenarios_form.cleaned_data['start_date']
+    end_date = scenarios_form.cleaned_data['end_date']
+    billing_day = scenarios_form.cleaned_data['billing_day'] or 1
+    rules = scenarios_form.cleaned_data['rules']
+    fractions = scenarios_form.cleaned_data['fractions']
+    if start_date > end_date:
+        start_date, end_date = end_date, start_date
+    tariffs = plan_versions(plans, scenarios_form.cleaned_data['follow_versions'],
+                            billing_day)
+    context_start = min(CompiledTariff(t.versions, t.billing_day or 1)
+                        .context_start(start_date) for t in tariffs)
+    time_slot, value = load_usage(meter, context_start, end_date)
+    usage = scenario_usage(time_slot, value, rules, [0.0] + fractions)
+    try:
+        # Shape (n_rules, 1 + n_fractions, n_tariffs), where fraction 0 is no shift.
+        cost = scenario_cost(time_slot, usage, tariffs, start_date, end_date)
+    except MissingPriceError as e:
+        return view_scenarios(req, failed_reason=str(e))
+    total_price = np.round(cost) / 100
+    saving = total_price[:, :1, :] - total_price[:, 1:, :]
+
+    plan_label = []
+    for tariff in tariffs:
+        plan = tariff.plan
+        if tariff.versioned:
+            plan_label.append(f"{plan.company} {plan.family.name}")
+        else:
+            plan_label.append(f"{plan.company} {plan.name} {plan.applied_date}")
+    scenario_label = [f"{rule}, {fraction:.0%}" for rule in rules for fraction in fractions]
+    saving = saving.reshape(-1, len(tariffs))
+
+    heatmap = pyecharts.charts.HeatMap(init_opts=pyecharts.options.InitOpts(
+        width="100%", height=f"{max(400, 40 * len(plan_label) + 200)}px"))
+    heatmap.add_xaxis(scenario_label)
+    heatmap.add_yaxis(
+        "Saving (NZD)", plan_label,
+        [[i, k, round(x, 2)] for i, row in enumerate(saving.tolist())
+         for k, x in enumerate(row)],
+        label_opts=pyecharts.options.LabelOpts(is_show=True, position="inside"),
+    )
+    heatmap.set_global_opts(
+        title_opts=pyecharts.options.TitleOpts(
+            title="Saving compared with the original usage (NZD)",
+        ),
+        xaxis_opts=pyecharts.options.AxisOpts(
+            type_="category", name="Scenario",
+            axislabel_opts=pyecharts.options.LabelOpts(interval=0, rotate=30),
+        ),
+        yaxis_opts=pyecharts.options.AxisOpts(type_="category", name="Plan"),
+        visualmap_opts=pyecharts.options.VisualMapOpts(
+            min_=min(0.0, float(saving.min())), max_=max(0.0, float(saving.max())),
+            orient="horizontal", pos_left="center",
+        ),
+        legend_opts=pyecharts.options.LegendOpts(is_show=False),
+    )
+    heatmap_grid = pyecharts.charts.Grid(
+        init_opts=pyecharts.options.InitOpts(width="100%"))
+    heatmap_grid.add(heatmap, grid_opts=pyecharts.options.GridOpts(
+        pos_left="25%", pos_bottom="25%"))
+
+    fee_table = pyecharts.components.Table()
+    fee_table.add(
+        ["Scenario"] + plan_label,
+        [["Original usage"] + total_price[0, 0].tolist()]
+        + [[label] + row for label, row in zip(
+            scenario_label, total_price[:, 1:, :].reshape(-1, len(tariffs)).tolist())],
+    )
+
+    tab = pyecharts.charts.Tab(page_title="New Zealand Electricity")
+    tab.add(heatmap_grid, "Saving")
+    tab.add(fee_table, "Electricity fee")
+    htm = tab.render_embed()
+
+    tree = BeautifulSoup(htm, 'html.parser')
+    tab_tag = tree.find('div', class_='tab')
+    back_tag = tree.new_tag(
+        'a', href='/scenarios',
+        style='font-family: "Helvetica Neue", Helvetica, Arial, sans-serif; '
+              'padding: 10px; '
+    )
+    back_tag.string = 'Back'
+    if tab_tag:
+        tab_tag.insert_before(back_tag)
+
+    return HttpResponse(str(tree))
+
+
+class Sweep(Compare):
+    engine = None
+    resamples = None
+    plan = forms.ModelChoiceField(
+        queryset=ChargingPlan.objects.all(), required=True, label="Plan to sweep",
+        widget=forms.Select({"class": "form-select"}),
+    )
+    plans = forms.ModelMultipleChoiceField(
+        queryset=ChargingPlan.objects.all(), required=False, label="Compare with",
+        widget=forms.SelectMultiple({'style': 'display: block; width: 100%;',
+                                     'size': '7', 'class': 'form-control'}),
+        help_text="Hold \"Control\" and click to select multiple items."
+    )
+    x_parameter = forms.ChoiceField(widget=forms.Select({"class": "form-select"}))
+    x_from = forms.FloatField(widget=forms.NumberInput({"class": "form-control",
+                                                        "step": "any"}))
+    x_to = forms.FloatField(widget=forms.NumberInput({"class": "form-control",
+                                                      "step": "any"}))
+    x_steps = forms.IntegerField(
+        initial=201, min_value=2, max_value=1001,
+        widget=forms.NumberInput({"class": "form-control"}),
+    )
+    y_parameter = forms.ChoiceField(
+        required=False, widget=forms.Select({"class": "form-select"}),
+        help_text="Optional. Sweep a grid of two parameters.",
+    )
+    y_from = forms.FloatField(required=False, widget=forms.NumberInput(
+        {"class": "form-control", "step": "any"}))
+    y_to = forms.FloatField(required=False, widget=forms.NumberInput(
+        {"class": "form-control", "step": "any"}))
+    y_steps = forms.IntegerField(
+        initial=201, min_value=2, max_value=1001,
+        widget=forms.NumberInput({"class": "form-control"}),
+    )
+    field_order = ['meter', 'plan', 'plans']
+
+    def __init__(self, *args, **kwargs):
+        super(Sweep, self).__init__(*args, **kwargs)
+        choices = [
+            (DAILY_FIXED_PRICE, "Fixed daily charge (cent, exclude GST)"),
+            (DEFAULT_UNIT_PRICE, "Unit price in other time (cent, exclude GST)"),
+            (LEVY, "Levy (cent, exclude GST)"),
+        ]
+        try:
+            choices += [
+                (f"{PRICE_PREFIX}{price.id}",
+                 f"{price.plan}: {price.name} unit price (cent, exclude GST)")
+                for price in Price.objects.select_related('plan').order_by('plan', 'id')
+            ]
+        except (OperationalError, ProgrammingError):
+            pass
+        self.fields['x_parameter'].choices = choices
+        self.fields['y_parameter'].choices = [("", "None")] + choices
+
+    def clean(self):
+        cleaned_data = super(Sweep, self).clean()
+        plan = cleaned_data.get('plan')
+        axes = ['x'] + (['y'] if cleaned_data.get('y_parameter') else [])
+        for axis in axes:
+            parameter = cleaned_data.get(f'{axis}_parameter', '')
+            if plan and parameter.startswith(PRICE_PREFIX) and not plan.price_set.filter(
+                    id=int(parameter[len(PRICE_PREFIX):])).exists():
+                raise forms.ValidationError(
+                    f"The {axis} parameter is a price of another plan.")
+            if cleaned_data.get(f'{axis}_from') is None or cleaned_data.get(
+                    f'{axis}_to') is None or cleaned_data.get(f'{axis}_steps') is None:
+                raise forms.ValidationError(f"The range of {axis} is required.")
+        if len(axes) == 2 and cleaned_data['x_parameter'] == cleaned_data['y_parameter']:
+            raise forms.ValidationError("Sweep two different parameters.")
+        if len(axes) == 2 and (cleaned_data['x_steps'] * cleaned_data['y_steps']
+                               > MAX_SWEEP_POINTS):
+            raise forms.ValidationError(
+                f"Sweep at most {MAX_SWEEP_POINTS} points (x steps * y steps).")
+        return cleaned_data
+
+
+def view_sweep(req, failed_reason=None):
+    sweep_form = Sweep()
+    return render(req, 'sweep.html', context={
+        "failed_reason": failed_reason,
+        "sweep_form": sweep_form,
+    })
+
+
+@require_POST
+def sweep(req):
+    sweep_form = Sweep(req.POST)
+    if not sweep_form.is_valid():
+        return view_sweep(req, failed_reason=sweep_form.errors.as_text())
+    meter = sweep_form.cleaned_data['meter']
+    plan = sweep_form.cleaned_data['plan']
+    plans = list(sweep_form.cleaned_data['plans'])
+    start_date = sweep_form.cleaned_data['start_date']
+    end_date = sweep_form.cleaned_data['end_date']
+    billing_day = sweep_form.cleaned_data['billing_day'] or 1
+    if start_date > end_date:
+        start_date, end_date = end_date, start_date
+    parameter_label = dict(sweep_form.fields['x_parameter'].choices)
+    x_parameter = sweep_form.cleaned_data['x_parameter']
+    x = np.sort(np.linspace(sweep_form.cleaned_data['x_from'],
+                            sweep_form.cleaned_data['x_to'],
+                            sweep_form.cleaned_data['x_steps']))
+    y_parameter = sweep_form.cleaned_data['y_parameter']
+    if y_parameter:
+        y = np.sort(np.linspace(sweep_form.cleaned_data['y_from'],
+                                sweep_form.cleaned_data['y_to'],
+                                sweep_form.cleaned_data['y_steps']))
+        parameters = {x_parameter: x[:, np.newaxis], y_parameter: y[np.newaxis, :]}
+    else:
+        parameters = {x_parameter: x}
+
+    tariffs = plan_versions(plans, sweep_form.cleaned_data['follow_versions'],
+                            billing_day)
+    context_start = CompiledTariff([plan], billing_day).context_start(start_date)
+    time_slot, value = load_usage(meter, context_start, end_date)
+    try:
+        prices, aggregates = plan_aggregates(plan, time_slot, value, start_date,
+                                             end_date, billing_day)
+        # Shape (x_steps,) or (x_steps, y_steps)
+        cost = np.round(sweep_cost(plan, prices, aggregates, **parameters)) / 100
+        if tariffs:
+            ledger_cost, cumulative_cost = daily_cost_table(meter, tariffs, start_date,
+                                                            end_date)
+            other_cost = np.round(period_cost(
+                ledger_cost, cumulative_cost, [0], [ledger_cost.shape[0] - 1])[0]) / 100
+        else:
+            other_cost = np.empty(0)
+    except MissingPriceError as e:
+        return view_sweep(req, failed_reason=str(e))
+
+    plan_label = []
+    for tariff in tariffs:
+        if tariff.versioned:
+            plan_label.append(f"{tariff.plan.company} {tariff.plan.family.name}")
+        else:
+            plan_label.append(str(tariff.plan))
+    x_label = [f"{v:.4g}" for v in x.tolist()]
+    tab = pyecharts.charts.Tab(page_title="New Zealand Electricity")
+
+    if not y_parameter:
+        line = pyecharts.charts.Line(init_opts=pyecharts.options.InitOpts(width="100%"))
+        line.add_xaxis(x_label)
+        line.add_yaxis(str(plan), cost.tolist(), is_symbol_show=False,
+                       label_opts=pyecharts.options.LabelOpts(is_show=False))
+        for label, c in zip(plan_label, other_cost.tolist()):
+            line.add_yaxis(label, [c] * x.shape[0], is_symbol_show=False,
+                           label_opts=pyecharts.options.LabelOpts(is_show=False))
+        line.set_global_opts(
+            title_opts=pyecharts.options.TitleOpts(
+                title=f"Electricity fee from {start_date} to {end_date}",
+            ),
+            xaxis_opts=pyecharts.options.AxisOpts(
+                type_="category", name=parameter_label[x_parameter],
+                name_location="middle", name_gap=30,
+            ),
+            yaxis_opts=pyecharts.options.AxisOpts(name="Electricity fee (NZD)"),
+            legend_opts=pyecharts.options.LegendOpts(pos_top="30px"),
+            tooltip_opts=pyecharts.options.TooltipOpts(trigger="axis"),
+        )
+        tab.add(line, "Sweep")
+        points = break_even(x, cost, other_cost)
+        break_even_table = pyecharts.components.Table()
+        break_even_table.add(
+            ["Plan", "Electricity fee (NZD)", parameter_label[x_parameter]],
+            [[label, c, "Not in range" if np.isnan(p) else round(p, 4)]
+             for label, c, p in zip(plan_label, other_cost.tolist(), points.tolist())],
+        )
+        tab.add(break_even_table, "Break-even")
+    else:
+        y_label = [f"{v:.4g}" for v in y.tolist()]
+        # Compare with the cheapest of the other plans, or show the fee itself.
+        baseline = other_cost.min() if other_cost.shape[0] else 0.0
+        difference = np.round(cost - baseline, 2)
+        heatmap = pyecharts.charts.HeatMap(
+            init_opts=pyecharts.options.InitOpts(width="100%", height="700px"))
+        heatmap.add_xaxis(x_label)
+        heatmap.add_yaxis(
+            "Electricity fee (NZD)", y_label,
+            [[i, j, d] for i, row in enumerate(difference.tolist())
+             for j, d in enumerate(row)],
+            label_opts=pyecharts.options.LabelOpts(is_show=False),
+        )
+        heatmap.set_global_opts(
+            title_opts=pyecharts.options.TitleOpts(
+                title="Electricity fee minus the cheapest other plan (NZD)"
+                if other_cost.shape[0] else "Electricity fee (NZD)",
+            ),
+            xaxis_opts=pyecharts.options.AxisOpts(
+                type_="category", name=parameter_label[x_parameter],
+                name_location="middle", name_gap=30,
+            ),
+            yaxis_opts=pyecharts.options.AxisOpts(
+                type_="category", name=parameter_label[y_parameter]),
+            visualmap_opts=pyecharts.options.VisualMapOpts(
+                min_=float(difference.min()), max_=float(difference.max()),
+                orient="horizontal", pos_left="center",
+            ),
+            legend_opts=pyecharts.options.LegendOpts(is_show=False),
+        )
+        tab.add(heatmap, "Sweep")
+        if other_cost.shape[0]:
+            points = break_even(y, cost, baseline)
+            boundary = pyecharts.charts.Line(
+                init_opts=pyecharts.options.InitOpts(width="100%"))
+            boundary.add_xaxis(x_label)
+            boundary.add_yaxis(
+                parameter_label[y_parameter],
+                [None if np.isnan(p) else round(p, 4) for p in points.tolist()],
+                is_symbol_show=False, is_connect_nones=False,
+                label_opts=pyecharts.options.LabelOpts(is_show=False),
+            )
+            boundary.set_global_opts(
+                title_opts=pyecharts.options.TitleOpts(
+                    title=f"Where {plan} costs the same as the cheapest other plan",
+                ),
+                xaxis_opts=pyecharts.options.AxisOpts(
+                    type_="category", name=parameter_label[x_parameter],
+                    name_location="middle", name_gap=30,
+                ),
+                yaxis_opts=pyecharts.options.AxisOpts(
+                    name=parameter_label[y_parameter]),
+                legend_opts=pyecharts.options.LegendOpts(is_show=False),
+                tooltip_opts=pyecharts.options.TooltipOpts(trigger="axis"),
+            )
+            tab.add(boundary, "Break-even")
     htm = tab.render_embed()
 
     tree = BeautifulSoup(htm, 'html.parser')
     tab_tag = tree.find('div', class_='tab')
     back_tag = tree.new_tag(
-        'a', href='/compare',
+        'a', href='/sweep',
         style='font-family: "Helvetica Neue", Helvetica, Arial, sans-serif; '
               'padding: 10px; '
     )